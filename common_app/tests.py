@@ -1,3 +1,711 @@
-from django.test import TestCase
+import asyncio
+import importlib.util
+import io
+import os
+import subprocess
+import sys
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from celery.signals import worker_process_init
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.handlers.wsgi import WSGIHandler, WSGIRequest
+from django.db import connection
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from opentelemetry.sdk.metrics import MeterProvider
+from opentelemetry.sdk.metrics.export import ExponentialHistogramDataPoint, InMemoryMetricReader
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor, SpanExporter, SpanExportResult
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+from opentelemetry.sdk.trace.sampling import ALWAYS_ON, Decision, StaticSampler
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+from myproject.asgi_handler import ASGIHandler
+from myproject.db.pool import ConnectionPool, PoolTimeout
+from myproject.db.routers import ReplicaRouter, read_only, read_only_scope, request_routing_scope
+from myproject.exporters import InstrumentedBatchSpanProcessor
+from myproject.health_check import ReadinessChecker
+from myproject.metrics import build_views, http_method
+from myproject.middleware import QueryProfilerMiddleware, ReplicaRoutingMiddleware, sql_fingerprint
+from myproject.sampling import (
+    RateLimitingSampler, RouteRuleSampler, TailSamplingSpanProcessor, build_sampler
+)
+from users.exceptions import UserNotFoundException
+
+
+def _run_python(script, **env):
+    """
+    在新的Python进程中加载项目并执行script，返回最后一行输出
+    OpenTelemetry的全局provider每个进程只能设置一次，相关测试在子进程中进行
+    """
+    output = subprocess.run(
+        [sys.executable, '-c', 'import django; django.setup()\n' + script],
+        cwd=settings.BASE_DIR, env={**os.environ, **env},
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, universal_newlines=True
+    ).stdout
+    return output.strip().splitlines()[-1]
+
+
+class OpenTelemetryInitTests(SimpleTestCase):
+    """
+    OpenTelemetry按进程延迟初始化
+    """
+
+    def test_disabled_flag_leaves_sdk_unconfigured(self):
+        # manage.py 的所有命令都会加载项目（包括Celery应用）
+        script = (
+            'from django.core.handlers.wsgi import WSGIHandler; WSGIHandler()\n'
+            'import sys\n'
+            'from opentelemetry import trace\n'
+            'from myproject.opentelemetry_config import configure_opentelemetry\n'
+            'sdk = [name for name in sys.modules if name.startswith("opentelemetry.sdk")]\n'
+            'print(configure_opentelemetry(), type(trace.get_tracer_provider()).__name__, sdk)'
+        )
+        self.assertEqual(_run_python(script, OPENTELEMETRY_ENABLED='false'), 'False ProxyTracerProvider []')
+
+    def test_preforking_parent_configures_only_after_fork(self):
+        script = (
+            'from myproject.opentelemetry_config import configure_opentelemetry\n'
+            'print(configure_opentelemetry(), configure_opentelemetry(after_fork=True), '
+            'configure_opentelemetry(after_fork=True))'
+        )
+        self.assertEqual(
+            _run_python(script, OPENTELEMETRY_ENABLED='true', OTEL_INIT_AFTER_FORK='true'),
+            'False True False'
+        )
+
+    def test_celery_child_process_configures_after_fork(self):
+        with mock.patch('myproject.opentelemetry_config.configure_opentelemetry') as configure:
+            worker_process_init.send(sender=None)
+        configure.assert_called_once_with(after_fork=True)
+
+
+class SamplingTests(SimpleTestCase):
+    """
+    按路径、限流和尾部采样规则决定保留哪些trace
+    """
+
+    def _sample(self, sampler, path='/api/users/', kind=SpanKind.SERVER):
+        return sampler.should_sample(None, 0x1234, 'GET', kind=kind, attributes={'url.path': path}).decision
+
+    def test_route_rule_drops_matching_server_spans(self):
+        sampler = RouteRuleSampler(ALWAYS_ON, ['/api/common/health/'])
+        self.assertEqual(self._sample(sampler, '/api/common/health/?full=1'), Decision.DROP)
+        self.assertEqual(self._sample(sampler, '/api/users/'), Decision.RECORD_AND_SAMPLE)
+        self.assertEqual(self._sample(sampler, '/api/common/health/', kind=SpanKind.CLIENT), Decision.RECORD_AND_SAMPLE)
+
+    def test_rate_limit_drops_traces_over_budget(self):
+        with mock.patch('myproject.sampling.time.monotonic', return_value=100.0):
+            sampler = RateLimitingSampler(ALWAYS_ON, 2)
+            decisions = [self._sample(sampler) for _ in range(3)]
+        self.assertEqual(decisions, [Decision.RECORD_AND_SAMPLE, Decision.RECORD_AND_SAMPLE, Decision.DROP])
+        with mock.patch('myproject.sampling.time.monotonic', return_value=100.5):
+            self.assertEqual(self._sample(sampler), Decision.RECORD_AND_SAMPLE)
+
+    def test_build_sampler_drops_probe_routes_by_default(self):
+        with mock.patch.dict(os.environ, {'OTEL_TRACES_SAMPLER_RATIO': '1'}):
+            sampler = build_sampler()
+        self.assertEqual(self._sample(sampler, '/api/common/live/'), Decision.DROP)
+        self.assertEqual(self._sample(sampler, '/api/users/'), Decision.RECORD_AND_SAMPLE)
+
+    def _tail_tracer(self, **kwargs):
+        exporter = InMemorySpanExporter()
+        provider = TracerProvider()
+        provider.add_span_processor(TailSamplingSpanProcessor(SimpleSpanProcessor(exporter), **kwargs))
+        return provider.get_tracer(__name__), exporter
+
+    def test_tail_sampling_keeps_error_and_slow_traces(self):
+        tracer, exporter = self._tail_tracer(slow_threshold_ms=500, baseline_ratio=0.0)
+        with tracer.start_as_current_span('fast'):
+            pass
+        with tracer.start_as_current_span('error'):
+            with tracer.start_as_current_span('child') as child:
+                child.set_status(Status(StatusCode.ERROR))
+        root = tracer.start_span('slow', start_time=0)
+        root.end(end_time=600 * 10 ** 6)
+        self.assertEqual(sorted(span.name for span in exporter.get_finished_spans()), ['child', 'error', 'slow'])
+
+    def test_spans_ending_after_root_follow_its_decision(self):
+        tracer, exporter = self._tail_tracer(slow_threshold_ms=500, baseline_ratio=0.0)
+        with tracer.start_as_current_span('root'):
+            late = tracer.start_span('late')
+        late.end()
+        self.assertEqual(exporter.get_finished_spans(), ())
+
+
+class BlockingSpanExporter(SpanExporter):
+    """
+    导出时阻塞到 release 被设置，用于让span停留在导出队列中
+    """
+
+    def __init__(self, result=SpanExportResult.SUCCESS):
+        self.release = threading.Event()
+        self.exported = []
+        self.result = result
+
+    def export(self, spans):
+        self.release.wait(5)
+        self.exported.extend(spans)
+        return self.result
+
+
+class InstrumentedBatchSpanProcessorTests(SimpleTestCase):
+    """
+    导出队列深度和丢弃span数由处理器自己统计
+    """
+
+    def _processor(self, exporter, max_queue_size=2):
+        processor = InstrumentedBatchSpanProcessor(
+            exporter, 'test', max_queue_size=max_queue_size, max_export_batch_size=max_queue_size,
+            schedule_delay_millis=60000
+        )
+        self.addCleanup(processor.shutdown)
+        self.addCleanup(exporter.release.set)
+        provider = TracerProvider()
+        provider.add_span_processor(processor)
+        return processor, provider.get_tracer(__name__)
+
+    def test_spans_over_queue_size_are_dropped_and_counted(self):
+        exporter = BlockingSpanExporter()
+        processor, tracer = self._processor(exporter)
+        with mock.patch('myproject.exporters._dropped_spans') as dropped:
+            for name in ('a', 'b', 'c'):
+                tracer.start_span(name).end()
+        self.assertEqual(processor.queue_depth(), 2)
+        dropped.add.assert_called_once_with(1, {'exporter': 'test'})
+
+        exporter.release.set()
+        processor.force_flush()
+        self.assertEqual(processor.queue_depth(), 0)
+        self.assertEqual(sorted(span.name for span in exporter.exported), ['a', 'b'])
+
+    def test_failed_exports_leave_the_queue(self):
+        exporter = BlockingSpanExporter(result=SpanExportResult.FAILURE)
+        exporter.release.set()
+        processor, tracer = self._processor(exporter, max_queue_size=4)
+        tracer.start_span('a').end()
+        processor.force_flush()
+        self.assertEqual(processor.queue_depth(), 0)
+
+    def test_record_only_spans_are_not_counted(self):
+        exporter = BlockingSpanExporter()
+        processor = InstrumentedBatchSpanProcessor(exporter, 'test', max_queue_size=2, max_export_batch_size=2)
+        self.addCleanup(processor.shutdown)
+        self.addCleanup(exporter.release.set)
+        provider = TracerProvider(sampler=StaticSampler(Decision.RECORD_ONLY))
+        provider.add_span_processor(processor)
+        provider.get_tracer(__name__).start_span('recorded').end()
+        self.assertEqual(processor.queue_depth(), 0)
+
+
+class MetricsTests(TestCase):
+    """
+    请求指标按URL模式聚合，直方图使用指数分桶
+    """
+
+    def test_request_metrics_use_the_route_pattern(self):
+        with mock.patch('myproject.metrics.http_server_duration') as duration, \
+                mock.patch('myproject.metrics.db_queries_per_request') as queries:
+            self.client.get('/api/users/12345/')
+        self.assertEqual(duration.record.call_args[0][1], {
+            'http.route': 'api/users/<int:pk>/',
+            'http.request.method': 'GET',
+            'http.response.status_code': 404,
+        })
+        self.assertEqual(queries.record.call_args[0][1], {'http.route': 'api/users/<int:pk>/'})
+
+    def test_unknown_methods_share_one_value(self):
+        self.assertEqual(http_method('GET'), 'GET')
+        self.assertEqual(http_method('PURGE'), '_OTHER')
+
+    def test_views_use_exponential_buckets_and_drop_instrumentation_metrics(self):
+        reader = InMemoryMetricReader()
+        provider = MeterProvider(metric_readers=[reader], views=build_views())
+        self.addCleanup(provider.shutdown)
+        provider.get_meter('myproject').create_histogram('demo').record(0.25)
+        provider.get_meter('opentelemetry.instrumentation.django').create_histogram('http.server.duration').record(1)
+
+        metrics = [
+            metric
+            for resource_metrics in reader.get_metrics_data().resource_metrics
+            for scope_metrics in resource_metrics.scope_metrics
+            for metric in scope_metrics.metrics
+        ]
+        self.assertEqual([metric.name for metric in metrics], ['demo'])
+        self.assertIsInstance(metrics[0].data.data_points[0], ExponentialHistogramDataPoint)
+
+
+@override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_SAMPLE_RATIO=1.0, QUERY_PROFILER_N_PLUS_ONE_THRESHOLD=3)
+class QueryProfilerTests(TestCase):
+    """
+    抽样请求的SQL分析
+    """
+
+    def _profile(self, view):
+        span = mock.Mock()
+        with mock.patch('myproject.middleware.trace.get_current_span', return_value=span):
+            response = QueryProfilerMiddleware(view)(RequestFactory().get('/'))
+        return response, span.set_attributes.call_args[0][0]
+
+    def test_fingerprint_ignores_literals_and_in_lists(self):
+        self.assertEqual(
+            sql_fingerprint("SELECT * FROM t WHERE id = 1 AND name = 'a' AND x IN (%s, %s)"),
+            sql_fingerprint("SELECT *  FROM t WHERE id = 22 AND name = 'b''c' AND x IN (%s)")
+        )
+        self.assertNotEqual(sql_fingerprint('SELECT a FROM t'), sql_fingerprint('SELECT b FROM t'))
+
+    def test_n_plus_one_and_duplicates_are_reported(self):
+        users = [User.objects.create_user(username=f'user{index}') for index in range(3)]
+
+        def view(request):
+            for user in users:
+                User.objects.get(pk=user.pk)
+            User.objects.get(pk=users[0].pk)
+            return HttpResponse()
+
+        response, attributes = self._profile(view)
+        self.assertEqual(attributes['db.query_count'], 4)
+        self.assertEqual(attributes['db.duplicate_query_count'], 1)
+        self.assertEqual(len(attributes['db.n_plus_one_fingerprints']), 1)
+        self.assertIn('auth_user', attributes['db.n_plus_one_statements'][0])
+        self.assertIn('desc="4 queries"', response['Server-Timing'])
+
+    @override_settings(QUERY_PROFILER_SAMPLE_RATIO=0.0)
+    def test_unsampled_requests_are_untouched(self):
+        response = QueryProfilerMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+
+    def ping(self):
+        if not self.alive:
+            raise OSError('server has gone away')
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    """
+    进程内连接池：名额、等待超时、pre_ping和空闲回收
+    """
+
+    def _pool(self, **kwargs):
+        created = []
+
+        def connect():
+            created.append(FakeConnection())
+            return created[-1]
+
+        pool = ConnectionPool(connect, ping=FakeConnection.ping, **kwargs)
+        return pool, created
+
+    def test_returned_connections_are_reused(self):
+        pool, created = self._pool(max_size=2)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(len(created), 1)
+
+    def test_checkout_waits_for_a_free_slot_and_times_out(self):
+        pool, _ = self._pool(max_size=1, timeout=0.05)
+        first = pool.checkout()
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+
+        threading.Timer(0.02, pool.checkin, args=(first,)).start()
+        pool.timeout = 5
+        self.assertIs(pool.checkout(), first)
+
+    def test_dead_connections_are_replaced_on_checkout(self):
+        pool, created = self._pool(max_size=1)
+        first = pool.checkout()
+        pool.checkin(first)
+        first.alive = False
+        second = pool.checkout()
+        self.assertIsNot(second, first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats()['size'], 1)
+
+    def test_connections_that_fail_to_reset_are_discarded(self):
+        pool, _ = self._pool(max_size=1)
+        pool._reset = mock.Mock(side_effect=OSError)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertTrue(first.closed)
+        self.assertEqual(pool.stats(), {'size': 0, 'idle': 0, 'max_size': 1})
+
+    def test_idle_connections_expire_down_to_min_size(self):
+        pool, _ = self._pool(min_size=1, max_size=3, idle_timeout=0)
+        connections = [pool.checkout() for _ in range(3)]
+        for conn in connections:
+            pool.checkin(conn)
+        time.sleep(0.01)
+        pool.checkout()
+        self.assertEqual([conn.closed for conn in connections], [True, True, False])
+
+    def test_expired_connections_are_closed_outside_the_lock(self):
+        pool, _ = self._pool(max_size=1, idle_timeout=0)
+        first = pool.checkout()
+        pool.checkin(first)
+        first.close = mock.Mock(side_effect=lambda: self.assertFalse(pool._condition._is_owned()))
+        time.sleep(0.01)
+        self.assertIsNot(pool.checkout(), first)
+        first.close.assert_called_once_with()
+
+    def test_idle_connections_are_refilled_to_min_size(self):
+        pool, created = self._pool(min_size=2, max_size=3)
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertEqual(pool.stats(), {'size': 2, 'idle': 2, 'max_size': 3})
+
+        # 失效的连接被丢弃后补足空闲连接
+        connections = [pool.checkout(), pool.checkout()]
+        connections[0].alive = False
+        pool.discard(connections[0])
+        self.assertEqual(pool.stats(), {'size': 3, 'idle': 2, 'max_size': 3})
+        self.assertEqual(len(created), 4)
+
+
+@unittest.skipUnless(connection.vendor == 'mysql', '需要MySQL数据库（CI中使用MySQL服务容器）')
+class MySQLBackendTests(SimpleTestCase):
+    """
+    自定义MySQL后端在真实MySQL上的连接池、健康检查和fork后的行为
+    """
+    databases = {'default'}
+
+    def _wrapper(self, alias, **overrides):
+        from myproject.db.mysql.base import DatabaseWrapper
+        settings_dict = {**connection.settings_dict, **overrides}
+        wrapper = DatabaseWrapper(settings_dict, alias=alias)
+        self.addCleanup(wrapper.close)
+        return wrapper
+
+    @staticmethod
+    def _connection_id(wrapper):
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT CONNECTION_ID()')
+            return cursor.fetchone()[0]
+
+    def test_connections_are_returned_to_the_pool(self):
+        from myproject.db.mysql.base import _get_pool
+        wrapper = self._wrapper('pool_checkout', POOL={'MAX_SIZE': 2}, CONN_MAX_AGE=0)
+        connection_id = self._connection_id(wrapper)
+        wrapper.close()
+        self.assertEqual(_get_pool('pool_checkout', {}, None).stats()['idle'], 1)
+        self.assertEqual(self._connection_id(wrapper), connection_id)
+
+    def test_uncommitted_transactions_are_rolled_back_on_return(self):
+        wrapper = self._wrapper('pool_reset', POOL={'MAX_SIZE': 1}, CONN_MAX_AGE=0)
+        with wrapper.cursor() as cursor:
+            # 临时表属于会话，重新取出同一个连接后仍然存在
+            cursor.execute('CREATE TEMPORARY TABLE pool_reset (id INT) ENGINE=InnoDB')
+        wrapper.set_autocommit(False)
+        with wrapper.cursor() as cursor:
+            cursor.execute('INSERT INTO pool_reset VALUES (1)')
+        wrapper.close()
+        with wrapper.cursor() as cursor:
+            cursor.execute('SELECT COUNT(*) FROM pool_reset')
+            self.assertEqual(cursor.fetchone()[0], 0)
+
+    def test_health_check_reconnects_after_the_server_drops_the_connection(self):
+        wrapper = self._wrapper('health_check', POOL=None, CONN_MAX_AGE=None, CONN_HEALTH_CHECKS=True)
+        killed = self._connection_id(wrapper)
+        with connection.cursor() as cursor:
+            cursor.execute(f'KILL {killed}')
+
+        # 请求开始时重置检查状态，下一次使用前发现连接已断开并重连
+        wrapper.close_if_unusable_or_obsolete()
+        self.assertNotEqual(self._connection_id(wrapper), killed)
+
+    def test_forked_child_uses_its_own_pool(self):
+        wrapper = self._wrapper('pool_fork', POOL={'MAX_SIZE': 2}, CONN_MAX_AGE=0)
+        parent_id = self._connection_id(wrapper)
+        wrapper.close()
+
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                child = type(wrapper)(dict(wrapper.settings_dict), alias='pool_fork')
+                child_id = self._connection_id(child)
+                child.close()
+                os.write(write_fd, str(child_id).encode())
+                status = 0
+            finally:
+                os._exit(status)
+
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            child_id = int(f.read() or 0)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertNotIn(child_id, (0, parent_id))
+        # 子进程没有关闭父进程池中的连接，父进程仍可复用
+        self.assertEqual(self._connection_id(wrapper), parent_id)
+
+
+@override_settings(DATABASE_REPLICA_WEIGHTS={'replica1': 1, 'replica2': 3})
+class ReplicaRouterTests(TestCase):
+    """
+    读写分离：只读服务调用读取副本，写入后读取主库
+    """
+
+    def setUp(self):
+        self.router = ReplicaRouter()
+
+    def test_only_read_only_calls_use_replicas(self):
+        self.assertIsNone(self.router.db_for_read(User))
+        with mock.patch('myproject.db.routers.random.choices', return_value=['replica2']) as choices:
+            self.assertEqual(read_only(lambda: self.router.db_for_read(User))(), 'replica2')
+        self.assertEqual(choices.call_args[1]['weights'], [1, 3])
+
+    def test_reads_after_a_write_use_the_primary(self):
+        with request_routing_scope() as state, read_only_scope():
+            self.assertIn(self.router.db_for_read(User), ('replica1', 'replica2'))
+            self.assertEqual(self.router.db_for_write(User), 'default')
+            self.assertIsNone(self.router.db_for_read(User))
+        self.assertEqual(state, {'pinned': True, 'wrote': True})
+
+    def test_pinned_requests_read_the_primary(self):
+        with request_routing_scope(pinned=True), read_only_scope():
+            self.assertIsNone(self.router.db_for_read(User))
+
+    def test_migrations_run_only_on_the_primary(self):
+        self.assertTrue(self.router.allow_migrate('default', 'users'))
+        self.assertFalse(self.router.allow_migrate('replica1', 'users'))
+
+    def test_write_sets_the_sticky_cookie(self):
+        def view(request):
+            User.objects.create_user(username='writer')
+            return HttpResponse()
+
+        response = ReplicaRoutingMiddleware(view)(RequestFactory().post('/'))
+        self.assertEqual(response.cookies['db_primary']['max-age'], 5)
+
+        response = ReplicaRoutingMiddleware(lambda request: HttpResponse())(RequestFactory().get('/'))
+        self.assertNotIn('db_primary', response.cookies)
+
+    def test_sticky_cookie_pins_the_request(self):
+        seen = []
+
+        def view(request):
+            with read_only_scope():
+                seen.append(self.router.db_for_read(User))
+            return HttpResponse()
+
+        request = RequestFactory().get('/')
+        request.COOKIES['db_primary'] = '1'
+        ReplicaRoutingMiddleware(view)(request)
+        self.assertEqual(seen, [None])
+
+    @override_settings(DATABASE_REPLICA_WEIGHTS={})
+    def test_middleware_is_unused_without_replicas(self):
+        with self.assertRaises(MiddlewareNotUsed):
+            ReplicaRoutingMiddleware(lambda request: HttpResponse())
+
+
+class ASGIHandlerTests(SimpleTestCase):
+    """
+    ASGI入口：异步视图、Host校验和交给WSGI应用的请求
+    """
+
+    def _call(self, wsgi_application, path, method='GET', host='testserver', body_chunks=(b'',), headers=()):
+        handler = ASGIHandler(wsgi_application, 'myproject.async_urls')
+        scope = {
+            'type': 'http', 'method': method, 'path': path, 'query_string': b'',
+            'headers': [(b'host', host.encode())] + [(name.encode(), value.encode()) for name, value in headers],
+        }
+        messages = [
+            {'type': 'http.request', 'body': chunk, 'more_body': index < len(body_chunks) - 1}
+            for index, chunk in enumerate(body_chunks)
+        ]
+        sent = []
+
+        async def receive():
+            return messages.pop(0)
+
+        async def send(message):
+            sent.append(message)
+
+        self.messages = messages
+        asyncio.run(handler(scope, receive, send))
+        return sent
+
+    def test_async_view_runs_on_the_event_loop(self):
+        threads = []
+
+        def get_user(user_id):
+            threads.append(threading.current_thread().name)
+            raise UserNotFoundException(f"用户ID {user_id} 不存在")
+
+        wsgi_application = mock.Mock()
+        with mock.patch('users.views.services.get_user_with_profile', side_effect=get_user):
+            sent = self._call(wsgi_application, '/api/users/7/')
+        wsgi_application.assert_not_called()
+        self.assertEqual(sent[0]['status'], 404)
+        self.assertTrue(threads[0].startswith('asgi-sync'))
+
+    @override_settings(ALLOWED_HOSTS=['api.example.com'])
+    def test_disallowed_host_is_rejected_by_django(self):
+        with mock.patch('users.views.services.get_user_with_profile') as get_user:
+            sent = self._call(WSGIHandler(), '/api/users/7/', host='evil.example.com')
+        get_user.assert_not_called()
+        self.assertEqual(sent[0]['status'], 400)
+
+    def test_fallback_streams_request_and_response_bodies(self):
+        seen = {}
+
+        def wsgi_application(environ, start_response):
+            seen['thread'] = threading.current_thread().name
+            seen['first'] = environ['wsgi.input'].read(4)
+            # 只接收了应用读取到的部分，其余的请求体仍在等待
+            seen['pending'] = len(self.messages)
+            seen['rest'] = environ['wsgi.input'].read()
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+            return iter([b'first', b'', b'second'])
+
+        sent = self._call(wsgi_application, '/upload/', method='POST', body_chunks=(b'abcd', b'efgh', b'ij'))
+        self.assertTrue(seen['thread'].startswith('asgi-wsgi'))
+        self.assertEqual((seen['first'], seen['pending'], seen['rest']), (b'abcd', 2, b'efghij'))
+        self.assertEqual(sent[0]['status'], 200)
+        self.assertEqual(
+            [(message['body'], message.get('more_body', False)) for message in sent[1:]],
+            [(b'first', True), (b'second', True), (b'', False)]
+        )
+
+    def test_fallback_request_body_is_parsed_by_django(self):
+        body = b'name=%E5%BC%A0%E4%B8%89&city=shanghai'
+
+        def wsgi_application(environ, start_response):
+            seen.update(WSGIRequest(environ).POST.dict())
+            start_response('204 No Content', [])
+            return []
+
+        seen = {}
+        self._call(wsgi_application, '/form/', method='POST', body_chunks=(body[:10], body[10:]), headers=[
+            ('content-type', 'application/x-www-form-urlencoded'), ('content-length', str(len(body))),
+        ])
+        self.assertEqual(seen, {'name': '张三', 'city': 'shanghai'})
+
+
+def _load_gunicorn_conf(**env):
+    # 配置文件会修改环境变量，在隔离的环境中加载
+    path = os.path.join(settings.BASE_DIR, 'gunicorn.conf.py')
+    spec = importlib.util.spec_from_file_location('gunicorn_conf', path)
+    module = importlib.util.module_from_spec(spec)
+    with mock.patch.dict(os.environ, env):
+        spec.loader.exec_module(module)
+    return module
+
+
+class GunicornConfigTests(SimpleTestCase):
+    """
+    gunicorn的worker数按容器可用的CPU数计算
+    """
+
+    def _cpu_count(self, files, affinity=8):
+        conf = _load_gunicorn_conf()
+
+        def fake_open(path, *args, **kwargs):
+            if path not in files:
+                raise FileNotFoundError(path)
+            return io.StringIO(files[path])
+
+        with mock.patch.object(conf.os, 'sched_getaffinity', return_value=set(range(affinity))), \
+                mock.patch.object(conf, 'open', fake_open, create=True):
+            return conf._cpu_count()
+
+    def test_cgroup_quota_limits_the_cpu_count(self):
+        self.assertEqual(self._cpu_count({'/sys/fs/cgroup/cpu.max': '150000 100000\n'}), 2)
+        self.assertEqual(self._cpu_count({
+            '/sys/fs/cgroup/cpu/cpu.cfs_quota_us': '50000\n',
+            '/sys/fs/cgroup/cpu/cpu.cfs_period_us': '100000\n',
+        }), 1)
+
+    def test_unlimited_quota_uses_cpu_affinity(self):
+        self.assertEqual(self._cpu_count({'/sys/fs/cgroup/cpu.max': 'max 100000\n'}, affinity=4), 4)
+        self.assertEqual(self._cpu_count({}, affinity=3), 3)
+
+    def test_asgi_mode_uses_uvicorn_workers(self):
+        conf = _load_gunicorn_conf(GUNICORN_ASGI='true', GUNICORN_WORKERS='3')
+        self.assertEqual((conf.worker_class, conf.wsgi_app, conf.workers),
+                         ('uvicorn.workers.UvicornWorker', 'myproject.asgi:application', 3))
+        conf = _load_gunicorn_conf(GUNICORN_ASGI='false')
+        self.assertEqual(conf.worker_class, 'gthread')
+
+
+@override_settings(HEALTH_PROBE_TIMEOUT=0.1, HEALTH_READY_CACHE_SECONDS=60)
+class ReadinessCheckerTests(SimpleTestCase):
+    """
+    就绪检查：并发、超时、结果缓存以及卡住的检查不重复提交
+    """
+
+    def setUp(self):
+        self.release = threading.Event()
+        self.addCleanup(self.release.set)
+
+    def test_failing_and_slow_probes_make_the_service_unready(self):
+        def broken():
+            raise ConnectionError('refused')
+
+        checker = ReadinessChecker({'ok': lambda: None, 'broken': broken, 'slow': lambda: self.release.wait(5)})
+        started = time.monotonic()
+        result = checker.check()
+        self.assertLess(time.monotonic() - started, 1)
+        self.assertEqual(result['status'], 'unready')
+        self.assertEqual({name: check['status'] for name, check in result['checks'].items()},
+                         {'ok': 'ok', 'broken': 'error', 'slow': 'timeout'})
+        self.assertEqual(result['checks']['broken']['error'], 'ConnectionError: refused')
+
+    def test_results_are_cached(self):
+        probe = mock.Mock()
+        checker = ReadinessChecker({'probe': probe})
+        self.assertEqual(checker.check()['status'], 'ready')
+        checker.check()
+        self.assertEqual(probe.call_count, 1)
+
+        with override_settings(HEALTH_READY_CACHE_SECONDS=0):
+            checker._expires_at = 0
+            checker.check()
+        self.assertEqual(probe.call_count, 2)
+
+    @override_settings(HEALTH_READY_CACHE_SECONDS=0)
+    def test_hung_probe_is_not_resubmitted(self):
+        calls = []
+
+        def hung():
+            calls.append(1)
+            self.release.wait(5)
+
+        checker = ReadinessChecker({'hung': hung})
+        for _ in range(3):
+            self.assertEqual(checker.check()['checks']['hung']['status'], 'timeout')
+        self.assertEqual(len(calls), 1)
+
+        # 检查结束后恢复正常提交
+        self.release.set()
+        checker._pending['hung'].result(5)
+        self.assertEqual(checker.check()['status'], 'ready')
+        self.assertEqual(len(calls), 2)
+
+    def test_ready_endpoint_returns_503_when_unready(self):
+        unready = {'status': 'unready', 'checks': {'database': {'status': 'timeout', 'duration_ms': 100.0}}}
+        with mock.patch('common_app.views.readiness_checker.check', return_value=unready) as check:
+            self.assertEqual(self.client.get('/api/common/live/').status_code, 200)
+            self.assertEqual(self.client.get('/api/common/health/').json(), {'status': 'alive'})
+            check.assert_not_called()
+            response = self.client.get('/api/common/ready/')
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json(), unready)
@@ -2,5 +2,7 @@ from django.urls import path
 from . import views
 
 urlpatterns = [
+    path('live/', views.live, name='live'),
+    path('ready/', views.ready, name='ready'),
     path('health/', views.health_check, name='health-check'),
-]
\ No newline at end of file
+]
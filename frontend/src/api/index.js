@@ -108,4 +108,52 @@ export const userAPI = {
       'Content-Type': 'multipart/form-data',
     }
   }),
+  
+  // 申请头像直传地址
+  createAvatarUpload: (id, file) => api.post(`/users/${id}/avatar/uploads/`, {
+    content_type: file.type,
+    size: file.size,
+  }),
+  
+  // 头像直传完成后通知后端
+  completeAvatarUpload: (id, data) => api.post(`/users/${id}/avatar/uploads/complete/`, data),
+  
+  // 放弃未完成的分片直传，释放已上传的分片
+  abortAvatarUpload: (id, data) => api.post(`/users/${id}/avatar/uploads/abort/`, data),
+  
+  // 将头像文件直接上传到对象存储，完成后关联到用户简介
+  uploadAvatarDirect: async (id, file) => {
+    const { data: upload } = await userAPI.createAvatarUpload(id, file);
+    
+    if (upload.method === 'post') {
+      const formData = new FormData();
+      Object.keys(upload.fields).forEach(key => formData.append(key, upload.fields[key]));
+      formData.append('file', file);
+      await axios.post(upload.url, formData);
+      return userAPI.completeAvatarUpload(id, { key: upload.key });
+    }
+    
+    // 分片并行上传，ETag由对象存储在响应头中返回（bucket的CORS需要暴露ETag）
+    let parts;
+    try {
+      parts = await Promise.all(upload.parts.map(async part => {
+        const start = (part.part_number - 1) * upload.part_size;
+        const response = await axios.put(part.url, file.slice(start, start + upload.part_size));
+        if (!response.headers.etag) {
+          throw new Error('对象存储未返回分片的ETag');
+        }
+        return { part_number: part.part_number, etag: response.headers.etag };
+      }));
+    } catch (error) {
+      // 调用方会改为通过后端上传，先放弃这次分片上传；合并失败时由后端放弃
+      await userAPI.abortAvatarUpload(id, { key: upload.key, upload_id: upload.upload_id })
+        .catch(abortError => console.error('放弃分片上传失败:', abortError));
+      throw error;
+    }
+    return userAPI.completeAvatarUpload(id, {
+      key: upload.key,
+      upload_id: upload.upload_id,
+      parts,
+    });
+  },
 }
\ No newline at end of file
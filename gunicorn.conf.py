@@ -0,0 +1,93 @@
+"""
+生产环境的gunicorn配置：uv run gunicorn -c gunicorn.conf.py
+
+默认以gthread worker运行WSGI应用；GUNICORN_ASGI=true 时改用uvicorn worker运行ASGI应用（见 myproject/asgi.py）。
+worker数和线程数按容器可用的CPU数计算，均可通过环境变量覆盖。
+"""
+import math
+import os
+
+
+def _cpu_count():
+    """
+    容器可用的CPU数：取CPU亲和性与cgroup配额（cgroup v2 的 cpu.max 或 v1 的 cfs_quota）中较小的值
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except AttributeError:
+        count = os.cpu_count() or 1
+
+    quota_files = (
+        ('/sys/fs/cgroup/cpu.max', None),
+        ('/sys/fs/cgroup/cpu/cpu.cfs_quota_us', '/sys/fs/cgroup/cpu/cpu.cfs_period_us'),
+    )
+    for quota_file, period_file in quota_files:
+        try:
+            with open(quota_file) as f:
+                values = f.read().split()
+            if period_file:
+                with open(period_file) as f:
+                    values.append(f.read().strip())
+        except OSError:
+            continue
+        quota, period = values[0], values[1]
+        if quota not in ('max', '-1') and int(period) > 0:
+            count = min(count, max(1, math.ceil(int(quota) / int(period))))
+        break
+    return count
+
+
+cpu_count = _cpu_count()
+asgi = os.getenv('GUNICORN_ASGI', 'false').lower() == 'true'
+
+bind = os.getenv('GUNICORN_BIND', '0.0.0.0:8000')
+
+if asgi:
+    # 每个worker一个事件循环，阻塞调用在 ASGI_THREAD_POOL_SIZE 个线程中执行
+    wsgi_app = 'myproject.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    workers = int(os.getenv('GUNICORN_WORKERS', cpu_count))
+else:
+    # 请求大多在等待MySQL、Redis和RustFS，每个worker用多个线程并发处理
+    wsgi_app = 'myproject.wsgi:application'
+    worker_class = 'gthread'
+    workers = int(os.getenv('GUNICORN_WORKERS', cpu_count * 2 + 1))
+    threads = int(os.getenv('GUNICORN_THREADS', '4'))
+
+# 在master中导入一次应用，worker通过fork共享已加载的代码，启动更快、占用内存更少
+preload_app = os.getenv('GUNICORN_PRELOAD', 'true').lower() == 'true'
+
+# 处理一定数量的请求后替换worker，抖动避免所有worker同时重启
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', '2000'))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', str(max_requests // 10)))
+
+# 收到SIGTERM后停止接收新连接，最多等待 graceful_timeout 秒让进行中的请求完成
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '30'))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', '5'))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-')
+errorlog = '-'
+
+# 预加载应用（preload_app）时master进程不初始化OpenTelemetry，
+# 由每个worker在fork后各自创建导出线程和到collector的连接
+os.environ.setdefault('OTEL_INIT_AFTER_FORK', 'true')
+
+
+def pre_fork(server, worker):
+    # 预加载时master中可能已经打开了数据库连接，fork前关闭，避免多个进程共用同一个socket
+    if not server.cfg.preload_app:
+        return
+    from django.db import connections
+    connections.close_all()
+
+
+def post_fork(server, worker):
+    from myproject.opentelemetry_config import configure_opentelemetry
+    configure_opentelemetry(after_fork=True)
+
+
+def worker_exit(server, worker):
+    # worker被回收或关闭时导出缓冲中的span和指标
+    from myproject.opentelemetry_config import flush_opentelemetry
+    flush_opentelemetry()
@@ -0,0 +1,4 @@
+# 确保Django启动时加载Celery应用，使web进程发送任务时使用同一套broker和路由配置
+from .celery import app as celery_app
+
+__all__ = ('celery_app',)
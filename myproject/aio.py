@@ -0,0 +1,116 @@
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import close_old_connections, connections
+
+
+# 按名称区分的线程池，记录创建时的进程ID，fork后在子进程中重新创建
+_executors = {}
+_executors_lock = threading.Lock()
+
+# 当前请求的SQL统计，设置后线程池中执行的调用会把SQL数和耗时累加到其中
+query_stats = contextvars.ContextVar('query_stats', default=None)
+
+
+class QueryStats:
+    """
+    一个请求的SQL数和SQL总耗时，可能由线程池中的多个线程同时累加
+    """
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self._lock = threading.Lock()
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - start
+            with self._lock:
+                self.queries += 1
+                self.duration += duration
+
+
+def _get_named_executor(name, max_workers):
+    pid = os.getpid()
+    with _executors_lock:
+        executor, executor_pid = _executors.get(name, (None, None))
+        if executor is None or executor_pid != pid:
+            executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+            _executors[name] = (executor, pid)
+        return executor
+
+
+def get_executor():
+    """
+    异步视图中执行阻塞调用（ORM、boto3、Redis）的有界线程池，每个进程一个
+    线程数由 ASGI_THREAD_POOL_SIZE 配置，数据库连接池和S3连接池的大小不应小于它
+    """
+    return _get_named_executor('asgi-sync', getattr(settings, 'ASGI_THREAD_POOL_SIZE', 32))
+
+
+def get_wsgi_executor():
+    """
+    ASGI服务器中交给WSGI应用的请求使用的线程池，与 get_executor() 分开
+    这类请求从读取请求体到发完响应体（包括流式响应）都占用一个线程，
+    慢客户端或长时间的流式输出不会占满异步视图使用的线程池
+    """
+    return _get_named_executor('asgi-wsgi', getattr(settings, 'ASGI_WSGI_THREAD_POOL_SIZE', 16))
+
+
+def shutdown_executor():
+    """
+    等待本进程所有线程池中的调用完成并关闭线程池
+    """
+    with _executors_lock:
+        executors = list(_executors.values())
+        _executors.clear()
+    for executor, pid in executors:
+        if pid == os.getpid():
+            executor.shutdown(wait=True)
+
+
+def _call(func, args, kwargs):
+    stats = query_stats.get()
+    try:
+        with ExitStack() as stack:
+            if stats is not None:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(stats.execute_wrapper))
+            return func(*args, **kwargs)
+    finally:
+        # 相当于WSGI请求结束时的处理：关闭失效或超过CONN_MAX_AGE的连接，开启连接池时把连接归还到池中
+        close_old_connections()
+
+
+async def run_sync(func, *args, **kwargs):
+    """
+    在线程池中执行阻塞调用并等待结果，不阻塞事件循环
+    调用在当前contextvars的副本中执行，读写分离的路由状态和追踪上下文随之传递
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(
+        get_executor(), functools.partial(context.run, _call, func, args, kwargs)
+    )
+
+
+class AsyncView:
+    """
+    异步视图基类：按请求方法分发到同名的协程方法
+    handles() 返回False的请求（例如未实现的方法）交给同步的Django视图处理
+    """
+
+    def handles(self, request):
+        return hasattr(self, request.method.lower())
+
+    async def __call__(self, request, **kwargs):
+        return await getattr(self, request.method.lower())(request, **kwargs)
@@ -3,14 +3,29 @@ ASGI config for myproject project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
-For more information on this file, see
-https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
+Django 2.2没有内置ASGI支持（django.core.asgi 从3.0开始提供），
+这里由 myproject.asgi_handler.ASGIHandler 在事件循环中处理 myproject.async_urls 中的异步视图，
+其余请求交给WSGI应用在线程池中处理。使用ASGI服务器运行，例如：
+
+    uvicorn myproject.asgi:application --host 0.0.0.0 --port 8000
 """
 
 import os
 
-from django.core.asgi import get_asgi_application
+from django.core.wsgi import get_wsgi_application
+
+# 配置OpenTelemetry
+try:
+    from .opentelemetry_config import configure_opentelemetry
+    configure_opentelemetry()
+except Exception as e:
+    print(f"Failed to configure OpenTelemetry: {e}")
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
 
-application = get_asgi_application()
+# get_wsgi_application() 会先完成 django.setup()，之后才能导入用到模型的模块
+wsgi_application = get_wsgi_application()
+
+from .asgi_handler import ASGIHandler  # noqa: E402
+
+application = ASGIHandler(wsgi_application, 'myproject.async_urls')
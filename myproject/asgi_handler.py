@@ -0,0 +1,228 @@
+import asyncio
+import contextvars
+import io
+import sys
+import time
+
+from django.conf import settings
+from django.core.exceptions import DisallowedHost
+from django.core.handlers.wsgi import WSGIRequest
+from django.urls import Resolver404, get_resolver
+from opentelemetry import propagate, trace
+from opentelemetry.trace import SpanKind, Status, StatusCode
+from users.exceptions import GlobalExceptionHandler
+
+from .aio import QueryStats, get_wsgi_executor, query_stats, shutdown_executor
+from .db.routers import request_routing_scope
+from .metrics import http_method, record_request_metrics, request_route
+from .middleware import set_sticky_primary_cookie, sticky_primary_requested
+
+
+tracer = trace.get_tracer(__name__)
+
+
+def _wsgi_environ(scope, stream):
+    """
+    由ASGI的HTTP连接信息构造WSGI environ，stream作为wsgi.input
+    """
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': stream,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    server = scope.get('server') or ('localhost', 80)
+    environ['SERVER_NAME'], environ['SERVER_PORT'] = server[0], str(server[1] or 80)
+    if scope.get('client'):
+        environ['REMOTE_ADDR'], environ['REMOTE_PORT'] = scope['client'][0], str(scope['client'][1])
+
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-length':
+            key = 'CONTENT_LENGTH'
+        elif name == 'content-type':
+            key = 'CONTENT_TYPE'
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        if key in environ:
+            value = environ[key] + ('; ' if key == 'HTTP_COOKIE' else ',') + value
+        environ[key] = value
+    return environ
+
+
+class ReceiveStream(io.RawIOBase):
+    """
+    WSGI应用线程中使用的wsgi.input：读取时才从事件循环的receive()取下一块请求体，
+    请求体（如头像上传）不会先整体读入内存
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._buffer = b''
+        self._eof = False
+
+    def readable(self):
+        return True
+
+    def _fill(self):
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self._eof = True
+            return
+        self._buffer += message.get('body', b'')
+        if not message.get('more_body'):
+            self._eof = True
+
+    def read(self, size=-1):
+        while not self._eof and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        if size is None or size < 0:
+            size = len(self._buffer)
+        data, self._buffer = self._buffer[:size], self._buffer[size:]
+        return data
+
+    def readline(self, size=-1):
+        while not self._eof and b'\n' not in self._buffer and (size is None or size < 0 or len(self._buffer) < size):
+            self._fill()
+        end = self._buffer.find(b'\n') + 1 or len(self._buffer)
+        if size is not None and size >= 0:
+            end = min(end, size)
+        data, self._buffer = self._buffer[:end], self._buffer[end:]
+        return data
+
+
+async def _send_response(send, response):
+    headers = [(name.encode('latin-1'), value.encode('latin-1')) for name, value in response.items()]
+    for cookie in response.cookies.values():
+        headers.append((b'set-cookie', cookie.output(header='').strip().encode('latin-1')))
+    await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+    await send({'type': 'http.response.body', 'body': response.content})
+
+
+class ASGIHandler:
+    """
+    Django 2.2没有ASGI支持，这里实现一个最小的ASGI应用：
+
+    - 匹配 async_urlconf 中的路由且视图接受该请求时，在事件循环中执行异步视图，
+      视图中的ORM、boto3等阻塞调用通过 run_sync 放到有界线程池中执行，互不依赖的调用可以并发
+    - 其余请求（包括管理界面和写接口）交给Django的WSGI应用，在单独的线程池（ASGI_WSGI_THREAD_POOL_SIZE）中处理，
+      请求体在应用读取时才逐块接收，响应体逐块发回事件循环，流式响应不会被缓冲
+
+    注意：异步视图不经过 settings.MIDDLEWARE 中的中间件（Security、Session、CSRF、认证等都不会执行），
+    只适合公开的只读GET接口。请求对象是Django的WSGIRequest，ALLOWED_HOSTS 校验与同步视图相同，
+    Host不合法的请求交给WSGI应用返回400；追踪、请求指标和读写分离的主库cookie在这里处理，
+    指标和cookie与中间件使用相同的函数，业务异常转换为与同步接口相同的响应
+    """
+
+    def __init__(self, wsgi_application, async_urlconf):
+        self.wsgi_application = wsgi_application
+        self.resolver = get_resolver(async_urlconf)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+        if scope['type'] != 'http':
+            raise ValueError(f"不支持的ASGI连接类型: {scope['type']}")
+
+        try:
+            match = self.resolver.resolve(scope['path'])
+        except Resolver404:
+            match = None
+        if match is not None:
+            # 异步视图不读取请求体
+            request = WSGIRequest(_wsgi_environ(scope, io.BytesIO()))
+            request.resolver_match = match
+            if match.func.handles(request) and self._host_allowed(request):
+                return await self._call_async_view(request, match, send)
+
+        await self._call_wsgi(scope, receive, send)
+
+    @staticmethod
+    def _host_allowed(request):
+        try:
+            request.get_host()
+        except DisallowedHost:
+            return False
+        return True
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                # 等待线程池中的调用完成，不阻塞事件循环
+                await asyncio.get_running_loop().run_in_executor(None, shutdown_executor)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _call_async_view(self, request, match, send):
+        route = request_route(request)
+        method = http_method(request.method)
+        stats = QueryStats()
+        stats_token = query_stats.set(stats)
+        start = time.perf_counter()
+        status_code = 500
+        try:
+            with tracer.start_as_current_span(
+                f'{method} {route}',
+                context=propagate.extract(request.headers),
+                kind=SpanKind.SERVER,
+                attributes={'http.request.method': method, 'url.path': request.path, 'http.route': route},
+            ) as span:
+                with request_routing_scope(pinned=sticky_primary_requested(request)) as state:
+                    try:
+                        response = await match.func(request, *match.args, **match.kwargs)
+                    except Exception as e:
+                        span.record_exception(e)
+                        response = GlobalExceptionHandler.handle_exception(e)
+                if state['wrote'] and getattr(settings, 'DATABASE_REPLICA_WEIGHTS', None):
+                    set_sticky_primary_cookie(response)
+                status_code = response.status_code
+                span.set_attribute('http.response.status_code', status_code)
+                if status_code >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+            await _send_response(send, response)
+        finally:
+            query_stats.reset(stats_token)
+            record_request_metrics(request, status_code, time.perf_counter() - start, stats.queries, stats.duration)
+
+    async def _call_wsgi(self, scope, receive, send):
+        loop = asyncio.get_running_loop()
+        environ = _wsgi_environ(scope, ReceiveStream(receive, loop))
+        context = contextvars.copy_context()
+        await loop.run_in_executor(get_wsgi_executor(), context.run, self._run_wsgi, environ, loop, send)
+
+    def _run_wsgi(self, environ, loop, send):
+        """
+        在线程池中执行WSGI应用，Django在同一线程中处理请求并在response.close()时释放数据库连接
+        """
+        def send_sync(message):
+            asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            # Django生成的Set-Cookie值带有前导空格，ASGI服务器不接受
+            started['headers'] = [(name.encode('latin-1'), value.strip().encode('latin-1')) for name, value in headers]
+
+        iterable = self.wsgi_application(environ, start_response)
+        try:
+            send_sync({'type': 'http.response.start', 'status': started['status'], 'headers': started['headers']})
+            for chunk in iterable:
+                if chunk:
+                    send_sync({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            send_sync({'type': 'http.response.body', 'body': b''})
+        finally:
+            if hasattr(iterable, 'close'):
+                iterable.close()
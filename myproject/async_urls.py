@@ -0,0 +1,9 @@
+"""
+在ASGI服务器中由异步视图处理的路由，路径与 myproject.urls 中对应的同步视图相同
+未匹配的请求以及异步视图不处理的请求由Django的同步视图处理
+"""
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/', include('users.async_urls')),
+]
@@ -0,0 +1,127 @@
+import pickle
+
+import redis
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+class RedisCache(BaseCache):
+    """
+    基于redis-py的Django缓存后端
+    Django 2.2没有内置Redis缓存后端，这里直接复用项目已经依赖的redis客户端，
+    整数以明文保存以支持原子的incr，其他值使用pickle序列化
+    """
+    def __init__(self, server, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self._pool = redis.ConnectionPool.from_url(
+            server,
+            max_connections=options.get('MAX_CONNECTIONS', 50),
+            socket_timeout=options.get('SOCKET_TIMEOUT', 1.0),
+            socket_connect_timeout=options.get('SOCKET_CONNECT_TIMEOUT', 1.0),
+        )
+        self._client = redis.Redis(connection_pool=self._pool)
+
+    def ping(self):
+        """检查Redis是否可用（健康检查使用），复用缓存的连接池"""
+        return self._client.ping()
+
+    def _timeout(self, timeout):
+        # 返回以秒为单位的过期时间，None表示永不过期
+        if timeout is DEFAULT_TIMEOUT:
+            timeout = self.default_timeout
+        return None if timeout is None else int(timeout)
+
+    @staticmethod
+    def _dumps(value):
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _loads(value):
+        try:
+            return int(value)
+        except ValueError:
+            return pickle.loads(value)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self._timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            return False
+        return bool(self._client.set(key, self._dumps(value), ex=timeout, nx=True))
+
+    def get(self, key, default=None, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        value = self._client.get(key)
+        return default if value is None else self._loads(value)
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self._timeout(timeout)
+        if timeout is not None and timeout <= 0:
+            self._client.delete(key)
+            return
+        self._client.set(key, self._dumps(value), ex=timeout)
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        timeout = self._timeout(timeout)
+        if timeout is None:
+            return bool(self._client.persist(key))
+        return bool(self._client.expire(key, timeout))
+
+    def delete(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        self._client.delete(key)
+
+    def get_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return {}
+        made_keys = [self.make_key(key, version=version) for key in keys]
+        for key in made_keys:
+            self.validate_key(key)
+        values = self._client.mget(made_keys)
+        return {key: self._loads(value) for key, value in zip(keys, values) if value is not None}
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._timeout(timeout)
+        pipeline = self._client.pipeline(transaction=False)
+        for key, value in data.items():
+            key = self.make_key(key, version=version)
+            self.validate_key(key)
+            if timeout is not None and timeout <= 0:
+                pipeline.delete(key)
+            else:
+                pipeline.set(key, self._dumps(value), ex=timeout)
+        pipeline.execute()
+        return []
+
+    def delete_many(self, keys, version=None):
+        keys = [self.make_key(key, version=version) for key in keys]
+        if keys:
+            self._client.delete(*keys)
+
+    def has_key(self, key, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return bool(self._client.exists(key))
+
+    def incr(self, key, delta=1, version=None):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        if not self._client.exists(key):
+            raise ValueError("Key '%s' not found" % key)
+        return self._client.incr(key, delta)
+
+    def clear(self):
+        # 只删除带本缓存前缀的键，不影响同一Redis库中的Celery数据
+        keys = list(self._client.scan_iter(match='%s:*' % self.key_prefix, count=1000))
+        if keys:
+            self._client.delete(*keys)
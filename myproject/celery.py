@@ -1,13 +1,9 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
-
-# 配置OpenTelemetry
-try:
-    from .opentelemetry_config import configure_opentelemetry
-    configure_opentelemetry()
-except Exception as e:
-    print(f"Failed to configure OpenTelemetry: {e}")
+from celery.concurrency import get_implementation
+from celery.signals import worker_init, worker_process_init
+from kombu import Queue
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'myproject.settings')
@@ -24,4 +20,41 @@ app = Celery(
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
 # Load task modules from all registered Django app configs.
-app.autodiscover_tasks()
\ No newline at end of file
+app.autodiscover_tasks()
+
+# 任务队列与路由
+# CPU密集的图片处理任务进入独立的images队列，由专门的prefork worker处理，
+# 避免大量头像上传时阻塞默认队列中的轻量任务：
+#   celery -A myproject worker -Q celery -l info
+#   celery -A myproject worker -Q images -l info --prefetch-multiplier=1 --max-memory-per-child=<KiB>
+# prefork池的进程数默认等于CPU核数
+app.conf.task_default_queue = 'celery'
+app.conf.task_queues = (
+    Queue('celery'),
+    Queue('images'),
+)
+app.conf.task_routes = {
+    'users.tasks.generate_avatar_thumbnail': {'queue': 'images'},
+}
+
+
+def _configure_opentelemetry():
+    try:
+        from .opentelemetry_config import configure_opentelemetry
+        configure_opentelemetry(after_fork=True)
+    except Exception as e:
+        print(f"Failed to configure OpenTelemetry: {e}")
+
+
+# 配置OpenTelemetry
+# prefork池在每个子进程启动后配置，导出线程和连接属于子进程自己；
+# solo/threads等不fork的池在worker主进程中配置
+@worker_init.connect
+def configure_opentelemetry_in_worker(sender=None, **kwargs):
+    if 'prefork' not in get_implementation(sender.pool_cls).__module__:
+        _configure_opentelemetry()
+
+
+@worker_process_init.connect
+def configure_opentelemetry_in_child(**kwargs):
+    _configure_opentelemetry()
@@ -0,0 +1,94 @@
+import os
+import threading
+
+from django.db.backends.mysql import base as mysql_base
+
+from ..pool import ConnectionPool
+
+
+# 每个数据库别名一个连接池，按进程区分
+_pools = {}
+_pools_pid = None
+_pools_lock = threading.Lock()
+# fork前父进程的连接池：子进程不能使用也不能关闭其中的连接（关闭会断开父进程的连接），
+# 保留引用避免被垃圾回收时关闭socket
+_inherited_pools = []
+
+
+def _get_pool(alias, options, connect):
+    global _pools, _pools_pid
+    pid = os.getpid()
+    with _pools_lock:
+        if _pools_pid != pid:
+            _inherited_pools.extend(_pools.values())
+            _pools = {}
+            _pools_pid = pid
+        pool = _pools.get(alias)
+        if pool is None:
+            pool = _pools[alias] = ConnectionPool(
+                connect,
+                min_size=options.get('MIN_SIZE', 0),
+                max_size=options.get('MAX_SIZE', 10),
+                idle_timeout=options.get('IDLE_TIMEOUT', 300),
+                timeout=options.get('TIMEOUT', 10),
+                pre_ping=options.get('PRE_PING', True),
+                ping=lambda connection: connection.ping(),
+                reset=_reset_connection,
+            )
+        return pool
+
+
+def _reset_connection(connection):
+    # 归还前回滚未提交的事务，下一个使用者拿到的连接总是干净的
+    if not connection.get_autocommit():
+        connection.rollback()
+
+
+class DatabaseWrapper(mysql_base.DatabaseWrapper):
+    """
+    在Django MySQL后端的基础上增加：
+    - CONN_HEALTH_CHECKS：复用持久连接时，每个请求/任务第一次使用前ping一次，失效则重连
+      （Django 4.1起内置该功能，2.2需要自行实现）
+    - POOL：进程内的连接池，连接在请求结束“关闭”时归还到池中，供其他线程复用
+    """
+    health_check_done = False
+
+    def get_new_connection(self, conn_params):
+        pool_options = self.settings_dict.get('POOL')
+        if not pool_options:
+            return super().get_new_connection(conn_params)
+
+        create = super().get_new_connection
+        pool = _get_pool(self.alias, pool_options, lambda: create(conn_params))
+        return pool.checkout()
+
+    def _close(self):
+        pool_options = self.settings_dict.get('POOL')
+        if not pool_options or self.connection is None:
+            return super()._close()
+
+        pool = _get_pool(self.alias, pool_options, None)
+        with self.wrap_database_errors:
+            if self.errors_occurred and not self.is_usable():
+                pool.discard(self.connection)
+            else:
+                pool.checkin(self.connection)
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def ensure_connection(self):
+        if (self.connection is not None
+                and self.settings_dict.get('CONN_HEALTH_CHECKS')
+                and not self.health_check_done
+                and not self.in_atomic_block):
+            if not self.is_usable():
+                self.close()
+            self.health_check_done = True
+        super().ensure_connection()
+
+    def close_if_unusable_or_obsolete(self):
+        # 在请求开始/结束（以及Celery任务前后）调用，之后第一次使用连接时重新检查
+        super().close_if_unusable_or_obsolete()
+        self.health_check_done = False
@@ -0,0 +1,145 @@
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """等待空闲连接超时"""
+
+
+class ConnectionPool:
+    """
+    进程内的数据库连接池
+
+    - 连接按需创建，总数不超过max_size；连接池已满时等待其他线程归还，超过timeout秒抛出PoolTimeout
+    - 空闲超过idle_timeout秒的连接被关闭，但至少保留min_size个空闲连接；
+      归还或丢弃连接后空闲连接不足min_size个时补足（在名额允许的范围内，首次归还连接时预热）
+    - 取出连接时先ping（pre_ping），失效的连接直接丢弃并重新获取
+    - 后进先出地复用空闲连接，让不常用的连接自然空闲超时
+    """
+    def __init__(self, connect, min_size=0, max_size=10, idle_timeout=300, timeout=10,
+                 pre_ping=True, ping=None, reset=None):
+        self._connect = connect
+        self._ping = ping
+        self._reset = reset
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.pre_ping = pre_ping
+        self._idle = deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+    def checkout(self):
+        """
+        取出一个可用的连接
+        """
+        deadline = time.monotonic() + self.timeout
+        while True:
+            connection = self._acquire(deadline)
+            if connection is None:
+                # 获得了新建连接的名额
+                try:
+                    return self._connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+            if not self.pre_ping or self._is_usable(connection):
+                return connection
+            self.discard(connection)
+
+    def checkin(self, connection):
+        """
+        归还连接，重置状态失败的连接直接丢弃
+        """
+        try:
+            if self._reset is not None:
+                self._reset(connection)
+        except Exception:
+            self.discard(connection)
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+        self._refill()
+
+    def discard(self, connection):
+        """
+        关闭并丢弃连接，释放其名额
+        """
+        self._close(connection)
+        self._release_slot()
+        self._refill()
+
+    def stats(self):
+        with self._condition:
+            return {'size': self._size, 'idle': len(self._idle), 'max_size': self.max_size}
+
+    def _acquire(self, deadline):
+        # 返回空闲连接；返回None表示可以新建连接
+        expired = []
+        try:
+            with self._condition:
+                while True:
+                    expired.extend(self._pop_idle_expired())
+                    if self._idle:
+                        return self._idle.pop()[0]
+                    if self._size < self.max_size:
+                        self._size += 1
+                        return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        raise PoolTimeout(f"等待数据库连接超时（连接池上限 {self.max_size}）")
+                    self._condition.wait(remaining)
+        finally:
+            # 关闭连接可能阻塞在网络上，不占用锁
+            for connection in expired:
+                self._close(connection)
+
+    def _pop_idle_expired(self):
+        # 在锁内取出空闲超时的连接，由调用方在锁外关闭；最早归还的连接在队首
+        now = time.monotonic()
+        expired = []
+        while (len(self._idle) > self.min_size
+               and now - self._idle[0][1] > self.idle_timeout):
+            expired.append(self._idle.popleft()[0])
+            self._size -= 1
+        return expired
+
+    def _refill(self):
+        # 在锁外新建连接，把空闲连接补足到min_size个
+        while True:
+            with self._condition:
+                if len(self._idle) >= self.min_size or self._size >= self.max_size:
+                    return
+                self._size += 1
+            try:
+                connection = self._connect()
+            except Exception as e:
+                self._release_slot()
+                print(f"补充连接池空闲连接失败: {str(e)}")
+                return
+            with self._condition:
+                self._idle.append((connection, time.monotonic()))
+                self._condition.notify()
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _is_usable(self, connection):
+        try:
+            if self._ping is not None:
+                self._ping(connection)
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
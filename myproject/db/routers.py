@@ -0,0 +1,91 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+
+
+# 当前请求的路由状态：{'pinned': 是否固定使用主库, 'wrote': 本次请求是否写过数据库}
+_request_state = ContextVar('db_request_state', default=None)
+# 是否处于只读的服务调用中
+_read_only = ContextVar('db_read_only', default=False)
+
+
+@contextmanager
+def read_only_scope():
+    token = _read_only.set(True)
+    try:
+        yield
+    finally:
+        _read_only.reset(token)
+
+
+def read_only(func):
+    """
+    标记只读的服务函数：其中的查询可以发送到只读副本
+    未标记的代码（包括写操作前后的读取、Celery任务）始终使用主库
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        with read_only_scope():
+            return func(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def request_routing_scope(pinned=False, state=None):
+    """
+    为一次请求建立路由状态，pinned为True时本次请求的读取都使用主库
+    传入state时恢复之前建立的状态，用于中间件返回后仍在生成内容的流式响应
+    """
+    if state is None:
+        state = {'pinned': pinned, 'wrote': False}
+    token = _request_state.set(state)
+    try:
+        yield state
+    finally:
+        _request_state.reset(token)
+
+
+class ReplicaRouter:
+    """
+    读写分离的数据库路由
+
+    - 写操作总是使用主库（default）
+    - 只读服务调用中的读取按 DATABASE_REPLICA_WEIGHTS 的权重随机选择一个只读副本
+    - 本次请求写过数据库，或者客户端最近写过（由中间件通过cookie判断）时，读取使用主库，保证读到自己的写入
+    """
+
+    def db_for_read(self, model, **hints):
+        if not _read_only.get():
+            return None
+        state = _request_state.get()
+        if state is not None and state['pinned']:
+            return None
+        return self._choose_replica()
+
+    def db_for_write(self, model, **hints):
+        state = _request_state.get()
+        if state is not None:
+            state['pinned'] = True
+            state['wrote'] = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # 副本与主库的数据相同，不同库上取出的对象之间可以建立关联
+        databases = {'default', *getattr(settings, 'DATABASE_REPLICA_WEIGHTS', {})}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # 只在主库上执行迁移，副本通过复制同步
+        return db == 'default'
+
+    @staticmethod
+    def _choose_replica():
+        weights = getattr(settings, 'DATABASE_REPLICA_WEIGHTS', {})
+        if not weights:
+            return None
+        return random.choices(list(weights), weights=list(weights.values()))[0]
@@ -0,0 +1,241 @@
+import os
+import threading
+import weakref
+
+from opentelemetry import metrics
+from opentelemetry.metrics import Observation
+from opentelemetry.sdk.trace import SynchronousMultiSpanProcessor
+from opentelemetry.sdk.trace.export import BatchSpanProcessor, SpanExporter, SpanExportResult
+
+
+_meter = metrics.get_meter(__name__)
+
+_dropped_spans = _meter.create_counter(
+    'otel.span_processor.dropped_spans',
+    unit='{span}',
+    description='队列已满而被丢弃的span数'
+)
+_exported_spans = _meter.create_counter(
+    'otel.span_exporter.spans',
+    unit='{span}',
+    description='导出的span数，按导出结果区分'
+)
+
+# 仍在使用的批量处理器，用于上报队列深度
+_processors = weakref.WeakSet()
+
+
+def _observe_queue_depth(options):
+    return [
+        Observation(processor.queue_depth(), {'exporter': processor.exporter_name})
+        for processor in _processors
+    ]
+
+
+_meter.create_observable_gauge(
+    'otel.span_processor.queue_depth',
+    callbacks=[_observe_queue_depth],
+    unit='{span}',
+    description='等待导出的span数'
+)
+
+
+class InstrumentedBatchSpanProcessor(BatchSpanProcessor):
+    """
+    记录队列深度与丢弃span数的BatchSpanProcessor
+
+    SDK没有公开队列长度，队列已满时还会静默丢弃最早的span。这里自己统计交给SDK的span数
+    和交给exporter的span数，两者之差即为等待导出的span数；达到 max_queue_size 时
+    由本类丢弃新的span并计数，不会触发SDK的静默丢弃，也不依赖SDK的内部属性
+    """
+    def __init__(self, span_exporter, exporter_name, max_queue_size=2048, **kwargs):
+        self.exporter_name = exporter_name
+        self.max_queue_size = max_queue_size
+        self._attributes = {'exporter': exporter_name}
+        self._counter_lock = threading.Lock()
+        self._reset_counters()
+        self._accepting = True
+        super().__init__(
+            _CountingSpanExporter(span_exporter, exporter_name, self._on_exported),
+            max_queue_size=max_queue_size,
+            **kwargs
+        )
+        _processors.add(self)
+
+    def on_end(self, span):
+        if not span.context.trace_flags.sampled:
+            return
+        with self._counter_lock:
+            if not self._accepting:
+                return
+            if self._counter_pid != os.getpid():
+                # fork后SDK会清空子进程中的队列，计数随之重置
+                self._reset_counters()
+            accepted = self._enqueued - self._exported < self.max_queue_size
+            if accepted:
+                self._enqueued += 1
+        if not accepted:
+            _dropped_spans.add(1, self._attributes)
+            return
+        super().on_end(span)
+
+    def queue_depth(self):
+        with self._counter_lock:
+            return self._enqueued - self._exported
+
+    def shutdown(self):
+        with self._counter_lock:
+            self._accepting = False
+        super().shutdown()
+
+    def _on_exported(self, count):
+        with self._counter_lock:
+            self._exported += count
+
+    def _reset_counters(self):
+        self._enqueued = 0
+        self._exported = 0
+        self._counter_pid = os.getpid()
+
+
+class _CountingSpanExporter(SpanExporter):
+    """
+    统计导出成功/失败的span数，每次导出后通知处理器
+    """
+    def __init__(self, exporter, exporter_name, on_exported):
+        self._exporter = exporter
+        self._exporter_name = exporter_name
+        self._on_exported = on_exported
+
+    def export(self, spans):
+        result = SpanExportResult.FAILURE
+        try:
+            result = self._exporter.export(spans)
+            return result
+        finally:
+            self._on_exported(len(spans))
+            _exported_spans.add(len(spans), {
+                'exporter': self._exporter_name,
+                'result': 'success' if result == SpanExportResult.SUCCESS else 'failure',
+            })
+
+    def shutdown(self):
+        self._exporter.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._exporter.force_flush(timeout_millis)
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _otlp_exporter(signal, endpoint):
+    """
+    按 OTEL_EXPORTER_OTLP_PROTOCOL 创建traces或metrics的OTLP exporter（grpc 或 http/protobuf）
+    exporter模块只在需要时导入，其中gRPC的导入开销较大
+    """
+    protocol = os.getenv('OTEL_EXPORTER_OTLP_PROTOCOL', 'grpc')
+    gzip = os.getenv('OTEL_EXPORTER_OTLP_COMPRESSION', 'none').lower() == 'gzip'
+    timeout = _env_int('OTEL_EXPORTER_OTLP_TIMEOUT', 10)
+
+    if protocol == 'grpc':
+        from grpc import Compression
+        if signal == 'traces':
+            from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter as Exporter
+        else:
+            from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter as Exporter
+        return Exporter(
+            endpoint=endpoint,
+            # 在生产环境中应使用TLS
+            insecure=os.getenv('OTEL_EXPORTER_OTLP_INSECURE', 'true').lower() == 'true',
+            timeout=timeout,
+            compression=Compression.Gzip if gzip else Compression.NoCompression,
+        )
+
+    if protocol == 'http/protobuf':
+        from opentelemetry.exporter.otlp.proto.http import Compression
+        if signal == 'traces':
+            from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter as Exporter
+        else:
+            from opentelemetry.exporter.otlp.proto.http.metric_exporter import OTLPMetricExporter as Exporter
+        # OTLP/HTTP的接口路径为 /v1/traces 或 /v1/metrics
+        path = f'/v1/{signal}'
+        if not endpoint.rstrip('/').endswith(path):
+            endpoint = endpoint.rstrip('/') + path
+        return Exporter(
+            endpoint=endpoint,
+            timeout=timeout,
+            compression=Compression.Gzip if gzip else Compression.NoCompression,
+        )
+
+    raise ValueError(f"不支持的OTLP协议: {protocol}")
+
+
+def _endpoints(name):
+    return [endpoint.strip() for endpoint in os.getenv(name, '').split(',') if endpoint.strip()]
+
+
+def _span_exporters():
+    """
+    返回 [(名称, exporter)]
+    OTEL_EXPORTER_OTLP_ENDPOINT 可以是逗号分隔的多个地址，每个地址一个exporter；
+    没有配置地址时使用控制台输出
+    """
+    exporters = [
+        (f'otlp:{endpoint}', _otlp_exporter('traces', endpoint))
+        for endpoint in _endpoints('OTEL_EXPORTER_OTLP_ENDPOINT')
+    ]
+
+    if not exporters or os.getenv('OTEL_TRACES_CONSOLE_EXPORTER', 'false').lower() == 'true':
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+        exporters.append(('console', ConsoleSpanExporter()))
+    return exporters
+
+
+def build_span_processor():
+    """
+    为每个exporter创建独立的批量处理器，一个后端变慢不会拖累其他后端
+    队列与批次大小等参数由 OTEL_BSP_* 环境变量配置
+    """
+    processors = [
+        InstrumentedBatchSpanProcessor(
+            exporter,
+            name,
+            max_queue_size=_env_int('OTEL_BSP_MAX_QUEUE_SIZE', 2048),
+            schedule_delay_millis=_env_int('OTEL_BSP_SCHEDULE_DELAY', 5000),
+            max_export_batch_size=_env_int('OTEL_BSP_MAX_EXPORT_BATCH_SIZE', 512),
+            export_timeout_millis=_env_int('OTEL_BSP_EXPORT_TIMEOUT', 30000),
+        )
+        for name, exporter in _span_exporters()
+    ]
+    if len(processors) == 1:
+        return processors[0]
+
+    multi_processor = SynchronousMultiSpanProcessor()
+    for processor in processors:
+        multi_processor.add_span_processor(processor)
+    return multi_processor
+
+
+def build_metric_readers():
+    """
+    为每个指标接收地址创建定期导出的reader
+    地址取 OTEL_EXPORTER_OTLP_METRICS_ENDPOINT，未配置时与traces使用相同的地址；
+    OTEL_METRICS_EXPORTER=none 时不导出指标（例如Jaeger只接收traces）
+    """
+    if os.getenv('OTEL_METRICS_EXPORTER', 'otlp').lower() == 'none':
+        return []
+
+    from opentelemetry.sdk.metrics.export import PeriodicExportingMetricReader
+
+    endpoints = _endpoints('OTEL_EXPORTER_OTLP_METRICS_ENDPOINT') or _endpoints('OTEL_EXPORTER_OTLP_ENDPOINT')
+    return [
+        PeriodicExportingMetricReader(
+            _otlp_exporter('metrics', endpoint),
+            export_interval_millis=_env_int('OTEL_METRIC_EXPORT_INTERVAL', 60000),
+            export_timeout_millis=_env_int('OTEL_METRIC_EXPORT_TIMEOUT', 30000),
+        )
+        for endpoint in endpoints
+    ]
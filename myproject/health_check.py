@@ -0,0 +1,118 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import close_old_connections, connection
+
+
+def check_database():
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+    finally:
+        # 与请求结束时相同：保留可用的持久连接，开启连接池时归还到池中
+        close_old_connections()
+
+
+def check_redis():
+    cache = caches['default']
+    ping = getattr(cache, 'ping', None)
+    if ping is not None:
+        ping()
+    else:
+        cache.get('health:probe')
+
+
+def check_rustfs():
+    from users.storage import get_rustfs_client
+    get_rustfs_client().head_bucket(Bucket=getattr(settings, 'RUSTFS_BUCKET_NAME', 'user-avatars'))
+
+
+PROBES = {
+    'database': check_database,
+    'redis': check_redis,
+    'rustfs': check_rustfs,
+}
+
+
+class ReadinessChecker:
+    """
+    依赖服务的就绪检查
+
+    - 各项检查在一个小线程池中并发执行，每项最多等待 HEALTH_PROBE_TIMEOUT 秒；
+      检查使用应用自身的数据库连接、缓存连接池和共享的S3客户端，不额外建立连接
+    - 结果在进程内缓存 HEALTH_READY_CACHE_SECONDS 秒，期间的请求直接返回缓存结果；
+      同一时间只有一个请求执行检查，其他请求等待其结果
+    - 上一次超时的检查仍未结束时不会重复提交，直接视为超时，避免卡住的检查占满线程
+    """
+
+    def __init__(self, probes):
+        self.probes = probes
+        self._lock = threading.Lock()
+        self._result = None
+        self._expires_at = 0.0
+        self._pending = {}
+        self._executor = None
+        self._executor_pid = None
+
+    def check(self):
+        ttl = getattr(settings, 'HEALTH_READY_CACHE_SECONDS', 2.0)
+        with self._lock:
+            now = time.monotonic()
+            if self._result is None or now >= self._expires_at:
+                self._result = self._run_probes()
+                self._expires_at = time.monotonic() + ttl
+            return self._result
+
+    def _run_probes(self):
+        timeout = getattr(settings, 'HEALTH_PROBE_TIMEOUT', 1.0)
+        executor = self._get_executor()
+        started = time.monotonic()
+        futures = {}
+        for name, probe in self.probes.items():
+            future = self._pending.get(name)
+            if future is None or future.done():
+                future = executor.submit(self._timed, probe)
+            futures[name] = future
+        wait(futures.values(), timeout=timeout)
+
+        checks = {}
+        for name, future in futures.items():
+            if not future.done():
+                self._pending[name] = future
+                checks[name] = {'status': 'timeout', 'duration_ms': round((time.monotonic() - started) * 1000, 1)}
+                continue
+            self._pending.pop(name, None)
+            error, duration = future.result()
+            checks[name] = {'status': 'ok' if error is None else 'error', 'duration_ms': round(duration * 1000, 1)}
+            if error is not None:
+                checks[name]['error'] = error
+        return {
+            'status': 'ready' if all(check['status'] == 'ok' for check in checks.values()) else 'unready',
+            'checks': checks,
+        }
+
+    @staticmethod
+    def _timed(probe):
+        start = time.perf_counter()
+        try:
+            probe()
+            error = None
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+        return error, time.perf_counter() - start
+
+    def _get_executor(self):
+        # fork后线程池不可用，按进程重新创建
+        pid = os.getpid()
+        if self._executor is None or self._executor_pid != pid:
+            self._executor = ThreadPoolExecutor(max_workers=len(self.probes) * 2, thread_name_prefix='health-probe')
+            self._executor_pid = pid
+            self._pending = {}
+        return self._executor
+
+
+readiness_checker = ReadinessChecker(PROBES)
@@ -0,0 +1,91 @@
+from opentelemetry import metrics
+
+
+# 应用自身的指标，MeterProvider未配置时这些instrument不做任何事
+meter = metrics.get_meter('myproject')
+
+http_server_duration = meter.create_histogram(
+    'http.server.request.duration',
+    unit='s',
+    description='HTTP请求处理耗时，按路由区分'
+)
+db_queries_per_request = meter.create_histogram(
+    'db.client.queries_per_request',
+    unit='{query}',
+    description='每个HTTP请求执行的SQL数'
+)
+db_duration_per_request = meter.create_histogram(
+    'db.client.duration_per_request',
+    unit='s',
+    description='每个HTTP请求的SQL执行总耗时'
+)
+celery_task_duration = meter.create_histogram(
+    'celery.task.duration',
+    unit='s',
+    description='Celery任务执行耗时'
+)
+celery_task_queue_wait = meter.create_histogram(
+    'celery.task.queue_wait',
+    unit='s',
+    description='Celery任务从发布到开始执行的等待时间'
+)
+avatar_render_duration = meter.create_histogram(
+    'avatar.render.duration',
+    unit='s',
+    description='生成全部头像版本的耗时'
+)
+avatar_render_bytes = meter.create_histogram(
+    'avatar.render.bytes',
+    unit='By',
+    description='头像原图及生成的各版本的字节数'
+)
+
+# 只有这些HTTP方法原样作为属性值，其余归为 _OTHER，避免任意方法名产生新的时间序列
+_HTTP_METHODS = frozenset(('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'))
+
+
+def http_method(method):
+    return method if method in _HTTP_METHODS else '_OTHER'
+
+
+def request_route(request):
+    """
+    返回请求匹配的URL模式（如 api/users/<int:user_id>/），未匹配时返回固定值
+    使用URL模式而不是实际路径，保证属性值的个数有上限
+    """
+    match = getattr(request, 'resolver_match', None)
+    route = getattr(match, 'route', None) if match else None
+    return route or 'unmatched'
+
+
+def record_request_metrics(request, status_code, duration, queries, db_duration):
+    """
+    记录一个请求的耗时、SQL数和SQL总耗时，WSGI中间件和ASGI的异步视图共用
+    """
+    route = request_route(request)
+    http_server_duration.record(duration, {
+        'http.route': route,
+        'http.request.method': http_method(request.method),
+        'http.response.status_code': status_code,
+    })
+    db_queries_per_request.record(queries, {'http.route': route})
+    db_duration_per_request.record(db_duration, {'http.route': route})
+
+
+def build_views():
+    """
+    - 应用的直方图使用指数分桶，不需要为每个指标预先设定桶边界，且每个时间序列的桶数有上限
+    - Django/Celery自动埋点自带的指标按实际主机名、端口等区分，时间序列多且与上面的指标重复，直接丢弃
+    """
+    from opentelemetry.sdk.metrics import Histogram
+    from opentelemetry.sdk.metrics.view import DropAggregation, ExponentialBucketHistogramAggregation, View
+
+    return [
+        View(
+            meter_name='myproject',
+            instrument_type=Histogram,
+            aggregation=ExponentialBucketHistogramAggregation(max_size=160)
+        ),
+        View(meter_name='opentelemetry.instrumentation.django', aggregation=DropAggregation()),
+        View(meter_name='opentelemetry.instrumentation.celery', aggregation=DropAggregation()),
+    ]
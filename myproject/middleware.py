@@ -1,6 +1,23 @@
+import hashlib
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
 from django.http import JsonResponse
+from opentelemetry import trace
 from users.exceptions import GlobalExceptionHandler
 
+from .db.routers import request_routing_scope
+from .metrics import record_request_metrics
+
+
+tracer = trace.get_tracer(__name__)
+
 
 class GlobalExceptionMiddleware:
     """
@@ -20,4 +37,235 @@ class GlobalExceptionMiddleware:
         处理视图中未捕获的异常
         """
         # 使用全局异常处理器处理异常
-        return GlobalExceptionHandler.handle_exception(exception)
\ No newline at end of file
+        return GlobalExceptionHandler.handle_exception(exception)
+
+
+@contextmanager
+def execute_wrappers(execute_wrapper):
+    """
+    在当前线程的所有数据库连接上安装同一个execute_wrapper
+    """
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(execute_wrapper))
+        yield
+
+
+class ScopedStreamingContent:
+    """
+    StreamingHttpResponse的内容在中间件返回之后才由WSGI服务器逐块读取，此时中间件建立的
+    SQL统计、SQL分析和读写分离路由都已退出。用本类包装 streaming_content 后，
+    每生成一个数据块都重新进入 scope() 返回的上下文；响应关闭时（内容读完或客户端断开）调用 on_close
+    """
+
+    def __init__(self, content, scope, on_close):
+        self.iterator = iter(content)
+        self.scope = scope
+        self.on_close = on_close
+        self.closed = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        with self.scope():
+            return next(self.iterator)
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        try:
+            if hasattr(self.iterator, 'close'):
+                self.iterator.close()
+        finally:
+            self.on_close()
+
+
+def wrap_streaming_response(response, scope, on_close=lambda: None):
+    response.streaming_content = ScopedStreamingContent(response.streaming_content, scope, on_close)
+
+
+class RequestMetricsMiddleware:
+    """
+    记录每个请求的耗时、SQL数和SQL总耗时
+    按URL模式（而不是实际路径）、请求方法和状态码聚合，指标的时间序列数保持可控
+    流式响应在内容全部发送（或客户端断开）后记录，耗时和SQL包含生成内容的部分
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        stats = {'queries': 0, 'duration': 0.0}
+
+        def execute_wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                stats['queries'] += 1
+                stats['duration'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+
+        def record(status_code):
+            record_request_metrics(
+                request, status_code, time.perf_counter() - start, stats['queries'], stats['duration']
+            )
+
+        try:
+            with execute_wrappers(execute_wrapper):
+                response = self.get_response(request)
+        except BaseException:
+            record(500)
+            raise
+
+        if response.streaming:
+            wrap_streaming_response(
+                response,
+                lambda: execute_wrappers(execute_wrapper),
+                lambda: record(response.status_code),
+            )
+        else:
+            record(response.status_code)
+        return response
+
+
+# 归一化SQL用于计算指纹：字面量与IN列表替换为占位符
+_SQL_LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+\b")
+_SQL_IN_LIST_RE = re.compile(r'\bIN\s*\((?:\s*(?:%s|\?)\s*,?)+\)', re.IGNORECASE)
+
+
+def sql_fingerprint(sql):
+    normalized = _SQL_IN_LIST_RE.sub('IN (?)', _SQL_LITERAL_RE.sub('?', sql))
+    return hashlib.sha1(' '.join(normalized.split()).encode('utf-8')).hexdigest()[:12]
+
+
+class QueryProfilerMiddleware:
+    """
+    按比例抽样的SQL分析中间件（QUERY_PROFILER_ENABLED 开启）
+
+    被抽中的请求记录执行的每条SQL，请求结束后：
+    - 在当前span上记录SQL数、SQL总耗时、重复执行（SQL与参数都相同）的语句指纹，
+      以及同一语句以不同参数执行多次的N+1嫌疑
+    - 在响应中添加 Server-Timing 头，浏览器开发者工具中可以直接看到
+    流式响应的响应头先于内容发送，不添加 Server-Timing，分析结果在内容发送完后记录到子span上
+    未被抽中的请求不做任何额外处理
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'QUERY_PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+        self.sample_ratio = getattr(settings, 'QUERY_PROFILER_SAMPLE_RATIO', 0.01)
+        self.n_plus_one_threshold = getattr(settings, 'QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', 5)
+
+    def __call__(self, request):
+        if random.random() >= self.sample_ratio:
+            return self.get_response(request)
+
+        queries = []
+
+        def execute_wrapper(execute, sql, params, many, context):
+            start = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries.append((sql, params, many, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        with execute_wrappers(execute_wrapper):
+            response = self.get_response(request)
+
+        if response.streaming:
+            # 请求span在流式内容生成之前就已结束，内容发送完后把分析结果记录在它的子span上
+            parent = trace.set_span_in_context(trace.get_current_span())
+            stream_start = time.time_ns()
+
+            def report_stream():
+                span = tracer.start_span('http.response.stream', context=parent, start_time=stream_start)
+                self._report(span, queries)
+                span.end()
+
+            wrap_streaming_response(response, lambda: execute_wrappers(execute_wrapper), report_stream)
+            return response
+
+        total_duration = time.perf_counter() - start
+        db_duration = self._report(trace.get_current_span(), queries)
+        response['Server-Timing'] = ', '.join((
+            f'db;dur={db_duration * 1000:.1f};desc="{len(queries)} queries"',
+            f'app;dur={(total_duration - db_duration) * 1000:.1f}',
+        ))
+        return response
+
+    def _report(self, span, queries):
+        """
+        在span上记录SQL分析结果，返回SQL总耗时
+        """
+        db_duration = sum(duration for _, _, _, duration in queries)
+
+        # 指纹 -> 执行次数；(指纹, 参数) -> 执行次数
+        statements = {}
+        executions = Counter()
+        by_fingerprint = Counter()
+        for sql, params, many, _ in queries:
+            fingerprint = sql_fingerprint(sql)
+            statements.setdefault(fingerprint, sql)
+            by_fingerprint[fingerprint] += 1
+            if not many:
+                executions[(fingerprint, repr(params))] += 1
+
+        duplicates = sorted({fingerprint for (fingerprint, _), count in executions.items() if count > 1})
+        n_plus_one = sorted(
+            fingerprint for fingerprint, count in by_fingerprint.items()
+            if count >= self.n_plus_one_threshold
+        )
+
+        if span.is_recording():
+            span.set_attributes({
+                'db.query_count': len(queries),
+                'db.total_duration_ms': round(db_duration * 1000, 3),
+                'db.duplicate_query_count': sum(count - 1 for count in executions.values() if count > 1),
+                'db.duplicate_fingerprints': duplicates,
+                'db.n_plus_one_fingerprints': n_plus_one,
+                # 只记录SQL模板，参数不会写入trace
+                'db.n_plus_one_statements': [statements[fingerprint][:300] for fingerprint in n_plus_one],
+            })
+        return db_duration
+
+
+class ReplicaRoutingMiddleware:
+    """
+    读写分离时保证客户端读到自己的写入
+    请求中发生写入后，本次请求余下的读取以及该客户端在 REPLICA_STICKY_SECONDS 秒内的请求都使用主库
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'DATABASE_REPLICA_WEIGHTS', None):
+            raise MiddlewareNotUsed()
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with request_routing_scope(pinned=sticky_primary_requested(request)) as state:
+            response = self.get_response(request)
+        if response.streaming:
+            # 流式内容中的查询沿用本次请求的路由状态；响应头已经发出，其中的写入无法再设置cookie
+            wrap_streaming_response(response, lambda: request_routing_scope(state=state))
+        if state['wrote']:
+            set_sticky_primary_cookie(response)
+        return response
+
+
+def sticky_primary_requested(request):
+    """
+    客户端最近写过数据库（带有主库cookie），本次请求的读取应使用主库
+    """
+    return getattr(settings, 'REPLICA_STICKY_COOKIE', 'db_primary') in request.COOKIES
+
+
+def set_sticky_primary_cookie(response):
+    response.set_cookie(
+        getattr(settings, 'REPLICA_STICKY_COOKIE', 'db_primary'), '1',
+        max_age=getattr(settings, 'REPLICA_STICKY_SECONDS', 5), httponly=True, samesite='Lax'
+    )
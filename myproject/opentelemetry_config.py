@@ -1,18 +1,53 @@
 import os
+import threading
+
 from opentelemetry import trace
-from opentelemetry.sdk.trace import TracerProvider
-from opentelemetry.sdk.trace.export import (
-    BatchSpanProcessor,
-    ConsoleSpanExporter,
-)
-from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
-from opentelemetry.sdk.resources import Resource
-from opentelemetry.instrumentation.django import DjangoInstrumentor
-from opentelemetry.instrumentation.celery import CeleryInstrumentor
-
-
-def configure_opentelemetry():
-    """配置OpenTelemetry"""
+
+
+# 已完成配置的进程号，保证每个进程只配置一次
+_configured_pid = None
+_configure_lock = threading.Lock()
+
+
+def opentelemetry_enabled():
+    return os.getenv("OPENTELEMETRY_ENABLED", "True").lower() in ("1", "true", "yes")
+
+
+def configure_opentelemetry(after_fork=False):
+    """
+    配置OpenTelemetry
+
+    - 可以重复调用，同一进程内只配置一次；OPENTELEMETRY_ENABLED 为 False 时不做任何事
+    - 会fork出子进程的父进程（gunicorn预加载应用的master）设置 OTEL_INIT_AFTER_FORK=true，
+      此时只有在fork后的钩子中以 after_fork=True 调用时才真正配置，
+      批量导出的后台线程和到collector的连接都在子进程中创建
+    - SDK、exporter和自动埋点模块在真正配置时才导入，关闭追踪时不承担这部分启动开销
+    """
+    global _configured_pid
+
+    if not opentelemetry_enabled():
+        return False
+    if not after_fork and os.getenv("OTEL_INIT_AFTER_FORK", "false").lower() == "true":
+        return False
+
+    with _configure_lock:
+        if _configured_pid is not None:
+            # 已在本进程配置过；若在父进程中配置过，SDK会在fork后自行重启导出线程，
+            # 全局的provider也不能再次替换
+            return False
+        _configured_pid = os.getpid()
+
+    from opentelemetry import metrics
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.instrumentation.django import DjangoInstrumentor
+    from opentelemetry.instrumentation.celery import CeleryInstrumentor
+
+    from .exporters import build_metric_readers, build_span_processor
+    from .metrics import build_views
+    from .sampling import build_sampler, wrap_span_processor
+
     # 设置资源信息
     resource = Resource.create(
         attributes={
@@ -21,32 +56,46 @@ def configure_opentelemetry():
         }
     )
 
-    # 创建Tracer Provider
-    provider = TracerProvider(resource=resource)
+    # 创建Tracer Provider，采样策略由环境变量配置
+    provider = TracerProvider(resource=resource, sampler=build_sampler())
     trace.set_tracer_provider(provider)
 
-    # 根据环境决定使用哪种exporter
-    if os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
-        # 使用OTLP exporter发送到collector
-        otlp_exporter = OTLPSpanExporter(
-            endpoint=os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT", "http://localhost:4317"),
-            insecure=True,  # 在生产环境中应使用TLS
-        )
-        span_processor = BatchSpanProcessor(otlp_exporter)
-    else:
-        # 开发环境中使用控制台输出
-        console_exporter = ConsoleSpanExporter()
-        span_processor = BatchSpanProcessor(console_exporter)
-
-    provider.add_span_processor(span_processor)
+    # 配置了OTEL_EXPORTER_OTLP_ENDPOINT时发送到collector，否则在控制台输出
+    span_processor = build_span_processor()
+
+    provider.add_span_processor(wrap_span_processor(span_processor))
+
+    # 指标定期聚合后导出
+    metrics.set_meter_provider(
+        MeterProvider(resource=resource, metric_readers=build_metric_readers(), views=build_views())
+    )
 
     # 自动检测和注入Django和Celery的追踪
     DjangoInstrumentor().instrument()
     CeleryInstrumentor().instrument()
 
-    print("OpenTelemetry configured successfully")
+    print(f"OpenTelemetry configured successfully (pid {os.getpid()})")
+    return True
+
+
+def flush_opentelemetry(timeout_millis=5000):
+    """
+    导出本进程缓冲中的span和指标，用于进程退出前（例如gunicorn回收worker时）
+    """
+    if _configured_pid != os.getpid():
+        return
+
+    from opentelemetry import metrics
+
+    for provider in (trace.get_tracer_provider(), metrics.get_meter_provider()):
+        force_flush = getattr(provider, 'force_flush', None)
+        if force_flush is not None:
+            try:
+                force_flush(timeout_millis)
+            except Exception as e:
+                print(f"Failed to flush OpenTelemetry: {e}")
 
 
 def get_tracer(name):
     """获取tracer实例"""
-    return trace.get_tracer(name)
\ No newline at end of file
+    return trace.get_tracer(name)
@@ -0,0 +1,206 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from opentelemetry.sdk.trace import SpanProcessor
+from opentelemetry.sdk.trace.sampling import (
+    ALWAYS_ON,
+    Decision,
+    ParentBased,
+    Sampler,
+    SamplingResult,
+    TraceIdRatioBased,
+)
+from opentelemetry.trace import SpanKind, StatusCode, format_trace_id, get_current_span
+
+
+# 不同语义约定版本下请求路径所在的属性名
+_PATH_ATTRIBUTES = ('url.path', 'http.target')
+
+
+class RouteRuleSampler(Sampler):
+    """
+    按请求路径丢弃整条trace，其余请求交给delegate决定
+    例如健康检查每隔几秒就会被调用一次，没有必要产生trace
+    """
+    def __init__(self, delegate, drop_prefixes):
+        self._delegate = delegate
+        self._drop_prefixes = tuple(drop_prefixes)
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None,
+                      trace_state=None):
+        if self._drop_prefixes and kind == SpanKind.SERVER and attributes:
+            for attribute in _PATH_ATTRIBUTES:
+                path = attributes.get(attribute)
+                if path and path.split('?', 1)[0].startswith(self._drop_prefixes):
+                    return SamplingResult(Decision.DROP, trace_state=_trace_state(parent_context))
+        return self._delegate.should_sample(
+            parent_context, trace_id, name, kind=kind, attributes=attributes, links=links,
+            trace_state=trace_state
+        )
+
+    def get_description(self):
+        return f'RouteRuleSampler{{drop={list(self._drop_prefixes)},{self._delegate.get_description()}}}'
+
+
+class RateLimitingSampler(Sampler):
+    """
+    令牌桶限流：delegate决定采样的trace每秒最多保留max_per_second条，超出的丢弃
+    """
+    def __init__(self, delegate, max_per_second):
+        self._delegate = delegate
+        self._max_per_second = max_per_second
+        self._tokens = max_per_second
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def should_sample(self, parent_context, trace_id, name, kind=None, attributes=None, links=None,
+                      trace_state=None):
+        result = self._delegate.should_sample(
+            parent_context, trace_id, name, kind=kind, attributes=attributes, links=links,
+            trace_state=trace_state
+        )
+        if result.decision != Decision.RECORD_AND_SAMPLE or self._take_token():
+            return result
+        return SamplingResult(Decision.DROP, trace_state=_trace_state(parent_context))
+
+    def _take_token(self):
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self._max_per_second,
+                self._tokens + (now - self._last_refill) * self._max_per_second
+            )
+            self._last_refill = now
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+    def get_description(self):
+        return f'RateLimitingSampler{{{self._max_per_second}/s,{self._delegate.get_description()}}}'
+
+
+def _trace_state(parent_context):
+    return get_current_span(parent_context).get_span_context().trace_state
+
+
+class TailSamplingSpanProcessor(SpanProcessor):
+    """
+    尾部采样：按trace缓存已结束的span，本进程内的根span结束时再决定整条trace是否导出
+
+    包含错误的trace、根span耗时超过阈值的trace总是保留，
+    其余trace按trace_id以baseline_ratio的比例保留。
+    根span结束之后才结束的span沿用该trace已经做出的决定
+    """
+    def __init__(self, delegate, slow_threshold_ms=500, baseline_ratio=0.0, max_traces=10000):
+        self._delegate = delegate
+        self._slow_threshold_ns = int(slow_threshold_ms * 1e6)
+        self._baseline = TraceIdRatioBased(baseline_ratio)
+        self._max_traces = max_traces
+        self._lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._decisions = OrderedDict()
+
+    def on_start(self, span, parent_context=None):
+        self._delegate.on_start(span, parent_context=parent_context)
+
+    def on_end(self, span):
+        trace_id = span.context.trace_id
+        is_local_root = span.parent is None or span.parent.is_remote
+
+        with self._lock:
+            decision = self._decisions.get(trace_id)
+            if decision is None:
+                spans = self._pending.get(trace_id)
+                if spans is None:
+                    spans = self._pending[trace_id] = []
+                    self._evict()
+                spans.append(span)
+                if not is_local_root:
+                    return
+                spans = self._pending.pop(trace_id)
+                decision = self._decide(span, spans)
+                self._decisions[trace_id] = decision
+                while len(self._decisions) > self._max_traces:
+                    self._decisions.popitem(last=False)
+            else:
+                spans = [span]
+
+        if decision:
+            for finished_span in spans:
+                self._delegate.on_end(finished_span)
+
+    def _decide(self, root, spans):
+        if any(finished_span.status.status_code == StatusCode.ERROR for finished_span in spans):
+            return True
+        if root.end_time - root.start_time >= self._slow_threshold_ns:
+            return True
+        return self._baseline.should_sample(None, root.context.trace_id, root.name).decision.is_sampled()
+
+    def _evict(self):
+        # 根span迟迟没有结束（或在其他进程中）的trace超出容量时直接丢弃最早的
+        while len(self._pending) > self._max_traces:
+            trace_id, spans = self._pending.popitem(last=False)
+            print(f"尾部采样缓存已满，丢弃trace {format_trace_id(trace_id)} 的 {len(spans)} 个span")
+
+    def shutdown(self):
+        self._delegate.shutdown()
+
+    def force_flush(self, timeout_millis=30000):
+        return self._delegate.force_flush(timeout_millis)
+
+
+def _env_float(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# 健康检查由负载均衡和容器编排频繁调用，默认不产生trace
+DEFAULT_DROP_ROUTES = '/api/common/health/,/api/common/live/,/api/common/ready/'
+
+
+def tail_sampling_enabled():
+    return os.getenv('OTEL_TAIL_SAMPLING_ENABLED', 'false').lower() == 'true'
+
+
+def build_sampler():
+    """
+    根据环境变量构建采样器：
+    - OTEL_TRACES_SAMPLER_RATIO：按trace_id采样的比例，有上游trace时跟随上游的决定
+    - OTEL_SAMPLER_DROP_ROUTES：逗号分隔的路径前缀，匹配的请求不产生trace
+    - OTEL_TRACES_RATE_LIMIT：每秒最多新建的trace数，0表示不限制
+    开启尾部采样时所有请求都先记录，比例改为在尾部采样中作用于正常的trace
+    """
+    ratio = _env_float('OTEL_TRACES_SAMPLER_RATIO', 1.0)
+    drop_routes = [
+        route.strip()
+        for route in os.getenv('OTEL_SAMPLER_DROP_ROUTES', DEFAULT_DROP_ROUTES).split(',')
+        if route.strip()
+    ]
+    rate_limit = _env_float('OTEL_TRACES_RATE_LIMIT', 0)
+
+    root = ALWAYS_ON if tail_sampling_enabled() or ratio >= 1 else TraceIdRatioBased(ratio)
+    if rate_limit > 0:
+        root = RateLimitingSampler(root, rate_limit)
+    if drop_routes:
+        root = RouteRuleSampler(root, drop_routes)
+    return ParentBased(root=root)
+
+
+def wrap_span_processor(processor):
+    """
+    开启尾部采样（OTEL_TAIL_SAMPLING_ENABLED=true）时在导出前按trace做决定：
+    - OTEL_TAIL_SAMPLING_SLOW_MS：根span耗时超过该值（毫秒）的trace总是保留
+    - OTEL_TAIL_SAMPLING_MAX_TRACES：同时缓存的trace数上限
+    正常的trace按 OTEL_TRACES_SAMPLER_RATIO 的比例保留
+    """
+    if not tail_sampling_enabled():
+        return processor
+    return TailSamplingSpanProcessor(
+        processor,
+        slow_threshold_ms=_env_float('OTEL_TAIL_SAMPLING_SLOW_MS', 500),
+        baseline_ratio=min(_env_float('OTEL_TRACES_SAMPLER_RATIO', 1.0), 1.0),
+        max_traces=int(_env_float('OTEL_TAIL_SAMPLING_MAX_TRACES', 10000)),
+    )
@@ -47,6 +47,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'myproject.middleware.RequestMetricsMiddleware',  # 请求耗时与SQL指标
+    'myproject.middleware.QueryProfilerMiddleware',  # 抽样分析请求的SQL（默认关闭）
+    'myproject.middleware.ReplicaRoutingMiddleware',  # 写入后的读取固定使用主库（配置了只读副本时）
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -77,21 +80,88 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'myproject.wsgi.application'
 
+# ASGI服务器中执行阻塞调用（ORM、boto3、Redis）的线程数
+# 开启数据库连接池时，超过 DB_POOL_MAX_SIZE 的并发调用会排队等待连接；RUSTFS_MAX_POOL_CONNECTIONS 不应小于该值
+ASGI_THREAD_POOL_SIZE = int(os.getenv('ASGI_THREAD_POOL_SIZE', '32'))
+# ASGI服务器中交给WSGI应用处理的请求（写接口、管理界面、流式输出等）使用的线程数，
+# 每个请求从读取请求体到发完响应体占用一个线程，与上面的线程池分开
+ASGI_WSGI_THREAD_POOL_SIZE = int(os.getenv('ASGI_WSGI_THREAD_POOL_SIZE', '16'))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# 连接池：开启后每个进程维护一个连接池，请求结束时连接归还到池中供其他线程复用；
+# 关闭时使用持久连接，连接最长保持 DB_CONN_MAX_AGE 秒
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'false').lower() == 'true'
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.mysql',
+        # 在Django MySQL后端的基础上增加了连接健康检查和可选的连接池
+        'ENGINE': 'myproject.db.mysql',
         'NAME': os.getenv('MYSQL_DATABASE', 'myapp_db'),
         'USER': os.getenv('MYSQL_USER', 'myapp_user'),
         'PASSWORD': os.getenv('MYSQL_PASSWORD', 'myapp_password'),
         'HOST': os.getenv('MYSQL_HOST', 'mysql'),
         'PORT': os.getenv('MYSQL_PORT', '3306'),
+        # 使用连接池时每个请求结束都归还连接，不在线程中长期持有
+        'CONN_MAX_AGE': 0 if DB_POOL_ENABLED else int(os.getenv('DB_CONN_MAX_AGE', '60')),
+        # 复用连接前先ping，避免使用已被MySQL（wait_timeout）或网络断开的连接
+        'CONN_HEALTH_CHECKS': os.getenv('DB_CONN_HEALTH_CHECKS', 'true').lower() == 'true',
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('DB_POOL_MIN_SIZE', '0')),
+            'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+            'IDLE_TIMEOUT': int(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+            'TIMEOUT': float(os.getenv('DB_POOL_TIMEOUT', '10')),
+            'PRE_PING': os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true',
+        } if DB_POOL_ENABLED else None,
+    }
+}
+
+
+# 只读副本：MYSQL_REPLICAS="host[:port][*weight],..."，例如 "replica1:3306*2,replica2"
+# 每个副本对应 replica1、replica2... 数据库别名，其余配置与主库相同
+DATABASE_REPLICA_WEIGHTS = {}
+for _index, _replica in enumerate(filter(None, os.getenv('MYSQL_REPLICAS', '').split(',')), start=1):
+    _address, _, _weight = _replica.strip().partition('*')
+    _host, _, _port = _address.partition(':')
+    DATABASES[f'replica{_index}'] = {
+        **DATABASES['default'],
+        'HOST': _host,
+        'PORT': _port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICA_WEIGHTS[f'replica{_index}'] = float(_weight or 1)
+
+DATABASE_ROUTERS = ['myproject.db.routers.ReplicaRouter']
+# 写入后多少秒内，同一客户端的读取仍使用主库（通过cookie标记）
+REPLICA_STICKY_SECONDS = int(os.getenv('REPLICA_STICKY_SECONDS', '5'))
+REPLICA_STICKY_COOKIE = 'db_primary'
+
+# Cache
+# Django 2.2没有内置Redis缓存后端，使用 myproject.cache.RedisCache
+
+CACHES = {
+    'default': {
+        'BACKEND': 'myproject.cache.RedisCache',
+        'LOCATION': os.getenv('CACHE_REDIS_URL', os.getenv('REDIS_URL', 'redis://redis:6379/0')),
+        'KEY_PREFIX': 'myapp',
+        'TIMEOUT': 300,
     }
 }
 
+# 用户详情缓存的有效期、过期后仍可返回旧数据的宽限期以及重新加载时的锁超时（秒）
+# 缓存中包含预签名URL，有效期加宽限期应小于预签名URL的有效期
+USER_CACHE_TIMEOUT = int(os.getenv('USER_CACHE_TIMEOUT', '300'))
+USER_CACHE_STALE_GRACE = int(os.getenv('USER_CACHE_STALE_GRACE', '60'))
+USER_CACHE_LOCK_TIMEOUT = int(os.getenv('USER_CACHE_LOCK_TIMEOUT', '5'))
+# 用户不存在的结果缓存的秒数，避免对不存在用户的请求反复查询数据库
+USER_CACHE_NEGATIVE_TIMEOUT = int(os.getenv('USER_CACHE_NEGATIVE_TIMEOUT', '5'))
+
+# 就绪检查中每项依赖检查的超时，以及检查结果在进程内的缓存时间（秒）
+HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', '1.0'))
+HEALTH_READY_CACHE_SECONDS = float(os.getenv('HEALTH_READY_CACHE_SECONDS', '2.0'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -141,9 +211,62 @@ RUSTFS_ENDPOINT_URL = os.getenv('RUSTFS_ENDPOINT_URL', 'http://rustfs:9000')
 RUSTFS_BUCKET_NAME = os.getenv('RUSTFS_BUCKET_NAME', 'user-avatars')
 RUSTFS_REGION_NAME = os.getenv('RUSTFS_REGION_NAME', 'us-east-1')
 
+# 预签名URL的有效期（秒）、提前刷新的时间窗口（秒）以及进程内缓存的最大条目数
+RUSTFS_PRESIGNED_URL_EXPIRE = int(os.getenv('RUSTFS_PRESIGNED_URL_EXPIRE', '3600'))
+RUSTFS_PRESIGNED_URL_REFRESH_MARGIN = int(os.getenv('RUSTFS_PRESIGNED_URL_REFRESH_MARGIN', '300'))
+RUSTFS_PRESIGNED_URL_CACHE_SIZE = int(os.getenv('RUSTFS_PRESIGNED_URL_CACHE_SIZE', '10000'))
+
+# 连接RustFS的S3客户端配置：每个进程内相同配置的存储共用一个客户端
+# 连接池大小需不小于同时访问RustFS的线程数（包括并行上传头像版本的线程）
+RUSTFS_MAX_POOL_CONNECTIONS = int(os.getenv('RUSTFS_MAX_POOL_CONNECTIONS', '50'))
+RUSTFS_TCP_KEEPALIVE = os.getenv('RUSTFS_TCP_KEEPALIVE', 'true').lower() == 'true'
+RUSTFS_CONNECT_TIMEOUT = float(os.getenv('RUSTFS_CONNECT_TIMEOUT', '5'))
+RUSTFS_READ_TIMEOUT = float(os.getenv('RUSTFS_READ_TIMEOUT', '30'))
+# 单次请求的最大尝试次数（包括首次请求）与重试模式
+RUSTFS_MAX_ATTEMPTS = int(os.getenv('RUSTFS_MAX_ATTEMPTS', '3'))
+RUSTFS_RETRY_MODE = os.getenv('RUSTFS_RETRY_MODE', 'standard')
+
+# 头像处理配置
+# 允许处理的原始头像大小上限（字节）
+AVATAR_MAX_SOURCE_BYTES = int(os.getenv('AVATAR_MAX_SOURCE_BYTES', str(10 * 1024 * 1024)))
+# 生成的头像版本：边长（像素）与格式，'original' 表示与原图相同的格式
+AVATAR_RENDITION_SIZES = (512, 150, 48)
+AVATAR_RENDITION_FORMATS = ('original', 'WEBP')
+# thumbnail字段对应的版本边长
+AVATAR_THUMBNAIL_SIZE = 150
+# 并行上传头像版本的线程数
+AVATAR_RENDITION_UPLOAD_WORKERS = int(os.getenv('AVATAR_RENDITION_UPLOAD_WORKERS', '4'))
+# 允许解码的原始头像像素数上限，限制单个任务的内存占用
+AVATAR_MAX_SOURCE_PIXELS = int(os.getenv('AVATAR_MAX_SOURCE_PIXELS', '40000000'))
+# 头像处理任务的软/硬超时（秒）
+AVATAR_RENDITION_SOFT_TIME_LIMIT = int(os.getenv('AVATAR_RENDITION_SOFT_TIME_LIMIT', '60'))
+AVATAR_RENDITION_TIME_LIMIT = int(os.getenv('AVATAR_RENDITION_TIME_LIMIT', '90'))
+# 读写RustFS失败时头像处理任务按指数退避重试的最大次数
+AVATAR_RENDITION_MAX_RETRIES = int(os.getenv('AVATAR_RENDITION_MAX_RETRIES', '5'))
+# 浏览器直传头像：超过该大小（字节）时使用分片上传，以及每个分片的大小（S3要求至少5MB）
+AVATAR_MULTIPART_THRESHOLD = int(os.getenv('AVATAR_MULTIPART_THRESHOLD', str(8 * 1024 * 1024)))
+AVATAR_MULTIPART_PART_SIZE = int(os.getenv('AVATAR_MULTIPART_PART_SIZE', str(5 * 1024 * 1024)))
+# 未完成的头像分片上传保留的天数，由 setup_rustfs_bucket 配置为bucket的生命周期规则
+AVATAR_MULTIPART_ABORT_DAYS = int(os.getenv('AVATAR_MULTIPART_ABORT_DAYS', '1'))
+# 同一用户排队中的头像处理任务去重标记的最长保留时间（秒）
+AVATAR_RENDITION_DEDUPE_TIMEOUT = int(os.getenv('AVATAR_RENDITION_DEDUPE_TIMEOUT', '600'))
+
 # Use RustFS for media files (avatars and thumbnails)
 DEFAULT_FILE_STORAGE = 'users.storage.RustFSStorage'
 
+# SQL分析中间件：是否开启、抽样比例，以及同一语句执行多少次视为N+1嫌疑
+QUERY_PROFILER_ENABLED = os.getenv('QUERY_PROFILER_ENABLED', 'false').lower() == 'true'
+QUERY_PROFILER_SAMPLE_RATIO = float(os.getenv('QUERY_PROFILER_SAMPLE_RATIO', '0.01'))
+QUERY_PROFILER_N_PLUS_ONE_THRESHOLD = int(os.getenv('QUERY_PROFILER_N_PLUS_ONE_THRESHOLD', '5'))
+
+# Celery任务记录的批量写入配置：缓冲的任务数上限与最长写入间隔（秒）
+TASK_RECORD_BUFFER_SIZE = int(os.getenv('TASK_RECORD_BUFFER_SIZE', '100'))
+TASK_RECORD_FLUSH_INTERVAL = float(os.getenv('TASK_RECORD_FLUSH_INTERVAL', '2.0'))
+# 写入失败的状态变化保留在缓冲区中重试，连续失败达到该次数后丢弃
+TASK_RECORD_MAX_ATTEMPTS = int(os.getenv('TASK_RECORD_MAX_ATTEMPTS', '3'))
+# 任务记录的保留天数，超过的记录由 purge_task_records 命令归档或清理
+TASK_RECORD_RETENTION_DAYS = int(os.getenv('TASK_RECORD_RETENTION_DAYS', '30'))
+
 # OpenTelemetry Configuration
 OTEL_SERVICE_NAME = os.getenv('OTEL_SERVICE_NAME', 'my-opentelemetry-service')
 OTEL_EXPORTER_OTLP_ENDPOINT = os.getenv('OTEL_EXPORTER_OTLP_ENDPOINT', 'http://localhost:4317')
@@ -165,6 +288,14 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20
 }
 
+# 用户列表接口的游标分页与流式输出配置
+USER_LIST_PAGE_SIZE = int(os.getenv('USER_LIST_PAGE_SIZE', '20'))
+USER_LIST_MAX_PAGE_SIZE = int(os.getenv('USER_LIST_MAX_PAGE_SIZE', '200'))
+USER_LIST_STREAM_CHUNK_SIZE = int(os.getenv('USER_LIST_STREAM_CHUNK_SIZE', '500'))
+
+# 批量接口单次请求允许的最大操作数
+USER_BATCH_MAX_OPERATIONS = int(os.getenv('USER_BATCH_MAX_OPERATIONS', '1000'))
+
 # CORS配置
 CORS_ALLOW_ALL_ORIGINS = True  # 在生产环境中应该限制为特定域名
 
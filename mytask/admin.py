@@ -9,6 +9,12 @@ class TaskRecordAdmin(admin.ModelAdmin):
     search_fields = ('task_id', 'task_name')
     readonly_fields = ('task_id', 'task_name', 'status', 'result', 'args', 'kwargs', 'created_at', 'started_at', 'completed_at', 'traceback')
     ordering = ('-created_at',)
+    # 数据量很大时不统计全表行数，避免额外的COUNT(*)全表扫描
+    show_full_result_count = False
+    
+    def get_queryset(self, request):
+        # 列表页不需要大文本字段，延迟到详情页访问时再加载
+        return super().get_queryset(request).defer('result', 'args', 'kwargs', 'traceback')
     
     def get_readonly_fields(self, request, obj=None):
         # 所有字段都是只读的，防止意外修改任务记录
@@ -0,0 +1,66 @@
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from mytask.models import TaskRecord
+
+
+class Command(BaseCommand):
+    help = '归档并清理超过保留期的任务记录。按主键分批删除，每批一个短事务，不会长时间锁表'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int,
+            default=getattr(settings, 'TASK_RECORD_RETENTION_DAYS', 30),
+            help='保留最近多少天的记录'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批删除的记录数')
+        parser.add_argument('--sleep', type=float, default=0.1, help='两批之间的等待秒数，降低对线上的影响')
+        parser.add_argument('--archive', help='删除前将记录以NDJSON格式追加写入该文件')
+        parser.add_argument('--dry-run', action='store_true', help='只统计需要清理的记录数，不实际删除')
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        expired = TaskRecord.objects.filter(created_at__lt=cutoff)
+
+        if options['dry_run']:
+            self.stdout.write(f'将清理 {expired.count()} 条 {cutoff:%Y-%m-%d %H:%M:%S} 之前的任务记录')
+            return
+
+        deleted = self.purge_in_batches(expired, options['batch_size'], options['sleep'], options['archive'])
+        self.stdout.write(
+            self.style.SUCCESS(f'已清理 {deleted} 条 {cutoff:%Y-%m-%d %H:%M:%S} 之前的任务记录')
+        )
+
+    def purge_in_batches(self, queryset, batch_size, sleep, archive_path):
+        """
+        按主键分批删除记录，每批单独提交
+        """
+        archive = open(archive_path, 'a', encoding='utf-8') if archive_path else None
+        deleted = 0
+        try:
+            while True:
+                with transaction.atomic():
+                    ids = list(queryset.order_by('id').values_list('id', flat=True)[:batch_size])
+                    if not ids:
+                        break
+                    if archive is not None:
+                        for row in TaskRecord.objects.filter(id__in=ids).order_by('id').values():
+                            archive.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+                        archive.flush()
+                    TaskRecord.objects.filter(id__in=ids).delete()
+                deleted += len(ids)
+                if len(ids) < batch_size:
+                    break
+                if sleep:
+                    time.sleep(sleep)
+        finally:
+            if archive is not None:
+                archive.close()
+        return deleted
@@ -0,0 +1,30 @@
+# Generated by Django 2.2 on 2026-10-18 15:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mytask', '0002_auto_20251223_0338'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='taskrecord',
+            name='status',
+            field=models.CharField(choices=[('PENDING', '等待中'), ('RECEIVED', '已接收'), ('STARTED', '执行中'), ('SUCCESS', '成功'), ('FAILURE', '失败'), ('RETRY', '重试中'), ('REVOKED', '已撤销'), ('REJECTED', '已拒绝'), ('IGNORED', '已忽略')], default='PENDING', max_length=16, verbose_name='任务状态'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrecord',
+            index=models.Index(fields=['created_at'], name='taskrecord_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrecord',
+            index=models.Index(fields=['status', 'created_at'], name='taskrecord_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='taskrecord',
+            index=models.Index(fields=['task_name', 'created_at'], name='taskrecord_name_created_idx'),
+        ),
+    ]
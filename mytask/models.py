@@ -6,9 +6,31 @@ class TaskRecord(models.Model):
     """
     记录Celery任务执行情况的模型
     """
+    # Celery任务状态，与celery.states保持一致
+    PENDING = 'PENDING'
+    RECEIVED = 'RECEIVED'
+    STARTED = 'STARTED'
+    SUCCESS = 'SUCCESS'
+    FAILURE = 'FAILURE'
+    RETRY = 'RETRY'
+    REVOKED = 'REVOKED'
+    REJECTED = 'REJECTED'
+    IGNORED = 'IGNORED'
+    STATUS_CHOICES = (
+        (PENDING, '等待中'),
+        (RECEIVED, '已接收'),
+        (STARTED, '执行中'),
+        (SUCCESS, '成功'),
+        (FAILURE, '失败'),
+        (RETRY, '重试中'),
+        (REVOKED, '已撤销'),
+        (REJECTED, '已拒绝'),
+        (IGNORED, '已忽略'),
+    )
+
     task_id = models.CharField(max_length=255, unique=True, verbose_name='任务ID')
     task_name = models.CharField(max_length=255, verbose_name='任务名称')
-    status = models.CharField(max_length=50, default='PENDING', verbose_name='任务状态')
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=PENDING, verbose_name='任务状态')
     result = models.TextField(blank=True, null=True, verbose_name='任务结果')
     args = models.TextField(blank=True, null=True, verbose_name='任务参数')
     kwargs = models.TextField(blank=True, null=True, verbose_name='任务关键字参数')
@@ -21,6 +43,14 @@ class TaskRecord(models.Model):
         verbose_name = '任务记录'
         verbose_name_plural = '任务记录'
         ordering = ['-created_at']
+        indexes = [
+            # 管理后台的默认排序以及按时间清理旧记录
+            models.Index(fields=['created_at'], name='taskrecord_created_idx'),
+            # 管理后台按状态筛选并按时间排序
+            models.Index(fields=['status', 'created_at'], name='taskrecord_status_created_idx'),
+            # 按任务名称查询某类任务的执行历史
+            models.Index(fields=['task_name', 'created_at'], name='taskrecord_name_created_idx'),
+        ]
 
     def __str__(self):
-        return f'{self.task_name} - {self.task_id}'
\ No newline at end of file
+        return f'{self.task_name} - {self.task_id}'
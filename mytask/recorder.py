@@ -0,0 +1,164 @@
+import atexit
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, transaction
+
+from .models import TaskRecord
+
+
+class TaskRecordBuffer:
+    """
+    按worker进程缓冲任务状态变化，批量写入TaskRecord
+
+    同一任务的多次状态变化（开始、完成、失败）在内存中合并为一条记录，
+    缓冲的任务数达到上限或距上次写入超过时间间隔时统一写入数据库：
+    一次IN查询找出已存在的记录，新记录bulk_create，已有记录bulk_update；
+    写入失败（如数据库连接断开）时放回缓冲区，下次再写，连续失败 max_attempts 次后才丢弃
+    """
+    def __init__(self, max_size=100, flush_interval=2.0, max_attempts=3):
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        self._pid = None
+        self._ensure_process()
+
+    def record(self, task_id, changes, defaults=None):
+        """
+        记录一次任务状态变化
+        changes中的字段总是写入（后到的覆盖先到的），
+        defaults中的字段只在创建新记录时使用（先到的优先）
+        """
+        self._ensure_process()
+        if not self._flusher_started:
+            self._start_flusher()
+
+        with self._lock:
+            entry = self._pending.get(task_id)
+            if entry is None:
+                entry = self._pending[task_id] = {'changes': {}, 'defaults': {}, 'attempts': 0}
+            entry['changes'].update(changes)
+            for field, value in (defaults or {}).items():
+                entry['defaults'].setdefault(field, value)
+
+            should_flush = (
+                len(self._pending) >= self.max_size
+                or time.monotonic() - self._last_flush >= self.flush_interval
+            )
+
+        if should_flush:
+            self.flush()
+
+    def flush(self):
+        """
+        将缓冲的状态变化写入数据库
+        后台线程和信号处理函数都会调用，_flush_lock 保证各批按取出的顺序依次写入，
+        先取出的批次（如STARTED）不会在后取出的批次（如SUCCESS）之后提交而覆盖最终状态
+        """
+        self._ensure_process()
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, OrderedDict()
+                self._last_flush = time.monotonic()
+
+            if not pending:
+                return
+
+            try:
+                self._write(pending)
+            except Exception as e:
+                self._requeue(pending, e)
+
+    def _requeue(self, pending, error):
+        """
+        把写入失败的一批放回缓冲区，与期间新到的状态变化合并（新的changes覆盖旧的）
+        """
+        retry = OrderedDict()
+        for task_id, entry in pending.items():
+            entry['attempts'] += 1
+            if entry['attempts'] < self.max_attempts:
+                retry[task_id] = entry
+        dropped = len(pending) - len(retry)
+        print(f"批量写入任务记录失败，{len(retry)} 条状态变化稍后重试，丢弃 {dropped} 条: {error}")
+
+        with self._lock:
+            for task_id, entry in self._pending.items():
+                old = retry.get(task_id)
+                if old is None:
+                    retry[task_id] = entry
+                    continue
+                old['changes'].update(entry['changes'])
+                for field, value in entry['defaults'].items():
+                    old['defaults'].setdefault(field, value)
+            self._pending = retry
+
+    def _write(self, pending):
+        existing = TaskRecord.objects.only('id', 'task_id').in_bulk(list(pending), field_name='task_id')
+
+        to_create = []
+        # 按更新的字段分组，每组一次bulk_update
+        to_update = {}
+        for task_id, entry in pending.items():
+            record = existing.get(task_id)
+            if record is None:
+                to_create.append(TaskRecord(task_id=task_id, **{**entry['defaults'], **entry['changes']}))
+                continue
+            for field, value in entry['changes'].items():
+                setattr(record, field, value)
+            to_update.setdefault(tuple(sorted(entry['changes'])), []).append(record)
+
+        try:
+            with transaction.atomic():
+                TaskRecord.objects.bulk_create(to_create, batch_size=self.max_size)
+                for fields, records in to_update.items():
+                    TaskRecord.objects.bulk_update(records, fields, batch_size=self.max_size)
+        except IntegrityError:
+            # 其他进程已经创建了部分记录，逐条回退处理
+            for task_id, entry in pending.items():
+                record, created = TaskRecord.objects.get_or_create(
+                    task_id=task_id,
+                    defaults={**entry['defaults'], **entry['changes']}
+                )
+                if not created:
+                    TaskRecord.objects.filter(pk=record.pk).update(**entry['changes'])
+
+    def _ensure_process(self):
+        # prefork池中子进程继承了父进程的状态，需要在子进程中重新初始化
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = OrderedDict()
+        self._last_flush = time.monotonic()
+        self._flusher_started = False
+
+    def _start_flusher(self):
+        # 后台线程定期写入，保证任务较少时状态变化也能及时落库
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                if self._pending:
+                    # 后台线程没有请求/任务边界，写入前自行关闭失效或超过CONN_MAX_AGE的连接
+                    close_old_connections()
+                    self.flush()
+
+        with self._lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+        thread = threading.Thread(target=run, name='task-record-flusher', daemon=True)
+        thread.start()
+
+
+task_record_buffer = TaskRecordBuffer(
+    max_size=getattr(settings, 'TASK_RECORD_BUFFER_SIZE', 100),
+    flush_interval=getattr(settings, 'TASK_RECORD_FLUSH_INTERVAL', 2.0),
+    max_attempts=getattr(settings, 'TASK_RECORD_MAX_ATTEMPTS', 3),
+)
+
+atexit.register(task_record_buffer.flush)
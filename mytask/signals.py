@@ -1,9 +1,31 @@
 import json
-from django.db.models.signals import post_save
-from django.dispatch import receiver
-from celery.signals import task_prerun, task_postrun, task_failure
-from .models import TaskRecord
+import time
+from celery.signals import (
+    before_task_publish, task_prerun, task_postrun, task_failure, worker_process_shutdown, worker_shutdown
+)
+from .recorder import task_record_buffer
 from django.utils import timezone
+from myproject.metrics import celery_task_duration, celery_task_queue_wait
+
+
+# 正在执行的任务的开始时间，用于计算任务耗时
+_task_started_at = {}
+
+
+def _dump_args(args, kwargs):
+    return {
+        'args': json.dumps(list(args)) if args else None,
+        'kwargs': json.dumps(kwargs) if kwargs else None,
+    }
+
+
+@before_task_publish.connect
+def add_published_at_header(headers=None, **kwargs):
+    """
+    在消息头中记录任务的发布时间，worker据此计算任务的排队时间
+    """
+    if headers is not None:
+        headers.setdefault('published_at', time.time())
 
 
 @task_prerun.connect
@@ -11,24 +33,24 @@ def task_prerun_handler(sender=None, task_id=None, task=None, args=None, kwargs=
     """
     Celery任务开始执行前的处理函数
     """
-    # 检查任务记录是否已存在，如果不存在则创建
-    task_record, created = TaskRecord.objects.get_or_create(
-        task_id=task_id,
-        defaults={
+    _task_started_at[task_id] = time.perf_counter()
+    published_at = task.request.get('published_at')
+    if published_at:
+        celery_task_queue_wait.record(max(time.time() - published_at, 0), {'celery.task.name': task.name})
+    
+    # 状态变化先写入缓冲区，由缓冲区批量落库
+    task_record_buffer.record(
+        task_id,
+        changes={
             'task_name': task.name,
             'status': 'STARTED',
-            'args': json.dumps(list(args)) if args else None,
-            'kwargs': json.dumps(kwargs) if kwargs else None,
             'started_at': timezone.now()
+        },
+        defaults={
+            'created_at': timezone.now(),
+            **_dump_args(args, kwargs)
         }
     )
-    
-    if not created:
-        # 如果记录已存在，更新状态和开始时间
-        task_record.status = 'STARTED'
-        task_record.started_at = timezone.now()
-        task_record.task_name = task.name
-        task_record.save()
 
 
 @task_postrun.connect
@@ -36,23 +58,29 @@ def task_postrun_handler(sender=None, task_id=None, task=None, args=None, kwargs
     """
     Celery任务执行后的处理函数
     """
-    try:
-        task_record = TaskRecord.objects.get(task_id=task_id)
-        task_record.status = state
-        task_record.result = json.dumps(retval) if retval is not None else None
-        task_record.completed_at = timezone.now()
-        task_record.save()
-    except TaskRecord.DoesNotExist:
-        # 如果任务记录不存在，则创建一个新的记录
-        TaskRecord.objects.create(
-            task_id=task_id,
-            task_name=task.name,
-            status=state,
-            result=json.dumps(retval) if retval is not None else None,
-            args=json.dumps(list(args)) if args else None,
-            kwargs=json.dumps(kwargs) if kwargs else None,
-            completed_at=timezone.now()
-        )
+    started_at = _task_started_at.pop(task_id, None)
+    if started_at is not None:
+        celery_task_duration.record(time.perf_counter() - started_at, {
+            'celery.task.name': task.name,
+            'celery.task.state': state or 'UNKNOWN',
+        })
+    
+    changes = {
+        'status': state,
+        'completed_at': timezone.now()
+    }
+    # 失败时retval是异常对象，结果已由task_failure_handler记录
+    if state != 'FAILURE':
+        changes['result'] = json.dumps(retval, default=str) if retval is not None else None
+    
+    task_record_buffer.record(
+        task_id,
+        changes=changes,
+        defaults={
+            'task_name': task.name,
+            **_dump_args(args, kwargs)
+        }
+    )
 
 
 @task_failure.connect
@@ -60,20 +88,24 @@ def task_failure_handler(sender=None, task_id=None, exception=None, traceback=No
     """
     Celery任务执行失败时的处理函数
     """
-    try:
-        task_record = TaskRecord.objects.get(task_id=task_id)
-        task_record.status = 'FAILURE'
-        task_record.result = str(exception)
-        task_record.traceback = str(einfo)
-        task_record.completed_at = timezone.now()
-        task_record.save()
-    except TaskRecord.DoesNotExist:
-        # 如果任务记录不存在，则创建一个新的记录
-        TaskRecord.objects.create(
-            task_id=task_id,
-            task_name=getattr(sender, 'name', 'Unknown'),
-            status='FAILURE',
-            result=str(exception),
-            traceback=str(einfo),
-            completed_at=timezone.now()
-        )
\ No newline at end of file
+    task_record_buffer.record(
+        task_id,
+        changes={
+            'status': 'FAILURE',
+            'result': str(exception),
+            'traceback': str(einfo),
+            'completed_at': timezone.now()
+        },
+        defaults={
+            'task_name': getattr(sender, 'name', 'Unknown')
+        }
+    )
+
+
+@worker_process_shutdown.connect
+@worker_shutdown.connect
+def flush_task_records(**kwargs):
+    """
+    worker进程退出前写入缓冲区中剩余的任务记录
+    """
+    task_record_buffer.flush()
@@ -1,3 +1,178 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.management import call_command
 from django.test import TestCase
+from django.utils import timezone
+
+from . import signals
+from .models import TaskRecord
+from .recorder import TaskRecordBuffer
+
+
+class TaskRecordBufferTests(TestCase):
+    """
+    任务状态变化的缓冲与批量写入
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(TaskRecordBuffer, '_start_flusher')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.buffer = TaskRecordBuffer(max_size=100, flush_interval=3600)
+
+    def test_transitions_of_a_task_are_merged_into_one_row(self):
+        self.buffer.record('t1', {'task_name': 'demo', 'status': 'STARTED'}, defaults={'args': '[1]'})
+        self.buffer.record('t1', {'status': 'SUCCESS'}, defaults={'args': '[2]'})
+        with self.assertNumQueries(4):
+            # 一次in_bulk查询和一次bulk_create，另有测试事务中的SAVEPOINT/RELEASE
+            self.buffer.flush()
+        record = TaskRecord.objects.get(task_id='t1')
+        self.assertEqual((record.task_name, record.status, record.args), ('demo', 'SUCCESS', '[1]'))
+
+    def test_existing_records_are_updated(self):
+        TaskRecord.objects.create(task_id='t1', task_name='demo', status='STARTED')
+        self.buffer.record('t1', {'status': 'SUCCESS', 'result': '42'})
+        self.buffer.record('t2', {'task_name': 'demo', 'status': 'STARTED'})
+        self.buffer.flush()
+        self.assertEqual(
+            dict(TaskRecord.objects.values_list('task_id', 'status')),
+            {'t1': 'SUCCESS', 't2': 'STARTED'}
+        )
+        self.assertEqual(TaskRecord.objects.get(task_id='t1').result, '42')
+
+    def test_buffer_flushes_when_full(self):
+        self.buffer.max_size = 2
+        self.buffer.record('t1', {'task_name': 'demo', 'status': 'STARTED'})
+        self.assertFalse(TaskRecord.objects.exists())
+        self.buffer.record('t2', {'task_name': 'demo', 'status': 'STARTED'})
+        self.assertEqual(TaskRecord.objects.count(), 2)
+
+    def test_failed_write_is_retried_on_next_flush(self):
+        self.buffer.record('t1', {'task_name': 'demo', 'status': 'STARTED'})
+        write = self.buffer._write
+        failures = [OSError('MySQL server has gone away')]
+
+        def flaky_write(pending):
+            if failures:
+                raise failures.pop()
+            write(pending)
+
+        with mock.patch.object(self.buffer, '_write', side_effect=flaky_write):
+            self.buffer.flush()
+            self.assertFalse(TaskRecord.objects.exists())
+            # 失败期间到达的状态变化覆盖放回的旧值
+            self.buffer.record('t1', {'status': 'SUCCESS'})
+            self.buffer.flush()
+        record = TaskRecord.objects.get(task_id='t1')
+        self.assertEqual((record.task_name, record.status), ('demo', 'SUCCESS'))
+
+    def test_entries_are_dropped_after_max_attempts(self):
+        self.buffer.max_attempts = 2
+        self.buffer.record('t1', {'task_name': 'demo', 'status': 'STARTED'})
+        with mock.patch.object(self.buffer, '_write', side_effect=OSError) as write:
+            self.buffer.flush()
+            self.buffer.flush()
+            self.buffer.flush()
+        self.assertEqual(write.call_count, 2)
+
+    def test_interleaved_flushes_commit_in_order(self):
+        # 第一次写入（STARTED）被阻塞时，另一个线程取出并写入SUCCESS，最终状态必须是SUCCESS
+        committed = {}
+        first_write_started = threading.Event()
+        release_first_write = threading.Event()
+
+        def write(pending):
+            if not first_write_started.is_set():
+                first_write_started.set()
+                release_first_write.wait(5)
+            for task_id, entry in pending.items():
+                committed[task_id] = entry['changes']['status']
+
+        self.buffer._write = write
+        self.buffer.record('t1', {'status': 'STARTED'})
+        first = threading.Thread(target=self.buffer.flush)
+        first.start()
+        self.assertTrue(first_write_started.wait(5))
+
+        self.buffer.record('t1', {'status': 'SUCCESS'})
+        second = threading.Thread(target=self.buffer.flush)
+        second.start()
+        second.join(0.5)
+        release_first_write.set()
+        first.join(5)
+        second.join(5)
+
+        self.assertEqual(committed, {'t1': 'SUCCESS'})
+
+
+class PurgeTaskRecordsTests(TestCase):
+    """
+    purge_task_records 按批清理过期的任务记录
+    """
+
+    def setUp(self):
+        old = timezone.now() - timedelta(days=40)
+        for index in range(5):
+            TaskRecord.objects.create(task_id=f'old{index}', task_name='demo', status='SUCCESS', created_at=old)
+        TaskRecord.objects.create(task_id='new', task_name='demo', status='SUCCESS')
+
+    def test_expired_records_are_deleted_in_batches(self):
+        with mock.patch('mytask.management.commands.purge_task_records.time.sleep') as sleep:
+            call_command('purge_task_records', days=30, batch_size=2, stdout=StringIO())
+        self.assertEqual(list(TaskRecord.objects.values_list('task_id', flat=True)), ['new'])
+        # 5条记录分3批删除，批次之间暂停
+        self.assertEqual(sleep.call_count, 2)
+
+    def test_dry_run_deletes_nothing(self):
+        out = StringIO()
+        call_command('purge_task_records', days=30, dry_run=True, stdout=out)
+        self.assertIn('5', out.getvalue())
+        self.assertEqual(TaskRecord.objects.count(), 6)
+
+    def test_archive_receives_deleted_rows(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'archive.ndjson')
+            call_command('purge_task_records', days=30, batch_size=2, sleep=0, archive=path, stdout=StringIO())
+            with open(path, encoding='utf-8') as f:
+                archived = [json.loads(line)['task_id'] for line in f]
+        self.assertEqual(sorted(archived), [f'old{index}' for index in range(5)])
+
+
+class TaskMetricsTests(TestCase):
+    """
+    Celery信号处理函数记录任务耗时和排队时间
+    """
+
+    def setUp(self):
+        patcher = mock.patch.object(signals, 'task_record_buffer')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.task = mock.Mock()
+        self.task.name = 'users.tasks.demo'
+        self.task.request.get.return_value = time.time() - 3
+
+    def test_queue_wait_and_duration_are_recorded(self):
+        with mock.patch.object(signals, 'celery_task_queue_wait') as queue_wait, \
+                mock.patch.object(signals, 'celery_task_duration') as duration:
+            signals.task_prerun_handler(task_id='t1', task=self.task, args=(), kwargs={})
+            signals.task_postrun_handler(task_id='t1', task=self.task, args=(), kwargs={}, retval=1, state='SUCCESS')
+
+        wait, attributes = queue_wait.record.call_args[0]
+        self.assertGreaterEqual(wait, 3)
+        self.assertEqual(attributes, {'celery.task.name': 'users.tasks.demo'})
+        self.assertEqual(
+            duration.record.call_args[0][1],
+            {'celery.task.name': 'users.tasks.demo', 'celery.task.state': 'SUCCESS'}
+        )
 
-# Create your tests here.
+    def test_published_at_header_is_added(self):
+        headers = {}
+        signals.add_published_at_header(headers=headers)
+        self.assertAlmostEqual(headers['published_at'], time.time(), delta=5)
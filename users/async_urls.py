@@ -0,0 +1,8 @@
+from django.urls import path
+from . import views
+
+urlpatterns = [
+    path('users/', views.AsyncUserListView(), name='user-list'),
+    path('users/<int:pk>/', views.AsyncUserDetailView(), name='user-detail'),
+    path('users/<int:user_id>/profile/', views.AsyncUserProfileView(), name='user-profile-detail'),
+]
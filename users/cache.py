@@ -0,0 +1,122 @@
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from .exceptions import UserNotFoundException
+
+
+# 缓存内容的结构发生变化时递增，旧结构的缓存随即失效
+USER_CACHE_PAYLOAD_VERSION = 2
+
+# 缓存项中表示用户不存在的标记，缓存项为 (标记, 错误详情)
+_NOT_FOUND = 'users:not-found'
+
+
+def _version_key(user_id):
+    return f'users:profile:version:{user_id}'
+
+
+def _payload_key(user_id, version):
+    return f'users:profile:v{USER_CACHE_PAYLOAD_VERSION}:{user_id}:{version}'
+
+
+def _lock_key(user_id, version):
+    return f'users:profile:lock:{user_id}:{version}'
+
+
+def _get_version(user_id):
+    """
+    获取用户缓存的版本号
+    版本号不存在时以当前毫秒时间戳初始化，保证被淘汰后重建的版本号不会与旧缓存重复
+    """
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def _bump_version(user_id):
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.add(key, int(time.time() * 1000), timeout=None)
+    except Exception as e:
+        print(f"使用户缓存失效失败: {e}")
+
+
+def invalidate_user_cache(user_id):
+    """
+    在事务提交后使用户缓存失效
+    只递增版本号而不删除缓存，避免并发读取把旧数据写回缓存
+    """
+    transaction.on_commit(lambda: _bump_version(user_id))
+
+
+def get_cached_user(user_id, loader):
+    """
+    读穿透缓存：命中时直接返回缓存的数据，未命中时调用loader加载并写入缓存
+
+    防止缓存击穿：
+    - 缓存未命中时只有获得锁的请求调用loader，其他请求短暂等待其结果；
+      持有锁的请求加载失败（锁已释放但没有写入缓存）时，等待的请求立即自行加载
+    - 缓存临近过期时由一个请求提前重新加载，其他请求继续使用旧数据
+    - loader抛出UserNotFoundException时，该结果缓存 USER_CACHE_NEGATIVE_TIMEOUT 秒，
+      期间对不存在用户的请求直接抛出同样的异常；创建用户会递增版本号，不会读到这条缓存
+    Redis不可用时直接调用loader
+    """
+    timeout = getattr(settings, 'USER_CACHE_TIMEOUT', 300)
+    stale_grace = getattr(settings, 'USER_CACHE_STALE_GRACE', 60)
+    lock_timeout = getattr(settings, 'USER_CACHE_LOCK_TIMEOUT', 5)
+
+    try:
+        version = _get_version(user_id)
+        payload_key = _payload_key(user_id, version)
+        lock_key = _lock_key(user_id, version)
+        entry = cache.get(payload_key)
+    except Exception as e:
+        print(f"读取用户缓存失败: {e}")
+        return loader()
+
+    if entry is not None:
+        _raise_if_not_found(entry)
+        payload, refresh_at = entry
+        if time.time() < refresh_at or not cache.add(lock_key, 1, timeout=lock_timeout):
+            return payload
+        return _load_and_store(loader, payload_key, lock_key, timeout, stale_grace)
+
+    if cache.add(lock_key, 1, timeout=lock_timeout):
+        return _load_and_store(loader, payload_key, lock_key, timeout, stale_grace)
+
+    # 其他请求正在加载，等待其写入缓存
+    wait_interval = 0.05
+    for _ in range(int(lock_timeout / wait_interval)):
+        time.sleep(wait_interval)
+        found = cache.get_many([payload_key, lock_key])
+        if payload_key in found:
+            _raise_if_not_found(found[payload_key])
+            return found[payload_key][0]
+        if lock_key not in found:
+            break
+    return loader()
+
+
+def _raise_if_not_found(entry):
+    if entry[0] == _NOT_FOUND:
+        raise UserNotFoundException(entry[1])
+
+
+def _load_and_store(loader, payload_key, lock_key, timeout, stale_grace):
+    try:
+        payload = loader()
+        cache.set(payload_key, (payload, time.time() + timeout), timeout=timeout + stale_grace)
+        return payload
+    except UserNotFoundException as e:
+        cache.set(payload_key, (_NOT_FOUND, e.detail), timeout=getattr(settings, 'USER_CACHE_NEGATIVE_TIMEOUT', 5))
+        raise
+    finally:
+        cache.delete(lock_key)
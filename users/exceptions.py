@@ -32,16 +32,17 @@ class BusinessException(Exception):
         self.detail = detail or self.message
         super().__init__(self.detail)
     
+    def to_dict(self):
+        """转换为错误信息字典"""
+        return {
+            'error_code': self.error_code,
+            'message': self.message,
+            'detail': self.detail
+        }
+    
     def to_response(self, status_code=400):
         """转换为HttpResponse"""
-        return JsonResponse(
-            {
-                'error_code': self.error_code,
-                'message': self.message,
-                'detail': self.detail
-            },
-            status=status_code
-        )
+        return JsonResponse(self.to_dict(), status=status_code)
 
 
 class UserNotFoundException(BusinessException):
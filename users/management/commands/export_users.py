@@ -0,0 +1,77 @@
+import csv
+import json
+import sys
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .import_users import detect_format
+
+
+# 与import_users的列一致，导出的文件可以直接重新导入（密码以哈希形式原样迁移）
+EXPORT_COLUMNS = (
+    'username', 'email', 'first_name', 'last_name', 'is_staff', 'password_hash',
+    'bio', 'phone_number', 'location', 'birth_date',
+)
+_QUERY_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'is_staff', 'password',
+    'userprofile__bio', 'userprofile__phone_number', 'userprofile__location', 'userprofile__birth_date',
+)
+
+
+def iter_export_rows(chunk_size):
+    """
+    按主键游标分块读取用户及资料，只取导出需要的列，不生成头像URL
+    """
+    after = 0
+    while True:
+        rows = list(
+            User.objects.filter(id__gt=after).order_by('id').values_list(*_QUERY_FIELDS)[:chunk_size]
+        )
+        for row in rows:
+            yield dict(zip(EXPORT_COLUMNS, row[1:]))
+        if len(rows) < chunk_size:
+            return
+        after = rows[-1][0]
+
+
+class Command(BaseCommand):
+    help = '将用户及资料流式导出为CSV或NDJSON，按主键分块查询，内存占用与用户总数无关'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', '-o', default='-', help="输出文件路径，默认 '-' 表示标准输出")
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='文件格式，默认按扩展名判断（.ndjson/.jsonl 为NDJSON，其余为CSV）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每次查询的行数')
+
+    def handle(self, *args, **options):
+        path = options['output']
+        fmt = detect_format(path, options['format'])
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size 必须大于0')
+
+        try:
+            stream = sys.stdout if path == '-' else open(path, 'w', encoding='utf-8', newline='')
+        except OSError as e:
+            raise CommandError(f'无法打开文件: {e}')
+
+        count = 0
+        try:
+            if fmt == 'csv':
+                writer = csv.DictWriter(stream, fieldnames=EXPORT_COLUMNS)
+                writer.writeheader()
+                write = writer.writerow
+            else:
+                def write(row):
+                    stream.write(json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n')
+
+            for row in iter_export_rows(options['batch_size']):
+                write(row)
+                count += 1
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+
+        # 输出到标准输出时，统计信息写到标准错误，避免混入导出数据
+        message = self.style.SUCCESS(f'已导出 {count} 个用户')
+        (self.stderr if stream is sys.stdout else self.stdout).write(message)
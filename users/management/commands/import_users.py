@@ -0,0 +1,143 @@
+import csv
+import io
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+from pydantic import ValidationError
+
+from users.pydantic_schemas import UserImportRow
+from users.services import bulk_create_users
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    return 'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv'
+
+
+def _read_csv(stream):
+    # 空单元格视为未填写
+    for line_no, row in enumerate(csv.DictReader(stream), start=2):
+        yield line_no, {key: value for key, value in row.items() if key and value != ''}
+
+
+def _read_ndjson(stream):
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_no, e
+            continue
+        if not isinstance(row, dict):
+            yield line_no, ValueError('每行必须是一个JSON对象')
+            continue
+        yield line_no, {key: value for key, value in row.items() if value not in ('', None)}
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+class Command(BaseCommand):
+    help = (
+        '从CSV或NDJSON文件批量导入用户及资料。逐行流式读取，每批先用IN查询一次性检查用户名/邮箱冲突，'
+        '密码哈希分发到进程池计算，再在一个短事务中bulk_create用户和资料（不触发post_save信号）。'
+        '列：username, email, first_name, last_name, is_staff, password 或 password_hash, '
+        'bio, phone_number, location, birth_date'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="输入文件路径，'-' 表示标准输入")
+        parser.add_argument('--format', choices=('csv', 'ndjson'), help='文件格式，默认按扩展名判断（.ndjson/.jsonl 为NDJSON，其余为CSV）')
+        parser.add_argument('--batch-size', type=int, default=1000, help='每批导入的行数')
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='计算密码哈希的进程数，1表示在当前进程计算')
+        parser.add_argument('--dry-run', action='store_true', help='只校验数据，不写入数据库')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = detect_format(path, options['format'])
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size 必须大于0')
+
+        if path == '-':
+            stream = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8-sig', newline='')
+        else:
+            try:
+                stream = open(path, encoding='utf-8-sig', newline='')
+            except OSError as e:
+                raise CommandError(f'无法打开文件: {e}')
+
+        self.workers = max(1, options['workers'])
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 and not options['dry_run'] else None
+        self.created = self.skipped = 0
+        try:
+            rows = _read_ndjson(stream) if fmt == 'ndjson' else _read_csv(stream)
+            for batch in _batches(rows, options['batch_size']):
+                self.import_batch(batch, pool, options['dry_run'])
+        finally:
+            stream.close()
+            if pool is not None:
+                pool.shutdown()
+
+        action = '校验通过' if options['dry_run'] else '导入'
+        self.stdout.write(self.style.SUCCESS(f'{action} {self.created} 个用户，跳过 {self.skipped} 行'))
+
+    def import_batch(self, batch, pool, dry_run):
+        """
+        校验一批数据并批量写入，不合法或冲突的行输出原因后跳过
+        """
+        line_numbers, items = [], []
+        for line_no, row in batch:
+            if isinstance(row, Exception):
+                self.skip(line_no, f'无法解析: {row}')
+                continue
+            try:
+                item = UserImportRow.model_validate(row)
+            except ValidationError as e:
+                errors = '; '.join(f"{'.'.join(map(str, error['loc']))}: {error['msg']}" for error in e.errors())
+                self.skip(line_no, errors)
+                continue
+            line_numbers.append(line_no)
+            items.append(item.model_dump())
+
+        if not items:
+            return
+        if dry_run:
+            self.created += len(items)
+            return
+
+        def hash_passwords(passwords):
+            if pool is None:
+                return [make_password(password) for password in passwords]
+            chunk_size = max(1, len(passwords) // (self.workers * 4))
+            return list(pool.map(make_password, passwords, chunksize=chunk_size))
+
+        try:
+            results = bulk_create_users(items, hash_passwords)
+        except IntegrityError:
+            # 检查之后有并发写入了相同的用户名，整批已回滚，重新检查后再试一次
+            results = bulk_create_users(items, hash_passwords)
+
+        for line_no, result in zip(line_numbers, results):
+            if 'error' in result:
+                self.skip(line_no, result['error'])
+            else:
+                self.created += 1
+
+    def skip(self, line_no, reason):
+        self.skipped += 1
+        self.stderr.write(f'第 {line_no} 行已跳过: {reason}')
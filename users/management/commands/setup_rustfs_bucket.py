@@ -1,28 +1,19 @@
-import boto3
 from botocore.exceptions import ClientError
 from django.conf import settings
 from django.core.management.base import BaseCommand
 
+from users.storage import get_rustfs_client
+
 
 class Command(BaseCommand):
-    help = '确保RustFS上的avatars bucket存在'
+    help = '确保RustFS上的avatars bucket存在，并配置浏览器直传所需的CORS和清理未完成分片上传的生命周期规则'
 
     def handle(self, *args, **options):
-        # 从settings获取RustFS配置
-        access_key = getattr(settings, 'RUSTFS_ACCESS_KEY', 'rustfsadmin')
-        secret_key = getattr(settings, 'RUSTFS_SECRET_KEY', 'rustfsadmin123')
-        endpoint_url = getattr(settings, 'RUSTFS_ENDPOINT_URL', 'http://rustfs:9000')
         bucket_name = getattr(settings, 'RUSTFS_BUCKET_NAME', 'user-avatars')
         region_name = getattr(settings, 'RUSTFS_REGION_NAME', 'us-east-1')
 
-        # 创建S3客户端
-        s3_client = boto3.client(
-            's3',
-            endpoint_url=endpoint_url,
-            aws_access_key_id=access_key,
-            aws_secret_access_key=secret_key,
-            region_name=region_name
-        )
+        # 使用与存储后端共享的S3客户端
+        s3_client = get_rustfs_client()
 
         # 尝试创建bucket（如果不存在）
         try:
@@ -46,7 +37,47 @@ class Command(BaseCommand):
                     self.stdout.write(
                         self.style.ERROR(f'创建bucket失败: {create_error}')
                     )
+                    return
             else:
                 self.stdout.write(
                     self.style.ERROR(f'检查bucket时出错: {e}')
-                )
\ No newline at end of file
+                )
+                return
+
+        self._configure_direct_upload(s3_client, bucket_name)
+
+    def _configure_direct_upload(self, s3_client, bucket_name):
+        # 浏览器分片直传需要从PUT响应头中读取ETag
+        if getattr(settings, 'CORS_ALLOW_ALL_ORIGINS', False):
+            origins = ['*']
+        else:
+            origins = list(getattr(settings, 'CORS_ALLOWED_ORIGINS', []))
+        try:
+            s3_client.put_bucket_cors(
+                Bucket=bucket_name,
+                CORSConfiguration={'CORSRules': [{
+                    'AllowedOrigins': origins,
+                    'AllowedMethods': ['GET', 'POST', 'PUT'],
+                    'AllowedHeaders': ['*'],
+                    'ExposeHeaders': ['ETag'],
+                }]}
+            )
+            self.stdout.write(self.style.SUCCESS(f'已配置bucket {bucket_name} 的CORS'))
+        except ClientError as e:
+            self.stdout.write(self.style.WARNING(f'配置CORS失败: {e}'))
+
+        # 浏览器中断或放弃直传时残留的分片，超过期限后由对象存储清理
+        days = getattr(settings, 'AVATAR_MULTIPART_ABORT_DAYS', 1)
+        try:
+            s3_client.put_bucket_lifecycle_configuration(
+                Bucket=bucket_name,
+                LifecycleConfiguration={'Rules': [{
+                    'ID': 'abort-incomplete-avatar-uploads',
+                    'Filter': {'Prefix': 'avatars/uploads/'},
+                    'Status': 'Enabled',
+                    'AbortIncompleteMultipartUpload': {'DaysAfterInitiation': days},
+                }]}
+            )
+            self.stdout.write(self.style.SUCCESS(f'未完成的头像分片上传将在 {days} 天后清理'))
+        except ClientError as e:
+            self.stdout.write(self.style.WARNING(f'配置生命周期规则失败: {e}'))
\ No newline at end of file
@@ -0,0 +1,40 @@
+# Generated by Django 2.2 on 2026-10-18 15:20
+
+from django.db import migrations, models
+import users.models
+import users.storage
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='renditions',
+            field=users.models.JSONTextField(blank=True, null=True, verbose_name='头像多尺寸版本'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='avatar',
+            field=models.ImageField(blank=True, null=True, storage=users.storage.RustFSStorage(), upload_to='avatars/', verbose_name='头像'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='bio',
+            field=models.TextField(blank=True, max_length=500, null=True, verbose_name='个人简介'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='location',
+            field=models.CharField(blank=True, max_length=30, null=True, verbose_name='位置'),
+        ),
+        migrations.AlterField(
+            model_name='userprofile',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, storage=users.storage.RustFSStorage(), upload_to='avatars/thumbnails/', verbose_name='头像缩略图'),
+        ),
+    ]
@@ -1,3 +1,6 @@
+import copy
+import json
+
 from django.db import models
 from django.contrib.auth.models import User
 from django.db.models.signals import post_save
@@ -5,7 +8,117 @@ from django.dispatch import receiver
 from .storage import RustFSStorage
 
 
-class UserProfile(models.Model):
+class JSONTextField(models.TextField):
+    """
+    以JSON文本保存的字段（Django 2.2只有PostgreSQL提供JSONField）
+    """
+    def from_db_value(self, value, expression, connection):
+        if value is None or value == '':
+            return None
+        return json.loads(value)
+
+    def to_python(self, value):
+        if isinstance(value, str):
+            return json.loads(value) if value else None
+        return value
+
+    def get_prep_value(self, value):
+        if value is None:
+            return None
+        return json.dumps(value, sort_keys=True)
+
+    def value_to_string(self, obj):
+        return self.get_prep_value(self.value_from_object(obj))
+
+
+class DirtyFieldsMixin:
+    """
+    记录模型实例从数据库加载时的字段值，保存已有记录时只写入发生变化的列，
+    无需再次查询数据库来判断哪些字段被修改
+    """
+    _loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None):
+        super().refresh_from_db(using=using, fields=fields)
+        self._take_snapshot(fields)
+
+    def get_dirty_fields(self):
+        """
+        返回自加载（或上次保存）以来发生变化的字段名列表
+        """
+        if self._loaded_values is None:
+            return [field.name for field in self._meta.concrete_fields if not field.primary_key]
+        
+        dirty_fields = []
+        for field in self._meta.concrete_fields:
+            # 主键和未加载（deferred）的字段不参与比较
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if field.attname not in self._loaded_values:
+                dirty_fields.append(field.name)
+                continue
+            value = getattr(self, field.attname)
+            if isinstance(value, models.fields.files.FieldFile) and value and not value._committed:
+                # 新上传但尚未写入存储的文件
+                dirty_fields.append(field.name)
+            elif self._comparable_value(field) != self._loaded_values[field.attname]:
+                dirty_fields.append(field.name)
+        return dirty_fields
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        is_update = self._loaded_values is not None and not self._state.adding and not force_insert
+        dirty_fields = self.get_dirty_fields()
+        
+        if is_update and update_fields is None:
+            # 只更新变化的列，没有变化时Django会直接跳过保存
+            update_fields = dirty_fields
+        
+        if update_fields is None:
+            self._changed_fields = set(dirty_fields)
+        else:
+            self._changed_fields = set(dirty_fields).intersection(update_fields)
+        
+        super().save(
+            force_insert=force_insert,
+            force_update=force_update,
+            using=using,
+            update_fields=update_fields
+        )
+        self._take_snapshot(update_fields)
+
+    def _take_snapshot(self, field_names=None):
+        """
+        记录当前字段值，field_names为None时记录所有已加载的字段
+        """
+        if self._loaded_values is None or field_names is None:
+            self._loaded_values = {}
+        names = set(field_names) if field_names is not None else None
+        
+        for field in self._meta.concrete_fields:
+            if field.primary_key or field.attname not in self.__dict__:
+                continue
+            if names is not None and field.name not in names and field.attname not in names:
+                continue
+            self._loaded_values[field.attname] = self._comparable_value(field)
+
+    def _comparable_value(self, field):
+        value = getattr(self, field.attname)
+        if isinstance(field, models.FileField):
+            # 文件字段只比较存储中的文件名
+            return (value.name or None) if value is not None else None
+        if isinstance(value, (dict, list)):
+            # 可变值保存副本，原地修改后仍能被识别为变化
+            return copy.deepcopy(value)
+        return value
+
+
+class UserProfile(DirtyFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, verbose_name='用户')
     phone_number = models.CharField(max_length=20, blank=True, null=True, verbose_name='手机号')
     avatar = models.ImageField(storage=RustFSStorage(), upload_to='avatars/', blank=True, null=True, verbose_name='头像')
@@ -13,6 +126,8 @@ class UserProfile(models.Model):
     bio = models.TextField(max_length=500, blank=True, null=True, verbose_name='个人简介')
     location = models.CharField(max_length=30, blank=True, null=True, verbose_name='位置')
     birth_date = models.DateField(null=True, blank=True, verbose_name='生日')
+    # 头像的多尺寸、多格式版本：{"尺寸": {"格式": 对象key}}
+    renditions = JSONTextField(blank=True, null=True, verbose_name='头像多尺寸版本')
 
     class Meta:
         verbose_name = '用户简介'
@@ -21,6 +136,13 @@ class UserProfile(models.Model):
     def __str__(self):
         return f'{self.user.username}的简介'
 
+    @property
+    def avatar_changed(self):
+        """
+        最近一次保存是否写入了新的头像
+        """
+        return 'avatar' in getattr(self, '_changed_fields', ()) and bool(self.avatar)
+
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -35,9 +157,8 @@ def create_user_profile(sender, instance, created, **kwargs):
 def save_user_profile(sender, instance, **kwargs):
     """
     当用户信息保存时，同时保存用户简介
+    只处理已经加载到用户实例上的简介，未加载时不会额外查询数据库；
+    简介没有变化时保存会被跳过
     """
-    try:
+    if User.userprofile.related.is_cached(instance):
         instance.userprofile.save()
-    except UserProfile.DoesNotExist:
-        # 如果用户简介不存在，则创建一个
-        UserProfile.objects.create(user=instance)
\ No newline at end of file
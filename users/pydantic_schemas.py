@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional
+from pydantic import BaseModel, EmailStr, Field, TypeAdapter
+from typing import Optional, List, Dict, Any, Iterable
 from datetime import date, datetime
 
 
@@ -10,6 +10,8 @@ class UserProfileBase(BaseModel):
     birth_date: Optional[date] = None
     avatar: Optional[str] = None
     thumbnail: Optional[str] = None
+    # 头像的各尺寸版本：{"尺寸": {"格式": url}}
+    renditions: Optional[Dict[str, Dict[str, Optional[str]]]] = None
 
 
 class UserProfileSchema(UserProfileBase):
@@ -46,4 +48,98 @@ class UserSchema(UserBase):
     userprofile: Optional[UserProfileSchema] = None
 
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+
+class UserImportRow(UserBase):
+    """
+    批量导入的一行数据
+    password为明文密码；password_hash为已有的Django密码哈希（如export_users导出的），导入时原样保存；
+    两者都为空时用户无法使用密码登录
+    """
+    username: str = Field(min_length=1, max_length=150)
+    first_name: Optional[str] = Field(default=None, max_length=30)
+    last_name: Optional[str] = Field(default=None, max_length=150)
+    password: Optional[str] = None
+    password_hash: Optional[str] = Field(default=None, max_length=128)
+    bio: Optional[str] = Field(default=None, max_length=500)
+    phone_number: Optional[str] = Field(default=None, max_length=20)
+    location: Optional[str] = Field(default=None, max_length=30)
+    birth_date: Optional[date] = None
+
+
+class AvatarUploadRequest(BaseModel):
+    content_type: str
+    size: int
+
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class AvatarUploadComplete(BaseModel):
+    key: str
+    upload_id: Optional[str] = None
+    parts: Optional[List[UploadedPart]] = None
+
+
+class AvatarUploadAbort(BaseModel):
+    key: str
+    upload_id: str
+
+
+class UserPageSchema(BaseModel):
+    results: List[UserSchema]
+    next: Optional[int] = None
+
+
+# 以下函数用于序列化从数据库读取的可信数据：
+# 跳过Pydantic的校验（包括EmailStr解析），直接构造模型并输出JSON字节串，
+# 请求数据仍然通过 UserCreate/UserUpdate 等模型完整校验
+
+_user_list_adapter = TypeAdapter(List[UserSchema])
+
+
+def construct_profile(profile_dict: Optional[Dict[str, Any]]) -> Optional[UserProfileSchema]:
+    """
+    不经校验地由资料字典构造UserProfileSchema
+    """
+    if profile_dict is None:
+        return None
+    return UserProfileSchema.model_construct(**profile_dict)
+
+
+def construct_user(user_dict: Dict[str, Any]) -> UserSchema:
+    """
+    不经校验地由用户字典构造UserSchema
+    """
+    return UserSchema.model_construct(**{
+        **user_dict,
+        'userprofile': construct_profile(user_dict.get('userprofile'))
+    })
+
+
+def dump_user_json(user_dict: Dict[str, Any]) -> bytes:
+    """
+    将单个用户字典序列化为JSON字节串
+    """
+    return construct_user(user_dict).model_dump_json().encode()
+
+
+def dump_users_json(user_dicts: Iterable[Dict[str, Any]]) -> bytes:
+    """
+    将用户字典列表序列化为JSON数组字节串
+    """
+    return _user_list_adapter.dump_json([construct_user(user_dict) for user_dict in user_dicts])
+
+
+def dump_user_page_json(user_dicts: Iterable[Dict[str, Any]], next_cursor: Optional[int]) -> bytes:
+    """
+    将一页用户及下一页游标序列化为JSON字节串
+    """
+    page = UserPageSchema.model_construct(
+        results=[construct_user(user_dict) for user_dict in user_dicts],
+        next=next_cursor
+    )
+    return page.model_dump_json().encode()
@@ -1,53 +1,202 @@
+import asyncio
+import math
+import uuid
+
+from botocore.exceptions import ClientError
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
 from django.core.exceptions import ValidationError as DjangoValidationError
 from django.db import transaction
+from django.utils import timezone
+from myproject.aio import run_sync
+from myproject.db.routers import read_only
 from .models import UserProfile
-from typing import Optional, Dict, Any
+from .cache import get_cached_user, invalidate_user_cache
+from typing import Optional, Dict, Any, List, Callable
 from .exceptions import (
     UserNotFoundException, UsernameExistsException, EmailExistsException,
     InvalidUserDataException, ProfileNotFoundException, InvalidProfileDataException
 )
 
 
+# 用户列表/详情所需的列，通过 auth_user LEFT JOIN users_userprofile 一次查询取出
+USER_ROW_FIELDS = (
+    'id', 'username', 'email', 'first_name', 'last_name', 'date_joined', 'is_staff',
+    'userprofile__id', 'userprofile__bio', 'userprofile__phone_number', 'userprofile__location',
+    'userprofile__birth_date', 'userprofile__avatar', 'userprofile__thumbnail', 'userprofile__renditions',
+)
+
+
+def _user_rows(users):
+    """
+    只查询需要的列，每行返回一个轻量的命名元组而不是模型实例
+    """
+    return users.values_list(*USER_ROW_FIELDS, named=True)
+
+
+def _rendition_keys(renditions):
+    return [key for formats in (renditions or {}).values() for key in formats.values()]
+
+
+def _row_url_groups(rows):
+    """
+    返回一批用户行中需要签名的文件 {字段名: (存储, 文件名列表)}
+    各尺寸版本与头像保存在同一个bucket中
+    """
+    groups = {}
+    for field_name in ('avatar', 'thumbnail'):
+        storage = UserProfile._meta.get_field(field_name).storage
+        names = [getattr(row, f'userprofile__{field_name}') for row in rows]
+        groups[field_name] = (storage, [name for name in names if name])
+    
+    storage = UserProfile._meta.get_field('avatar').storage
+    groups['renditions'] = (storage, [key for row in rows for key in _rendition_keys(row.userprofile__renditions)])
+    return groups
+
+
+def _sign_row_urls(rows):
+    """
+    为一批用户行的头像、缩略图及各尺寸版本一次性生成预签名URL
+    返回 {字段名: {文件名: url}}
+    """
+    return {
+        field_name: storage.urls_for(names) if names else {}
+        for field_name, (storage, names) in _row_url_groups(rows).items()
+    }
+
+
+def _signed_renditions(renditions, signed_urls):
+    """
+    将 {尺寸: {格式: 对象key}} 转换为 {尺寸: {格式: url}}
+    """
+    if not renditions:
+        return None
+    return {
+        size: {image_format: signed_urls['renditions'].get(key) for image_format, key in formats.items()}
+        for size, formats in renditions.items()
+    }
+
+
+def _row_to_user_dict(row, signed_urls):
+    """
+    将查询行转换为用户字典
+    """
+    profile_dict = None
+    if row.userprofile__id is not None:
+        profile_dict = {
+            'id': row.userprofile__id,
+            'bio': row.userprofile__bio,
+            'phone_number': row.userprofile__phone_number,
+            'location': row.userprofile__location,
+            'birth_date': row.userprofile__birth_date,
+            'avatar': signed_urls['avatar'].get(row.userprofile__avatar) if row.userprofile__avatar else None,
+            'thumbnail': signed_urls['thumbnail'].get(row.userprofile__thumbnail) if row.userprofile__thumbnail else None,
+            'renditions': _signed_renditions(row.userprofile__renditions, signed_urls),
+            'user_id': row.id
+        }
+    
+    return {
+        'id': row.id,
+        'username': row.username,
+        'email': row.email,
+        'first_name': row.first_name,
+        'last_name': row.last_name,
+        'date_joined': row.date_joined,
+        'is_staff': row.is_staff,
+        'userprofile': profile_dict
+    }
+
+
+def _rows_to_user_dicts(rows):
+    """
+    批量将查询行转换为用户字典，整批用户的头像URL一次性签名
+    """
+    signed_urls = _sign_row_urls(rows)
+    return [_row_to_user_dict(row, signed_urls) for row in rows]
+
+
+@read_only
 def get_all_users_with_profiles():
     """
     获取所有用户及其资料
     """
-    users = User.objects.prefetch_related('userprofile').all()
-    users_data = []
-    
-    for user in users:
-        user_dict = {
-            'id': user.id,
-            'username': user.username,
-            'email': user.email,
-            'first_name': user.first_name,
-            'last_name': user.last_name,
-            'date_joined': user.date_joined,
-            'is_staff': user.is_staff,
-            'userprofile': None
-        }
-        
-        # 添加用户资料
-        try:
-            profile = user.userprofile
-            profile_dict = {
-                'id': profile.id,
-                'bio': profile.bio,
-                'phone_number': profile.phone_number,
-                'location': profile.location,
-                'birth_date': profile.birth_date,
-                'avatar': profile.avatar.url if profile.avatar else None,
-                'thumbnail': profile.thumbnail.url if profile.thumbnail else None,
-                'user_id': profile.user_id
-            }
-            user_dict['userprofile'] = profile_dict
-        except UserProfile.DoesNotExist:
-            pass
-        
-        users_data.append(user_dict)
+    return _rows_to_user_dicts(list(_user_rows(User.objects.all())))
+
+
+@read_only
+def get_users_page(limit: int, after: Optional[int] = None):
+    """
+    基于主键游标（keyset）分页获取用户及其资料
+    返回 (当前页用户数据, 下一页游标)，没有更多数据时游标为None
+    """
+    users = User.objects.order_by('id')
+    if after is not None:
+        users = users.filter(id__gt=after)
+    
+    # 多取一条用于判断是否还有下一页
+    page = list(_user_rows(users)[:limit + 1])
+    has_more = len(page) > limit
+    page = page[:limit]
+    
+    next_cursor = page[-1].id if has_more else None
+    return _rows_to_user_dicts(page), next_cursor
+
+
+@read_only
+def _fetch_user_rows(users, limit=None):
+    rows = _user_rows(users)
+    return list(rows[:limit] if limit is not None else rows)
+
+
+async def _async_rows_to_user_dicts(rows):
+    """
+    _rows_to_user_dicts的异步版本：头像、缩略图和各尺寸版本的签名在线程池中并发执行
+    """
+    async def sign(storage, names):
+        return await run_sync(storage.urls_for, names) if names else {}
+    
+    groups = _row_url_groups(rows)
+    signed = await asyncio.gather(*(sign(storage, names) for storage, names in groups.values()))
+    signed_urls = dict(zip(groups, signed))
+    return [_row_to_user_dict(row, signed_urls) for row in rows]
+
+
+async def async_get_all_users_with_profiles():
+    """
+    get_all_users_with_profiles的异步版本
+    """
+    rows = await run_sync(_fetch_user_rows, User.objects.all())
+    return await _async_rows_to_user_dicts(rows)
+
+
+async def async_get_users_page(limit: int, after: Optional[int] = None):
+    """
+    get_users_page的异步版本
+    """
+    users = User.objects.order_by('id')
+    if after is not None:
+        users = users.filter(id__gt=after)
+    
+    page = await run_sync(_fetch_user_rows, users, limit + 1)
+    has_more = len(page) > limit
+    page = page[:limit]
     
-    return users_data
+    next_cursor = page[-1].id if has_more else None
+    return await _async_rows_to_user_dicts(page), next_cursor
+
+
+def iter_users_with_profiles(chunk_size: int = 500):
+    """
+    按游标分块遍历所有用户及其资料
+    MySQL后端的iterator()仍会在客户端缓存完整结果集，因此这里逐页查询以保持内存占用平稳
+    """
+    after = None
+    while True:
+        users_data, after = get_users_page(chunk_size, after)
+        yield from users_data
+        if after is None:
+            break
 
 
 def create_user(username: str, email: Optional[str], first_name: Optional[str], 
@@ -79,43 +228,234 @@ def create_user(username: str, email: Optional[str], first_name: Optional[str],
         return user
 
 
-def get_user_with_profile(user_id: int):
+# 批量创建时写入用户资料的字段
+PROFILE_FIELDS = ('bio', 'phone_number', 'location', 'birth_date')
+
+
+def _hash_passwords(passwords):
+    return [make_password(password) for password in passwords]
+
+
+class _UniqueClaims:
     """
-    根据ID获取特定用户及其资料
+    一批操作中用户名/邮箱的占用情况
+    数据库中已有的值各用一次IN查询取出，之后在内存中判断冲突；批内先出现的条目优先占用
     """
-    try:
-        user = User.objects.prefetch_related('userprofile').get(pk=user_id)
-    except User.DoesNotExist:
-        raise UserNotFoundException(f"用户ID {user_id} 不存在")
+    def __init__(self, usernames, emails):
+        self.usernames = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+        # 数据库没有约束邮箱唯一，同一邮箱可能对应多个用户
+        self.emails = {}
+        if emails:
+            for email, user_id in User.objects.filter(email__in=emails).values_list('email', 'id'):
+                self.emails.setdefault(email, set()).add(user_id)
+
+    def claim(self, owner, username=None, email=None):
+        """
+        为owner（已有用户的ID，或代表一个新建条目的键）占用用户名和邮箱
+        与其他用户冲突时返回对应的异常，不占用任何值
+        """
+        if username is not None and self.usernames.get(username, owner) != owner:
+            return UsernameExistsException(f"用户名 '{username}' 已存在")
+        if email and self.emails.get(email, {owner}) - {owner}:
+            return EmailExistsException(f"邮箱 '{email}' 已被使用")
+        if username is not None:
+            self.usernames[username] = owner
+        if email:
+            self.emails.setdefault(email, set()).add(owner)
+        return None
+
+    def release(self, owner):
+        """
+        释放owner占用的用户名和邮箱（用户在批内被删除后，之后的条目可以使用）
+        """
+        self.usernames = {username: holder for username, holder in self.usernames.items() if holder != owner}
+        for holders in self.emails.values():
+            holders.discard(owner)
+
+
+def _build_users(items, hash_passwords=None):
+    """
+    构造待插入的用户实例，应在事务外调用
+    已有password_hash的条目原样保存，其余计算密码哈希，没有明文密码时生成不可用的密码
+    """
+    to_hash = [index for index, item in enumerate(items) if not item.get('password_hash')]
+    hashes = dict(zip(to_hash, (hash_passwords or _hash_passwords)([items[index].get('password') for index in to_hash])))
     
-    user_dict = {
-        'id': user.id,
-        'username': user.username,
-        'email': user.email,
-        'first_name': user.first_name,
-        'last_name': user.last_name,
-        'date_joined': user.date_joined,
-        'is_staff': user.is_staff,
-        'userprofile': None
-    }
+    now = timezone.now()
+    return [
+        User(
+            username=item['username'],
+            email=item.get('email') or '',
+            first_name=item.get('first_name') or '',
+            last_name=item.get('last_name') or '',
+            password=hashes.get(index) or item['password_hash'],
+            is_staff=item.get('is_staff', False),
+            date_joined=now
+        )
+        for index, item in enumerate(items)
+    ]
+
+
+def _insert_users(users, items):
+    """
+    批量插入用户及其资料，返回与items对应的用户ID列表
+    """
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        # MySQL上bulk_create不会回填主键，按用户名取回
+        user_ids = dict(User.objects.filter(username__in=[user.username for user in users])
+                        .values_list('username', 'id'))
+        UserProfile.objects.bulk_create([
+            UserProfile(user_id=user_ids[item['username']], **{field: item.get(field) for field in PROFILE_FIELDS})
+            for item in items
+        ])
+        # bulk_create不触发post_save信号，清除这些ID上缓存的“不存在”结果
+        for user_id in user_ids.values():
+            invalidate_user_cache(user_id)
+    return [user_ids[item['username']] for item in items]
+
+
+def bulk_create_users(items: List[Dict[str, Any]],
+                      hash_passwords: Optional[Callable[[List[Optional[str]]], List[str]]] = None):
+    """
+    批量创建用户及其资料，items为已校验的字典列表（键与UserImportRow一致）
+    返回与items一一对应的结果：成功为 {'id': 用户ID}，冲突为 {'error': 异常}
+
+    - 用户名/邮箱冲突用两次IN查询一次性检查，批内重复的条目同样视为冲突
+    - hash_passwords 可以将密码哈希分发到进程池计算
+    - 用户和资料各一次bulk_create，不触发post_save信号，也不会逐条再保存资料
+    - 检查与写入之间若有并发写入了相同的用户名，bulk_create抛出IntegrityError，整批回滚，由调用方决定是否重试
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(items)
+    claims = _UniqueClaims({item['username'] for item in items},
+                           {item['email'] for item in items if item.get('email')})
     
-    try:
-        profile = user.userprofile
-        profile_dict = {
-            'id': profile.id,
-            'bio': profile.bio,
-            'phone_number': profile.phone_number,
-            'location': profile.location,
-            'birth_date': profile.birth_date,
-            'avatar': profile.avatar.url if profile.avatar else None,
-            'thumbnail': profile.thumbnail.url if profile.thumbnail else None,
-            'user_id': profile.user_id
-        }
-        user_dict['userprofile'] = profile_dict
-    except UserProfile.DoesNotExist:
-        pass
+    accepted = []
+    for index, item in enumerate(items):
+        error = claims.claim(('new', index), item['username'], item.get('email'))
+        if error is not None:
+            results[index] = {'error': error}
+        else:
+            accepted.append(index)
     
-    return user_dict
+    if accepted:
+        accepted_items = [items[index] for index in accepted]
+        user_ids = _insert_users(_build_users(accepted_items, hash_passwords), accepted_items)
+        for index, user_id in zip(accepted, user_ids):
+            results[index] = {'id': user_id}
+    return results
+
+
+# 批量接口中更新用户时可以修改的字段
+BATCH_UPDATE_FIELDS = ('username', 'email', 'first_name', 'last_name', 'password')
+
+
+def apply_user_batch(operations: List[Dict[str, Any]]):
+    """
+    在一个事务中批量创建、更新和删除用户
+    operations中每项为 {'op': 'create'|'update'|'delete', 'id': 用户ID, 'data': 已校验的字段}，
+    返回与之一一对应的结果：成功为 {'id': 用户ID}，失败为 {'error': 业务异常}
+
+    - 更新/删除的目标用户一次查询取出，用户名/邮箱冲突各一次IN查询检查（见_UniqueClaims）
+    - 按条目顺序检查冲突：删除的用户释放其用户名和邮箱，之后的条目可以使用
+    - 同一用户在一批中只能被成功操作一次，失败的条目不影响其他条目
+    - 依次执行删除（一次按ID的delete）、更新（bulk_update）和创建（bulk_create），
+      先删除再创建，批内复用被删除用户的用户名不会违反唯一约束
+    """
+    results: List[Optional[Dict[str, Any]]] = [None] * len(operations)
+    target_ids = {operation['id'] for operation in operations if operation['op'] != 'create'}
+    targets = User.objects.in_bulk(target_ids) if target_ids else {}
+    claims = _UniqueClaims(
+        {operation['data']['username'] for operation in operations
+         if operation['op'] != 'delete' and operation['data'].get('username') is not None},
+        {operation['data']['email'] for operation in operations
+         if operation['op'] != 'delete' and operation['data'].get('email')}
+    )
+    
+    creates, updates, deletes = [], [], []
+    seen_ids = set()
+    for index, operation in enumerate(operations):
+        op, user_id, data = operation['op'], operation.get('id'), operation.get('data') or {}
+        if op == 'create':
+            error = claims.claim(('new', index), data['username'], data.get('email'))
+            if error is None:
+                creates.append(index)
+        elif user_id not in targets:
+            error = UserNotFoundException(f"用户ID {user_id} 不存在")
+        elif user_id in seen_ids:
+            error = InvalidUserDataException(f"用户ID {user_id} 在同一批次中重复出现")
+        elif op == 'update':
+            error = claims.claim(user_id, data.get('username'), data.get('email'))
+            if error is None:
+                updates.append(index)
+        else:
+            error = None
+            claims.release(user_id)
+            deletes.append(index)
+        
+        if error is not None:
+            results[index] = {'error': error}
+        elif user_id is not None:
+            seen_ids.add(user_id)
+    
+    # 密码哈希在事务外计算
+    create_items = [operations[index]['data'] for index in creates]
+    created_users = _build_users(create_items) if creates else []
+    
+    # 更新的字段与update_user一致：None表示不修改，空密码不修改
+    updated_users, update_fields = [], set()
+    for index in updates:
+        data = operations[index]['data']
+        user = targets[operations[index]['id']]
+        for field in BATCH_UPDATE_FIELDS:
+            value = data.get(field)
+            if value is None or (field == 'password' and value == ''):
+                continue
+            if field == 'password':
+                user.set_password(value)
+            else:
+                setattr(user, field, value)
+            update_fields.add(field)
+        updated_users.append(user)
+    
+    with transaction.atomic():
+        if deletes:
+            # 删除会逐个发送post_delete信号，缓存由信号处理
+            User.objects.filter(pk__in=[operations[index]['id'] for index in deletes]).delete()
+        
+        if updated_users and update_fields:
+            User.objects.bulk_update(updated_users, sorted(update_fields))
+            # bulk_update不触发post_save信号，自行使缓存失效
+            for user in updated_users:
+                invalidate_user_cache(user.pk)
+        
+        if creates:
+            user_ids = _insert_users(created_users, create_items)
+            for index, user_id in zip(creates, user_ids):
+                results[index] = {'id': user_id}
+    
+    for index in updates + deletes:
+        results[index] = {'id': operations[index]['id']}
+    return results
+
+
+def get_user_with_profile(user_id: int):
+    """
+    根据ID获取特定用户及其资料（优先从缓存读取）
+    """
+    return get_cached_user(user_id, lambda: _load_user_with_profile(user_id))
+
+
+def _load_user_with_profile(user_id: int):
+    """
+    从数据库加载特定用户及其资料
+    结果会写入缓存，因此始终读取主库，避免把副本上尚未同步的旧数据缓存起来
+    """
+    rows = list(_user_rows(User.objects.filter(pk=user_id)))
+    if not rows:
+        raise UserNotFoundException(f"用户ID {user_id} 不存在")
+    
+    return _rows_to_user_dicts(rows)[0]
 
 
 def update_user(user_id: int, username: Optional[str] = None, email: Optional[str] = None, 
@@ -204,4 +544,103 @@ def update_user_profile(user_id: int, profile_data: Dict[str, Any], files=None):
     except User.DoesNotExist:
         raise UserNotFoundException(f"用户ID {user_id} 不存在")
     except Exception as e:
-        raise InvalidProfileDataException(f"更新用户资料失败: {str(e)}")
\ No newline at end of file
+        raise InvalidProfileDataException(f"更新用户资料失败: {str(e)}")
+
+
+# 允许直传的头像格式及对应的文件扩展名
+AVATAR_CONTENT_TYPES = {
+    'image/jpeg': '.jpg',
+    'image/png': '.png',
+    'image/gif': '.gif',
+    'image/webp': '.webp',
+}
+
+
+def _avatar_upload_prefix(user_id: int):
+    return f'avatars/uploads/{user_id}/'
+
+
+def create_avatar_upload(user_id: int, content_type: str, size: int):
+    """
+    为浏览器直传头像到RustFS生成上传地址
+    小文件使用预签名POST表单，大文件使用可并行上传的分片
+    """
+    if not User.objects.filter(pk=user_id).exists():
+        raise UserNotFoundException(f"用户ID {user_id} 不存在")
+    
+    if content_type not in AVATAR_CONTENT_TYPES:
+        raise InvalidProfileDataException(f"不支持的头像格式: {content_type}")
+    
+    max_bytes = settings.AVATAR_MAX_SOURCE_BYTES
+    if size <= 0 or size > max_bytes:
+        raise InvalidProfileDataException(f"头像大小必须在1到{max_bytes}字节之间")
+    
+    key = f'{_avatar_upload_prefix(user_id)}{uuid.uuid4().hex}{AVATAR_CONTENT_TYPES[content_type]}'
+    storage = UserProfile._meta.get_field('avatar').storage
+    
+    if size <= settings.AVATAR_MULTIPART_THRESHOLD:
+        presigned_post = storage.generate_presigned_post(key, content_type, max_bytes)
+        return {
+            'method': 'post',
+            'key': key,
+            'url': presigned_post['url'],
+            'fields': presigned_post['fields']
+        }
+    
+    part_size = settings.AVATAR_MULTIPART_PART_SIZE
+    upload_id, part_urls = storage.create_multipart_upload(key, content_type, math.ceil(size / part_size))
+    return {
+        'method': 'multipart',
+        'key': key,
+        'upload_id': upload_id,
+        'part_size': part_size,
+        'parts': [{'part_number': part_number, 'url': url} for part_number, url in part_urls]
+    }
+
+
+def complete_avatar_upload(user_id: int, key: str, upload_id: Optional[str] = None, parts=None):
+    """
+    浏览器直传完成后的回调：合并分片（如有），校验对象后关联到用户简介
+    简介保存后会自动提交头像处理任务
+    """
+    if not key.startswith(_avatar_upload_prefix(user_id)):
+        raise InvalidProfileDataException("头像对象不属于该用户")
+    
+    storage = UserProfile._meta.get_field('avatar').storage
+    
+    if upload_id:
+        if not parts:
+            raise InvalidProfileDataException("缺少分片信息")
+        try:
+            storage.complete_multipart_upload(key, upload_id, parts)
+        except ClientError as e:
+            # 合并失败的分片上传不会再被使用，放弃它以释放已上传的分片
+            abort_avatar_upload(user_id, key, upload_id)
+            raise InvalidProfileDataException(f"合并分片失败: {str(e)}")
+    
+    metadata = storage.head(key)
+    if metadata is None:
+        raise InvalidProfileDataException("头像尚未上传")
+    if metadata.get('ContentLength', 0) > settings.AVATAR_MAX_SOURCE_BYTES:
+        storage.delete(key)
+        raise InvalidProfileDataException("头像大小超过上限")
+    
+    user, profile, created = get_or_create_user_profile(user_id)
+    profile.avatar = key
+    profile.save()
+    return profile
+
+
+def abort_avatar_upload(user_id: int, key: str, upload_id: str):
+    """
+    放弃未完成的头像分片上传（合并失败或浏览器放弃直传时），释放已上传的分片
+    """
+    if not key.startswith(_avatar_upload_prefix(user_id)):
+        raise InvalidProfileDataException("头像对象不属于该用户")
+    
+    storage = UserProfile._meta.get_field('avatar').storage
+    try:
+        storage.abort_multipart_upload(key, upload_id)
+    except ClientError as e:
+        # 残留的分片由bucket的生命周期规则清理（见 setup_rustfs_bucket）
+        print(f"放弃分片上传 {upload_id} 失败: {str(e)}")
\ No newline at end of file
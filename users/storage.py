@@ -1,9 +1,176 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
 import boto3
 from botocore.client import Config
+from botocore.exceptions import ClientError
 from django.conf import settings
 from storages.backends.s3boto3 import S3Boto3Storage
 
 
+class PresignedURLCache:
+    """
+    进程内的预签名URL缓存
+    以 (bucket, 对象key, 有效期) 为键，在URL过期前的刷新窗口内重复使用同一个URL，
+    避免每次访问都重新计算SigV4签名
+    """
+    def __init__(self, max_size=10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_many(self, keys, now=None):
+        """
+        批量查询缓存，返回仍然有效的 {key: url}
+        """
+        now = time.monotonic() if now is None else now
+        found = {}
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                url, refresh_at = entry
+                if refresh_at <= now:
+                    # 即将过期，丢弃并重新签名
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = url
+        return found
+
+    def set_many(self, items, refresh_at):
+        """
+        批量写入缓存，items为 {key: url}
+        """
+        with self._lock:
+            for key, url in items.items():
+                self._entries[key] = (url, refresh_at)
+                self._entries.move_to_end(key)
+            if len(self._entries) > self.max_size:
+                self._evict(time.monotonic())
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _evict(self, now):
+        # 先清理已到刷新时间的条目，仍超出容量时再按最近最少使用淘汰
+        expired = [key for key, (_, refresh_at) in self._entries.items() if refresh_at <= now]
+        for key in expired:
+            del self._entries[key]
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+presigned_url_cache = PresignedURLCache(
+    max_size=getattr(settings, 'RUSTFS_PRESIGNED_URL_CACHE_SIZE', 10000)
+)
+
+
+class S3ClientRegistry:
+    """
+    进程级的S3客户端注册表
+    相同配置的存储共用一个boto3 client及其连接池，复用到RustFS的TCP/TLS连接。
+    boto3的client是线程安全的而resource不是，因此每个线程基于共享的client创建轻量的resource。
+    fork出的子进程（如Celery prefork池）不能继续使用父进程的连接，检测到进程变化时重新初始化
+    """
+    def __init__(self):
+        self._pid = None
+        self._ensure_process()
+
+    def client(self, endpoint_url, access_key, secret_key, region_name, verify=None,
+               addressing_style='path', signature_version='s3v4'):
+        """
+        获取指定配置对应的共享client
+        """
+        return self._get(
+            endpoint_url, access_key, secret_key, region_name, verify, addressing_style, signature_version
+        )[0]
+
+    def resource(self, endpoint_url, access_key, secret_key, region_name, verify=None,
+                 addressing_style='path', signature_version='s3v4'):
+        """
+        获取当前线程使用的resource，底层使用共享的client
+        """
+        key = (endpoint_url, access_key, secret_key, region_name, verify, addressing_style, signature_version)
+        client, resource_class = self._get(*key)
+        resources = self._local.__dict__.setdefault('resources', {})
+        resource = resources.get(key)
+        if resource is None:
+            resource = resources[key] = resource_class(client=client)
+        return resource
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            self._local = threading.local()
+
+    def _get(self, *key):
+        self._ensure_process()
+        entry = self._entries.get(key)
+        if entry is None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is None:
+                    entry = self._entries[key] = self._create(*key)
+        return entry
+
+    def _create(self, endpoint_url, access_key, secret_key, region_name, verify,
+                addressing_style, signature_version):
+        # boto3的Session不是线程安全的，只在持有锁时创建client
+        resource = boto3.session.Session().resource(
+            's3',
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            region_name=region_name,
+            verify=verify,
+            config=Config(
+                s3={'addressing_style': addressing_style},
+                signature_version=signature_version,
+                max_pool_connections=getattr(settings, 'RUSTFS_MAX_POOL_CONNECTIONS', 50),
+                tcp_keepalive=getattr(settings, 'RUSTFS_TCP_KEEPALIVE', True),
+                connect_timeout=getattr(settings, 'RUSTFS_CONNECT_TIMEOUT', 5),
+                read_timeout=getattr(settings, 'RUSTFS_READ_TIMEOUT', 30),
+                retries={
+                    'total_max_attempts': getattr(settings, 'RUSTFS_MAX_ATTEMPTS', 3),
+                    'mode': getattr(settings, 'RUSTFS_RETRY_MODE', 'standard'),
+                },
+            )
+        )
+        return resource.meta.client, type(resource)
+
+    def _ensure_process(self):
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        self._pid = pid
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._local = threading.local()
+
+
+s3_clients = S3ClientRegistry()
+
+
+def get_rustfs_client():
+    """
+    获取按settings中RustFS配置创建的共享client
+    """
+    return s3_clients.client(
+        endpoint_url=getattr(settings, 'RUSTFS_ENDPOINT_URL', 'http://rustfs:9000'),
+        access_key=getattr(settings, 'RUSTFS_ACCESS_KEY', 'rustfsadmin'),
+        secret_key=getattr(settings, 'RUSTFS_SECRET_KEY', 'rustfsadmin123'),
+        region_name=getattr(settings, 'RUSTFS_REGION_NAME', 'us-east-1'),
+        verify=getattr(settings, 'AWS_S3_VERIFY', None),
+        addressing_style=getattr(settings, 'AWS_S3_ADDRESSING_STYLE', 'path'),
+        signature_version=getattr(settings, 'AWS_S3_SIGNATURE_VERSION', 's3v4'),
+    )
+
+
 class RustFSStorage(S3Boto3Storage):
     """
     自定义存储后端，用于连接RustFS对象存储服务
@@ -15,6 +182,8 @@ class RustFSStorage(S3Boto3Storage):
         self.endpoint_url = getattr(settings, 'RUSTFS_ENDPOINT_URL', 'http://rustfs:9000')
         self.bucket_name = getattr(settings, 'RUSTFS_BUCKET_NAME', 'user-avatars')
         self.region_name = getattr(settings, 'RUSTFS_REGION_NAME', 'us-east-1')
+        self.presigned_url_expire = getattr(settings, 'RUSTFS_PRESIGNED_URL_EXPIRE', 3600)
+        self.presigned_url_refresh_margin = getattr(settings, 'RUSTFS_PRESIGNED_URL_REFRESH_MARGIN', 300)
         
         # 调用父类构造函数
         super().__init__(
@@ -28,11 +197,139 @@ class RustFSStorage(S3Boto3Storage):
             addressing_style='path'
         )
 
+    @property
+    def connection(self):
+        """
+        使用进程内共享的client，而不是每个存储实例、每个线程各自创建session和连接池
+        """
+        return s3_clients.resource(
+            endpoint_url=self.endpoint_url,
+            access_key=self.access_key,
+            secret_key=self.secret_key,
+            region_name=self.region_name,
+            verify=self.verify,
+            addressing_style=self.addressing_style,
+            signature_version=self.signature_version,
+        )
+
+    @property
+    def bucket(self):
+        # Bucket对象很轻量，每次基于当前进程、当前线程的resource创建，避免fork后沿用父进程的连接
+        return self.connection.Bucket(self.bucket_name)
+
     def url(self, name):
         """
-        重写url方法，直接返回预签名URL
+        重写url方法，直接返回预签名URL（优先使用缓存）
+        """
+        return self.urls_for([name]).get(name)
+
+    def urls_for(self, names, expire=None):
+        """
+        批量获取预签名URL，返回 {name: url}
+        已缓存且未临近过期的URL直接复用，其余的一次性签名后写入缓存
+        """
+        expire = expire or self.presigned_url_expire
+        keys = {name: (self.bucket_name, name, expire) for name in names if name}
+        
+        cached = presigned_url_cache.get_many(keys.values())
+        urls = {name: cached[key] for name, key in keys.items() if key in cached}
+        
+        missing = [name for name in keys if name not in urls]
+        if not missing:
+            return urls
+        
+        # 签名完成后URL在 expire 秒内有效，提前 refresh_margin 秒刷新
+        refresh_at = time.monotonic() + max(expire - self.presigned_url_refresh_margin, 0)
+        signed = {}
+        for name in missing:
+            url = self.generate_presigned_url(name, expire=expire)
+            if url is not None:
+                signed[name] = url
+        
+        presigned_url_cache.set_many({keys[name]: url for name, url in signed.items()}, refresh_at)
+        urls.update(signed)
+        return urls
+
+    def generate_presigned_post(self, name, content_type, max_bytes, expire=None):
+        """
+        生成预签名POST表单，浏览器可直接把文件上传到RustFS
+        返回 {'url': 表单地址, 'fields': 表单字段}
         """
-        return self.generate_presigned_url(name, expire=3600)
+        s3_client = self.connection.meta.client
+        return s3_client.generate_presigned_post(
+            Bucket=self.bucket_name,
+            Key=name,
+            Fields={'Content-Type': content_type},
+            Conditions=[
+                {'Content-Type': content_type},
+                ['content-length-range', 1, max_bytes],
+            ],
+            ExpiresIn=expire or self.presigned_url_expire
+        )
+
+    def create_multipart_upload(self, name, content_type, part_count, expire=None):
+        """
+        创建分片上传并为每个分片生成预签名的PUT地址，浏览器可并行上传各分片
+        返回 (upload_id, [(分片编号, url)])
+        """
+        s3_client = self.connection.meta.client
+        expire = expire or self.presigned_url_expire
+        upload_id = s3_client.create_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=name,
+            ContentType=content_type
+        )['UploadId']
+        part_urls = [
+            (part_number, s3_client.generate_presigned_url(
+                'upload_part',
+                Params={
+                    'Bucket': self.bucket_name,
+                    'Key': name,
+                    'UploadId': upload_id,
+                    'PartNumber': part_number
+                },
+                ExpiresIn=expire,
+                HttpMethod='PUT'
+            ))
+            for part_number in range(1, part_count + 1)
+        ]
+        return upload_id, part_urls
+
+    def complete_multipart_upload(self, name, upload_id, parts):
+        """
+        合并已上传的分片，parts为 [(分片编号, ETag)]
+        """
+        s3_client = self.connection.meta.client
+        s3_client.complete_multipart_upload(
+            Bucket=self.bucket_name,
+            Key=name,
+            UploadId=upload_id,
+            MultipartUpload={
+                'Parts': [
+                    {'PartNumber': part_number, 'ETag': etag}
+                    for part_number, etag in sorted(parts)
+                ]
+            }
+        )
+
+    def abort_multipart_upload(self, name, upload_id):
+        """
+        放弃分片上传，释放已上传的分片
+        """
+        s3_client = self.connection.meta.client
+        s3_client.abort_multipart_upload(Bucket=self.bucket_name, Key=name, UploadId=upload_id)
+
+    def head(self, name):
+        """
+        获取对象的元数据，对象不存在时返回None
+        """
+        s3_client = self.connection.meta.client
+        try:
+            return s3_client.head_object(Bucket=self.bucket_name, Key=name)
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return None
+            raise
 
     def generate_presigned_url(self, name, expire=3600):
         """
@@ -49,4 +346,4 @@ class RustFSStorage(S3Boto3Storage):
             return response
         except Exception as e:
             print(f"生成预签名URL失败: {e}")
-            return None
\ No newline at end of file
+            return None
@@ -1,53 +1,246 @@
 from celery import shared_task
+from concurrent.futures import ThreadPoolExecutor
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from .models import UserProfile
-from PIL import Image
+from botocore.exceptions import BotoCoreError, ClientError
+from PIL import Image, UnidentifiedImageError
+from io import BytesIO
 import os
+import time
 from django.conf import settings
+from myproject.metrics import avatar_render_bytes, avatar_render_duration
 
 
-@shared_task
+class AvatarTooLargeError(Exception):
+    """头像文件超过允许处理的大小"""
+
+
+def _pending_key(user_id):
+    return f'users:avatar_renditions:pending:{user_id}'
+
+
+def enqueue_avatar_renditions(user_id):
+    """
+    提交头像处理任务
+    同一用户已有排队中的任务时不再重复提交；任务执行时总是读取最新的头像，
+    因此短时间内的多次上传只会处理一次
+    """
+    marked = False
+    try:
+        timeout = getattr(settings, 'AVATAR_RENDITION_DEDUPE_TIMEOUT', 600)
+        if not cache.add(_pending_key(user_id), 1, timeout=timeout):
+            return False
+        marked = True
+    except Exception as e:
+        # 缓存不可用时不去重，直接提交
+        print(f"头像处理任务去重失败: {e}")
+    
+    try:
+        generate_avatar_thumbnail.delay(user_id)
+    except Exception:
+        # 提交失败（如broker不可用）时清除排队标记，否则之后的上传在标记过期前都会被当作重复而跳过
+        if marked:
+            try:
+                cache.delete(_pending_key(user_id))
+            except Exception as e:
+                print(f"清除头像处理任务标记失败: {e}")
+        raise
+    return True
+
+
+def read_avatar_bytes(field_file, max_bytes):
+    """
+    从对象存储中把头像读取到内存，超过max_bytes时放弃读取
+    """
+    storage = field_file.storage
+    s3_client = storage.connection.meta.client
+    response = s3_client.get_object(Bucket=storage.bucket_name, Key=field_file.name)
+    body = response['Body']
+    try:
+        if response.get('ContentLength', 0) > max_bytes:
+            raise AvatarTooLargeError(f"头像大小 {response['ContentLength']} 字节超过上限 {max_bytes} 字节")
+        data = body.read(max_bytes + 1)
+        if len(data) > max_bytes:
+            raise AvatarTooLargeError(f"头像大小超过上限 {max_bytes} 字节")
+        return data
+    finally:
+        body.close()
+
+
+# 各格式对应的文件扩展名
+IMAGE_EXTENSIONS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+
+def _encode_image(image, image_format):
+    """
+    按指定格式编码图片，必要时转换颜色模式
+    """
+    if image_format == 'JPEG' and image.mode != 'RGB':
+        image = image.convert('RGB')
+    elif image_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    
+    buffer = BytesIO()
+    image.save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+def render_renditions(data, sizes, formats):
+    """
+    只解码一次原图，由大到小逐级缩放生成所有尺寸和格式的版本
+    返回 (原图格式, [(尺寸, 格式, 图片数据)])
+    formats中的'original'表示与原图相同的格式
+    """
+    image = Image.open(BytesIO(data))
+    # 解码前检查像素数，限制单个任务的内存占用
+    max_pixels = getattr(settings, 'AVATAR_MAX_SOURCE_PIXELS', 40000000)
+    if image.width * image.height > max_pixels:
+        raise AvatarTooLargeError(f"头像尺寸 {image.width}x{image.height} 超过上限 {max_pixels} 像素")
+    source_format = image.format or 'PNG'
+    sizes = sorted(set(sizes), reverse=True)
+    if source_format == 'JPEG':
+        # JPEG在解码时直接按比例缩小到接近最大尺寸
+        image.draft('RGB', (sizes[0], sizes[0]))
+    
+    output_formats = []
+    for image_format in formats:
+        image_format = source_format if image_format == 'original' else image_format.upper()
+        if image_format not in output_formats:
+            output_formats.append(image_format)
+    
+    renditions = []
+    for size in sizes:
+        # 在上一级结果的基础上继续缩小
+        image.thumbnail((size, size))
+        for image_format in output_formats:
+            renditions.append((size, image_format, _encode_image(image, image_format)))
+    return source_format, renditions
+
+
+def upload_renditions(storage, items, max_workers):
+    """
+    并行上传多个版本，items为 [(对象key, 图片数据, 格式)]
+    boto3的client是线程安全的，多个线程共用同一个client
+    """
+    s3_client = storage.connection.meta.client
+    
+    def upload(item):
+        key, data, image_format = item
+        s3_client.put_object(
+            Bucket=storage.bucket_name,
+            Key=key,
+            Body=data,
+            ContentType=Image.MIME.get(image_format, 'application/octet-stream')
+        )
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(items)))) as executor:
+        # list()确保任何一个上传失败时异常都会抛出
+        list(executor.map(upload, items))
+
+
+def delete_renditions(storage, keys):
+    """
+    删除不再使用的旧版本
+    """
+    if keys:
+        storage.connection.meta.client.delete_objects(
+            Bucket=storage.bucket_name,
+            Delete={'Objects': [{'Key': key} for key in keys], 'Quiet': True}
+        )
+
+
+@shared_task(
+    acks_late=True,
+    reject_on_worker_lost=True,
+    # RustFS暂时不可用时按指数退避重试；其余异常（数据库、超时等）让任务失败，不会被当作已完成
+    autoretry_for=(BotoCoreError, ClientError),
+    retry_backoff=True,
+    retry_jitter=True,
+    max_retries=getattr(settings, 'AVATAR_RENDITION_MAX_RETRIES', 5),
+    soft_time_limit=getattr(settings, 'AVATAR_RENDITION_SOFT_TIME_LIMIT', 60),
+    time_limit=getattr(settings, 'AVATAR_RENDITION_TIME_LIMIT', 90),
+)
 def generate_avatar_thumbnail(user_id):
     """
-    生成用户头像缩略图的异步任务
+    生成用户头像多尺寸、多格式版本的异步任务
+    头像从RustFS读取到内存中只解码一次，所有版本并行上传，不使用本地磁盘
+    任务路由到images队列，任务完成后才确认消息，worker异常退出时任务会重新投递
     """
+    # 清除排队标记，执行期间的新上传会重新提交任务
+    try:
+        cache.delete(_pending_key(user_id))
+    except Exception as e:
+        print(f"清除头像处理任务标记失败: {e}")
+    
     try:
         user_profile = UserProfile.objects.get(user_id=user_id)
-        
-        if not user_profile.avatar:
-            print(f"用户 {user_id} 没有上传头像")
-            return False
-            
-        # 打开原始头像图像
-        avatar_path = user_profile.avatar.path
-        
-        # 生成缩略图
-        image = Image.open(avatar_path)
-        image.thumbnail((150, 150))  # 创建150x150像素的缩略图
-        
-        # 准备缩略图路径
-        avatar_dir, avatar_filename = os.path.split(avatar_path)
-        name, ext = os.path.splitext(avatar_filename)
-        thumbnail_filename = f"{name}_thumbnail{ext}"
-        thumbnail_path = os.path.join(avatar_dir, "thumbnails", thumbnail_filename)
-        
-        # 确保缩略图目录存在
-        thumbnail_dir = os.path.dirname(thumbnail_path)
-        os.makedirs(thumbnail_dir, exist_ok=True)
-        
-        # 保存缩略图
-        image.save(thumbnail_path)
-        
-        # 更新用户简介中的缩略图字段
-        user_profile.thumbnail.name = os.path.join('avatars/thumbnails', thumbnail_filename)
-        user_profile.save()
-        
-        print(f"成功为用户 {user_id} 生成头像缩略图")
-        return True
-        
     except UserProfile.DoesNotExist:
         print(f"用户简介 {user_id} 不存在")
         return False
-    except Exception as e:
-        print(f"生成头像缩略图时出错: {str(e)}")
-        return False
\ No newline at end of file
+    
+    if not user_profile.avatar:
+        print(f"用户 {user_id} 没有上传头像")
+        return False
+    
+    storage = user_profile.avatar.storage
+    
+    try:
+        # 读取原始头像
+        data = read_avatar_bytes(
+            user_profile.avatar,
+            getattr(settings, 'AVATAR_MAX_SOURCE_BYTES', 10 * 1024 * 1024)
+        )
+        
+        # 生成所有版本
+        render_started_at = time.perf_counter()
+        try:
+            source_format, rendered = render_renditions(
+                data,
+                getattr(settings, 'AVATAR_RENDITION_SIZES', (512, 150, 48)),
+                getattr(settings, 'AVATAR_RENDITION_FORMATS', ('original', 'WEBP'))
+            )
+        except (UnidentifiedImageError, OSError) as e:
+            # 文件不是可以解码的图片，重试也不会成功
+            print(f"用户 {user_id} 的头像无法解码: {e}")
+            return False
+    except AvatarTooLargeError as e:
+        print(f"用户 {user_id} 的头像过大，跳过处理: {e}")
+        return False
+    
+    avatar_render_duration.record(time.perf_counter() - render_started_at, {'image.format': source_format})
+    avatar_render_bytes.record(len(data), {'image.format': source_format, 'avatar.rendition': 'source'})
+    for size, image_format, image_data in rendered:
+        avatar_render_bytes.record(len(image_data), {'image.format': image_format, 'avatar.rendition': str(size)})
+    
+    # 版本的key由头像文件名决定，重复生成时直接覆盖
+    name = os.path.splitext(os.path.basename(user_profile.avatar.name))[0]
+    renditions = {}
+    uploads = []
+    for size, image_format, image_data in rendered:
+        key = f"avatars/renditions/{user_id}/{name}_{size}.{IMAGE_EXTENSIONS.get(image_format, image_format.lower())}"
+        renditions.setdefault(str(size), {})[image_format.lower()] = key
+        uploads.append((key, image_data, image_format))
+    
+    upload_renditions(storage, uploads, getattr(settings, 'AVATAR_RENDITION_UPLOAD_WORKERS', 4))
+    
+    old_keys = {
+        key
+        for formats in (user_profile.renditions or {}).values()
+        for key in formats.values()
+    }
+    
+    # 缩略图字段指向与原图同格式的对应尺寸版本
+    thumbnail_size = str(getattr(settings, 'AVATAR_THUMBNAIL_SIZE', 150))
+    thumbnail_key = renditions.get(thumbnail_size, {}).get(source_format.lower())
+    if thumbnail_key:
+        user_profile.thumbnail.name = thumbnail_key
+    user_profile.renditions = renditions
+    
+    # 只会写入变化的thumbnail和renditions列
+    user_profile.save()
+    
+    delete_renditions(storage, sorted(old_keys - set(key for key, _, _ in uploads)))
+    
+    print(f"成功为用户 {user_id} 生成 {len(uploads)} 个头像版本")
+    return True
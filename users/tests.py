@@ -1,3 +1,722 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from botocore.exceptions import ClientError
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from myproject.celery import app as celery_app
+from PIL import Image
+
+from .cache import _get_version, _lock_key, _payload_key, get_cached_user, invalidate_user_cache
+from .exceptions import UserNotFoundException
+from . import services
+from .models import UserProfile
+from .pydantic_schemas import UserSchema, dump_user_json, dump_user_page_json
+from .services import _rendition_keys
+from .storage import PresignedURLCache, RustFSStorage, S3ClientRegistry, presigned_url_cache
+from .tasks import (
+    AvatarTooLargeError, enqueue_avatar_renditions, generate_avatar_thumbnail, read_avatar_bytes, render_renditions
+)
+
+
+def _create_users(count, prefix='user'):
+    return [
+        User.objects.create_user(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', password='secret')
+        for index in range(count)
+    ]
+
+
+class UserListPaginationTests(TestCase):
+    """
+    用户列表的游标分页和流式输出
+    """
+
+    def setUp(self):
+        self.users = _create_users(5)
+
+    def test_pages_follow_cursor_until_exhausted(self):
+        ids, after = [], None
+        while True:
+            url = '/api/users/?limit=2' + (f'&after={after}' if after else '')
+            data = self.client.get(url).json()
+            ids.extend(user['id'] for user in data['results'])
+            after = data['next']
+            if after is None:
+                break
+        self.assertEqual(ids, [user.id for user in self.users])
+
+    def test_invalid_limit_is_rejected(self):
+        response = self.client.get('/api/users/?limit=abc')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ndjson_stream_returns_every_user(self):
+        response = self.client.get('/api/users/?stream=ndjson&chunk_size=2')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        self.assertEqual([json.loads(line)['username'] for line in lines], [user.username for user in self.users])
+
+    def test_json_stream_is_a_valid_array(self):
+        response = self.client.get('/api/users/?stream=json&chunk_size=2')
+        data = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(data), len(self.users))
+
+    def test_stream_queries_are_counted_in_request_metrics(self):
+        with mock.patch('myproject.metrics.db_queries_per_request') as queries_metric:
+            response = self.client.get('/api/users/?stream=ndjson&chunk_size=2')
+            queries_metric.record.assert_not_called()
+            b''.join(response.streaming_content)
+        # 5个用户每页2个，共3次查询，全部在中间件返回之后执行
+        queries_metric.record.assert_called_once_with(3, {'http.route': 'api/users/'})
+
+    @override_settings(DATABASE_REPLICA_WEIGHTS={'replica1': 1})
+    def test_stream_keeps_sticky_primary_routing(self):
+        # replica1 并不存在，读取被路由到副本时会报错；带有主库cookie的请求流式读取时也必须使用主库
+        self.client.cookies['db_primary'] = '1'
+        response = self.client.get('/api/users/?stream=ndjson&chunk_size=2')
+        self.assertEqual(len(b''.join(response.streaming_content).splitlines()), len(self.users))
+
+    @override_settings(QUERY_PROFILER_ENABLED=True, QUERY_PROFILER_SAMPLE_RATIO=1.0)
+    def test_stream_queries_are_profiled_on_a_child_span(self):
+        with mock.patch('myproject.middleware.tracer') as tracer:
+            response = self.client.get('/api/users/?stream=ndjson&chunk_size=2')
+            b''.join(response.streaming_content)
+        self.assertNotIn('Server-Timing', response)
+        span = tracer.start_span.return_value
+        self.assertEqual(span.set_attributes.call_args[0][0]['db.query_count'], 3)
+        span.end.assert_called_once_with()
+
+
+class PresignedURLCacheTests(TestCase):
+    """
+    预签名URL缓存与批量签名
+    """
+
+    def setUp(self):
+        presigned_url_cache.clear()
+        self.addCleanup(presigned_url_cache.clear)
+
+    def test_entries_are_dropped_at_refresh_time(self):
+        cache = PresignedURLCache(max_size=10)
+        cache.set_many({'a': 'url-a'}, refresh_at=100.0)
+        self.assertEqual(cache.get_many(['a'], now=99.0), {'a': 'url-a'})
+        self.assertEqual(cache.get_many(['a'], now=100.0), {})
+        self.assertEqual(cache.get_many(['a'], now=99.0), {})
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = PresignedURLCache(max_size=2)
+        cache.set_many({'a': 'url-a', 'b': 'url-b'}, refresh_at=float('inf'))
+        cache.get_many(['a'])
+        cache.set_many({'c': 'url-c'}, refresh_at=float('inf'))
+        self.assertEqual(cache.get_many(['a', 'b', 'c']), {'a': 'url-a', 'c': 'url-c'})
+
+    def test_urls_for_signs_only_cache_misses(self):
+        storage = RustFSStorage()
+        with mock.patch.object(RustFSStorage, 'generate_presigned_url', side_effect=lambda name, expire: f'signed:{name}') as sign:
+            self.assertEqual(storage.urls_for(['a.png', 'b.png']), {'a.png': 'signed:a.png', 'b.png': 'signed:b.png'})
+            self.assertEqual(storage.urls_for(['a.png', 'c.png', '']), {'a.png': 'signed:a.png', 'c.png': 'signed:c.png'})
+        self.assertEqual([call[0][0] for call in sign.call_args_list], ['a.png', 'b.png', 'c.png'])
+
+    def test_user_list_signs_each_field_once_per_page(self):
+        for user in _create_users(3):
+            UserProfile.objects.filter(user=user).update(avatar=f'avatars/{user.id}.png', thumbnail=f'thumbnails/{user.id}.png')
+        with mock.patch.object(RustFSStorage, 'urls_for', autospec=True, side_effect=lambda self, names: {name: f'signed:{name}' for name in names}) as urls_for:
+            users = self.client.get('/api/users/').json()
+        self.assertEqual(urls_for.call_count, 2)
+        self.assertTrue(all(user['userprofile']['avatar'].startswith('signed:avatars/') for user in users))
+
+
+class UserProfileDirtyFieldsTests(TestCase):
+    """
+    UserProfile保存时只写入变化的列
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.profile = UserProfile.objects.get(user=self.user)
+
+    def test_save_without_changes_runs_no_query(self):
+        with self.assertNumQueries(0):
+            self.profile.save()
+
+    def test_save_updates_only_changed_columns(self):
+        self.profile.bio = 'hello'
+        with CaptureQueriesContext(connection) as queries:
+            self.profile.save()
+        self.assertEqual(len(queries), 1)
+        self.assertIn('"bio"', queries[0]['sql'])
+        self.assertNotIn('"location"', queries[0]['sql'])
+        self.assertEqual(self.profile.get_dirty_fields(), [])
+
+    def test_in_place_change_of_json_field_is_detected(self):
+        self.profile.renditions = {'64': {'webp': 'a.webp'}}
+        self.profile.save()
+        self.profile.renditions['64']['png'] = 'a.png'
+        self.assertEqual(self.profile.get_dirty_fields(), ['renditions'])
+
+    def test_user_save_does_not_load_profile(self):
+        user = User.objects.get(pk=self.user.pk)
+        user.first_name = 'Alice'
+        with self.assertNumQueries(1):
+            user.save(update_fields=['first_name'])
+
+    def test_avatar_change_enqueues_renditions_once(self):
+        with mock.patch('users.signals.enqueue_avatar_renditions') as enqueue, \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            self.profile.avatar = 'avatars/alice.png'
+            self.profile.save()
+            self.profile.bio = 'no avatar change'
+            self.profile.save()
+        enqueue.assert_called_once_with(self.user.pk)
+
+
+class UserCacheTests(TestCase):
+    """
+    用户详情的读穿透缓存
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_hit_does_not_call_loader(self):
+        loader = mock.Mock(return_value={'id': 1})
+        self.assertEqual(get_cached_user(1, loader), {'id': 1})
+        self.assertEqual(get_cached_user(1, loader), {'id': 1})
+        loader.assert_called_once_with()
+
+    def test_invalidation_bumps_version(self):
+        get_cached_user(1, lambda: {'name': 'old'})
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            invalidate_user_cache(1)
+        self.assertEqual(get_cached_user(1, lambda: {'name': 'new'}), {'name': 'new'})
+
+    def test_not_found_result_is_cached_briefly(self):
+        loader = mock.Mock(side_effect=UserNotFoundException('用户ID 1 不存在'))
+        for _ in range(2):
+            with self.assertRaises(UserNotFoundException) as raised:
+                get_cached_user(1, loader)
+            self.assertEqual(raised.exception.detail, '用户ID 1 不存在')
+        loader.assert_called_once_with()
+
+    def test_waiter_stops_waiting_when_loader_fails(self):
+        # 另一个请求持有锁，加载失败后释放锁且没有写入缓存
+        lock_key = _lock_key(1, _get_version(1))
+        cache.add(lock_key, 1)
+        timer = threading.Timer(0.1, cache.delete, [lock_key])
+        timer.start()
+        self.addCleanup(timer.cancel)
+
+        start = time.monotonic()
+        self.assertEqual(get_cached_user(1, lambda: {'id': 1}), {'id': 1})
+        self.assertLess(time.monotonic() - start, 1)
+
+    def test_waiter_receives_payload_written_by_lock_holder(self):
+        version = _get_version(1)
+        cache.add(_lock_key(1, version), 1)
+        threading.Timer(0.1, cache.set, [_payload_key(1, version), ({'id': 1}, time.time() + 60)]).start()
+        loader = mock.Mock()
+        self.assertEqual(get_cached_user(1, loader), {'id': 1})
+        loader.assert_not_called()
+
+    def test_detail_view_serves_cached_user(self):
+        user = User.objects.create_user(username='alice', password='secret')
+        self.client.get(f'/api/users/{user.pk}/')
+        with self.assertNumQueries(0):
+            response = self.client.get(f'/api/users/{user.pk}/')
+        self.assertEqual(response.json()['username'], 'alice')
+
+    def test_detail_view_caches_missing_user(self):
+        self.assertEqual(self.client.get('/api/users/999/').status_code, 404)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get('/api/users/999/').status_code, 404)
+
+
+class TrustedSerialisationTests(TestCase):
+    """
+    数据库中读出的数据不经Pydantic校验直接序列化
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='alice', email='alice@example.com', password='secret')
+
+    def test_dump_matches_validated_schema(self):
+        user_dict = services.get_user_with_profile(self.user.pk)
+        self.assertEqual(
+            json.loads(dump_user_json(user_dict)),
+            json.loads(UserSchema.model_validate(user_dict).model_dump_json())
+        )
+
+    def test_stored_data_is_not_revalidated(self):
+        # 历史数据中不合法的邮箱不会导致列表接口报错
+        User.objects.filter(pk=self.user.pk).update(email='not-an-email')
+        response = self.client.get('/api/users/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['email'], 'not-an-email')
+
+    def test_page_payload_has_results_and_cursor(self):
+        data = json.loads(dump_user_page_json([services.get_user_with_profile(self.user.pk)], 7))
+        self.assertEqual((len(data['results']), data['next']), (1, 7))
+
+    def test_profile_put_returns_the_get_payload(self):
+        url = f'/api/users/{self.user.pk}/profile/'
+        put = self.client.put(url, json.dumps({'bio': 'hello'}), content_type='application/json')
+        self.assertEqual(put.status_code, 200)
+        get = self.client.get(url).json()
+        self.assertEqual(put.json(), {key: value for key, value in get.items() if key in put.json()})
+        self.assertEqual(put.json()['bio'], 'hello')
+
+    def test_request_bodies_are_still_validated(self):
+        response = self.client.post(
+            '/api/users/', json.dumps({'username': 'bob', 'email': 'bad', 'password': 'x'}),
+            content_type='application/json'
+        )
+        self.assertGreaterEqual(response.status_code, 400)
+        self.assertFalse(User.objects.filter(username='bob').exists())
+
+
+class UserJoinProjectionTests(TestCase):
+    """
+    用户与资料通过一次LEFT JOIN查询取出
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.users = _create_users(3)
+
+    def test_list_runs_a_single_query(self):
+        with self.assertNumQueries(1):
+            users = services.get_all_users_with_profiles()
+        self.assertEqual([user['userprofile']['user_id'] for user in users], [user.id for user in self.users])
+
+    def test_page_runs_a_single_query(self):
+        with self.assertNumQueries(1):
+            users, next_cursor = services.get_users_page(limit=2)
+        self.assertEqual((len(users), next_cursor), (2, self.users[1].id))
+
+    def test_user_without_profile_has_null_profile(self):
+        UserProfile.objects.filter(user=self.users[0]).delete()
+        user = services.get_user_with_profile(self.users[0].pk)
+        self.assertIsNone(user['userprofile'])
+
+
+class FakeS3Client:
+    """
+    在内存中保存对象的S3 client，只实现头像任务用到的方法
+    """
+
+    def __init__(self, objects=None):
+        self.objects = dict(objects or {})
+
+    def get_object(self, Bucket, Key):
+        data = self.objects[Key]
+        return {'ContentLength': len(data), 'Body': BytesIO(data)}
+
+    def put_object(self, Bucket, Key, Body, ContentType):
+        self.objects[Key] = Body
+
+    def delete_objects(self, Bucket, Delete):
+        for item in Delete['Objects']:
+            self.objects.pop(item['Key'], None)
+
+
+def _image_bytes(size=(800, 600), image_format='JPEG'):
+    buffer = BytesIO()
+    Image.new('RGB', size, (200, 30, 30)).save(buffer, format=image_format)
+    return buffer.getvalue()
+
+
+class AvatarThumbnailTaskTests(TestCase):
+    """
+    头像任务在内存中读取原图并把缩略图写回RustFS
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        UserProfile.objects.filter(user=self.user).update(avatar='avatars/alice.jpg')
+        self.s3 = FakeS3Client({'avatars/alice.jpg': _image_bytes()})
+        connection_patcher = mock.patch.object(RustFSStorage, 'connection', new_callable=mock.PropertyMock)
+        connection_patcher.start().return_value.meta.client = self.s3
+        self.addCleanup(connection_patcher.stop)
+
+    def test_oversized_source_is_refused_before_reading(self):
+        field_file = UserProfile.objects.get(user=self.user).avatar
+        with self.assertRaises(AvatarTooLargeError):
+            read_avatar_bytes(field_file, max_bytes=10)
+
+    def test_thumbnail_is_uploaded_without_local_files(self):
+        with mock.patch('builtins.open', side_effect=AssertionError('不应写入本地文件')):
+            self.assertTrue(generate_avatar_thumbnail(self.user.pk))
+        profile = UserProfile.objects.get(user=self.user)
+        thumbnail = Image.open(BytesIO(self.s3.objects[profile.thumbnail.name]))
+        self.assertEqual(max(thumbnail.size), 150)
+
+    def test_profile_without_avatar_is_skipped(self):
+        UserProfile.objects.filter(user=self.user).update(avatar='')
+        self.assertFalse(generate_avatar_thumbnail(self.user.pk))
+
+    def test_undecodable_avatar_is_skipped(self):
+        self.s3.objects['avatars/alice.jpg'] = b'not an image'
+        self.assertFalse(generate_avatar_thumbnail(self.user.pk))
+
+    def test_storage_errors_are_not_swallowed(self):
+        # 返回False会让acks_late的消息被确认为已完成；存储错误必须抛出，由Celery重试
+        error = ClientError({'Error': {'Code': 'SlowDown', 'Message': 'Please reduce your request rate'}}, 'PutObject')
+        with mock.patch.object(self.s3, 'put_object', side_effect=error):
+            with self.assertRaises(ClientError):
+                generate_avatar_thumbnail(self.user.pk)
+        self.assertIn(ClientError, generate_avatar_thumbnail.autoretry_for)
+
+
+class AvatarRenditionTests(TestCase):
+    """
+    一次解码生成全部尺寸和格式的头像版本
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='alice', password='secret')
+        UserProfile.objects.filter(user=self.user).update(avatar='avatars/alice.jpg')
+        self.s3 = FakeS3Client({'avatars/alice.jpg': _image_bytes()})
+        connection_patcher = mock.patch.object(RustFSStorage, 'connection', new_callable=mock.PropertyMock)
+        connection_patcher.start().return_value.meta.client = self.s3
+        self.addCleanup(connection_patcher.stop)
+
+    def test_render_produces_every_size_and_format(self):
+        source_format, rendered = render_renditions(_image_bytes(), (48, 512, 150), ('original', 'WEBP', 'jpeg'))
+        self.assertEqual(source_format, 'JPEG')
+        self.assertEqual(
+            [(size, image_format) for size, image_format, _ in rendered],
+            [(512, 'JPEG'), (512, 'WEBP'), (150, 'JPEG'), (150, 'WEBP'), (48, 'JPEG'), (48, 'WEBP')]
+        )
+        for size, image_format, data in rendered:
+            image = Image.open(BytesIO(data))
+            self.assertEqual((image.format, max(image.size)), (image_format, size))
+
+    @override_settings(AVATAR_MAX_SOURCE_PIXELS=100)
+    def test_source_over_pixel_limit_is_refused(self):
+        with self.assertRaises(AvatarTooLargeError):
+            render_renditions(_image_bytes(), (48,), ('original',))
+
+    def test_task_records_renditions_and_points_thumbnail_at_one(self):
+        generate_avatar_thumbnail(self.user.pk)
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(sorted(profile.renditions), ['150', '48', '512'])
+        self.assertEqual(profile.thumbnail.name, profile.renditions['150']['jpeg'])
+        for formats in profile.renditions.values():
+            self.assertEqual(sorted(formats), ['jpeg', 'webp'])
+            self.assertTrue(all(key in self.s3.objects for key in formats.values()))
+
+    def test_renditions_of_previous_avatar_are_deleted(self):
+        generate_avatar_thumbnail(self.user.pk)
+        old_keys = set(_rendition_keys(UserProfile.objects.get(user=self.user).renditions))
+
+        self.s3.objects['avatars/alice2.png'] = _image_bytes(image_format='PNG')
+        UserProfile.objects.filter(user=self.user).update(avatar='avatars/alice2.png')
+        generate_avatar_thumbnail(self.user.pk)
+
+        new_keys = set(_rendition_keys(UserProfile.objects.get(user=self.user).renditions))
+        self.assertFalse(old_keys & set(self.s3.objects))
+        self.assertTrue(new_keys <= set(self.s3.objects))
+
+    def test_api_payload_carries_signed_rendition_urls(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        generate_avatar_thumbnail(self.user.pk)
+        with mock.patch.object(RustFSStorage, 'urls_for', autospec=True, side_effect=lambda self, names: {name: f'signed:{name}' for name in names}):
+            profile = self.client.get(f'/api/users/{self.user.pk}/').json()['userprofile']
+        self.assertTrue(profile['renditions']['48']['webp'].startswith('signed:avatars/renditions/'))
+
+
+class MigrationStateTests(TestCase):
+
+    def test_models_match_migrations(self):
+        # 模型与迁移不一致时 makemigrations --check 以非零状态退出
+        call_command('makemigrations', 'users', check=True, dry_run=True, stdout=StringIO())
+
+
+class AvatarQueueTests(TestCase):
+    """
+    头像任务进入独立的images队列，同一用户排队中的任务不重复提交
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_avatar_task_is_routed_to_images_queue(self):
+        route = celery_app.amqp.router.route({}, generate_avatar_thumbnail.name)
+        self.assertEqual(route['queue'].name, 'images')
+        self.assertTrue(generate_avatar_thumbnail.acks_late)
+        self.assertTrue(generate_avatar_thumbnail.reject_on_worker_lost)
+
+    def test_pending_job_is_not_enqueued_twice(self):
+        with mock.patch.object(generate_avatar_thumbnail, 'delay') as delay:
+            self.assertTrue(enqueue_avatar_renditions(1))
+            self.assertFalse(enqueue_avatar_renditions(1))
+            self.assertTrue(enqueue_avatar_renditions(2))
+        self.assertEqual(delay.call_args_list, [mock.call(1), mock.call(2)])
+
+    def test_failed_publish_clears_pending_marker(self):
+        with mock.patch.object(generate_avatar_thumbnail, 'delay', side_effect=[ConnectionError('broker down'), None]) as delay:
+            with self.assertRaises(ConnectionError):
+                enqueue_avatar_renditions(1)
+            self.assertTrue(enqueue_avatar_renditions(1))
+        self.assertEqual(delay.call_count, 2)
+
+    def test_running_job_clears_pending_marker(self):
+        with mock.patch.object(generate_avatar_thumbnail, 'delay') as delay:
+            enqueue_avatar_renditions(1)
+            generate_avatar_thumbnail(1)
+            enqueue_avatar_renditions(1)
+        self.assertEqual(delay.call_count, 2)
+
+
+class AvatarDirectUploadTests(TestCase):
+    """
+    浏览器直传头像到RustFS及上传完成后的回调
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.user = User.objects.create_user(username='alice', password='secret')
+        self.upload_url = f'/api/users/{self.user.pk}/avatar/uploads/'
+        self.complete_url = f'/api/users/{self.user.pk}/avatar/uploads/complete/'
+
+    def _post(self, url, data):
+        return self.client.post(url, json.dumps(data), content_type='application/json')
+
+    def test_small_file_gets_a_presigned_post(self):
+        response = self._post(self.upload_url, {'content_type': 'image/png', 'size': 1024})
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual(data['method'], 'post')
+        self.assertTrue(data['key'].startswith(f'avatars/uploads/{self.user.pk}/'))
+        self.assertEqual(data['fields']['Content-Type'], 'image/png')
+
+    @override_settings(AVATAR_MULTIPART_THRESHOLD=100, AVATAR_MULTIPART_PART_SIZE=40)
+    def test_large_file_gets_multipart_part_urls(self):
+        with mock.patch.object(RustFSStorage, 'create_multipart_upload', autospec=True,
+                               side_effect=lambda self, key, content_type, part_count: ('upload-1', [(n, f'url{n}') for n in range(1, part_count + 1)])):
+            data = self._post(self.upload_url, {'content_type': 'image/jpeg', 'size': 101}).json()
+        self.assertEqual((data['method'], data['upload_id']), ('multipart', 'upload-1'))
+        self.assertEqual([part['part_number'] for part in data['parts']], [1, 2, 3])
+
+    def test_unsupported_type_and_size_are_rejected(self):
+        self.assertEqual(self._post(self.upload_url, {'content_type': 'text/plain', 'size': 10}).status_code, 400)
+        self.assertEqual(self._post(self.upload_url, {'content_type': 'image/png', 'size': 0}).status_code, 400)
+
+    def test_completion_links_avatar_and_enqueues_rendering(self):
+        key = f'avatars/uploads/{self.user.pk}/a.png'
+        with mock.patch.object(RustFSStorage, 'head', return_value={'ContentLength': 100}), \
+                mock.patch('users.signals.enqueue_avatar_renditions') as enqueue, \
+                mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            response = self._post(self.complete_url, {'key': key})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(UserProfile.objects.get(user=self.user).avatar.name, key)
+        enqueue.assert_called_once_with(self.user.pk)
+
+    def test_completion_rejects_other_users_objects(self):
+        response = self._post(self.complete_url, {'key': 'avatars/uploads/999/a.png'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_completion_rejects_missing_and_oversized_objects(self):
+        key = f'avatars/uploads/{self.user.pk}/a.png'
+        with mock.patch.object(RustFSStorage, 'head', return_value=None):
+            self.assertEqual(self._post(self.complete_url, {'key': key}).status_code, 400)
+        with mock.patch.object(RustFSStorage, 'head', return_value={'ContentLength': 10 ** 9}), \
+                mock.patch.object(RustFSStorage, 'delete') as delete:
+            self.assertEqual(self._post(self.complete_url, {'key': key}).status_code, 400)
+        delete.assert_called_once_with(key)
+        self.assertFalse(UserProfile.objects.get(user=self.user).avatar)
+
+    def test_failed_multipart_completion_aborts_the_upload(self):
+        key = f'avatars/uploads/{self.user.pk}/a.png'
+        error = ClientError({'Error': {'Code': 'InvalidPart', 'Message': 'One or more of the specified parts could not be found'}},
+                            'CompleteMultipartUpload')
+        with mock.patch.object(RustFSStorage, 'complete_multipart_upload', side_effect=error), \
+                mock.patch.object(RustFSStorage, 'abort_multipart_upload') as abort:
+            response = self._post(self.complete_url, {'key': key, 'upload_id': 'upload-1',
+                                                      'parts': [{'part_number': 1, 'etag': 'x'}]})
+        self.assertEqual(response.status_code, 400)
+        abort.assert_called_once_with(key, 'upload-1')
+
+    def test_client_can_abort_its_own_upload(self):
+        abort_url = f'/api/users/{self.user.pk}/avatar/uploads/abort/'
+        key = f'avatars/uploads/{self.user.pk}/a.png'
+        with mock.patch.object(RustFSStorage, 'abort_multipart_upload') as abort:
+            self.assertEqual(self._post(abort_url, {'key': key, 'upload_id': 'upload-1'}).status_code, 204)
+            self.assertEqual(self._post(abort_url, {'key': 'avatars/uploads/999/a.png', 'upload_id': 'upload-2'}).status_code, 400)
+        abort.assert_called_once_with(key, 'upload-1')
+
+
+class S3ClientRegistryTests(TestCase):
+    """
+    进程内共享的boto3 client
+    """
+
+    def setUp(self):
+        self.registry = S3ClientRegistry()
+        self.config = dict(endpoint_url='http://rustfs:9000', access_key='a', secret_key='b', region_name='us-east-1')
+
+    def test_same_config_shares_one_client(self):
+        self.assertIs(self.registry.client(**self.config), self.registry.client(**self.config))
+        other = self.registry.client(**{**self.config, 'access_key': 'c'})
+        self.assertIsNot(other, self.registry.client(**self.config))
+
+    def test_each_thread_gets_a_resource_on_the_shared_client(self):
+        resources = []
+        thread = threading.Thread(target=lambda: resources.append(self.registry.resource(**self.config)))
+        thread.start()
+        thread.join()
+        resources.append(self.registry.resource(**self.config))
+        self.assertIsNot(resources[0], resources[1])
+        self.assertIs(resources[0].meta.client, resources[1].meta.client)
+        self.assertIs(resources[1], self.registry.resource(**self.config))
+
+    def test_forked_process_creates_new_clients(self):
+        client = self.registry.client(**self.config)
+        with mock.patch('users.storage.os.getpid', return_value=os.getpid() + 1):
+            self.assertIsNot(self.registry.client(**self.config), client)
+
+    def test_storages_share_the_registry_client(self):
+        self.assertIs(RustFSStorage().connection.meta.client, RustFSStorage().connection.meta.client)
+
+
+class UserImportExportTests(TestCase):
+    """
+    import_users / export_users 批量导入导出
+    """
+
+    def _write(self, name, content):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        path = os.path.join(directory.name, name)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def _import(self, path, **options):
+        out, err = StringIO(), StringIO()
+        call_command('import_users', path, workers=1, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_rows_are_created_and_invalid_rows_skipped(self):
+        User.objects.create_user(username='taken')
+        path = self._write('users.csv', (
+            'username,email,password,bio,birth_date\n'
+            'alice,alice@example.com,secret,hello,1990-01-02\n'
+            'taken,,,,\n'
+            'bob,not-an-email,,,\n'
+            'alice,,,,\n'
+            'carol,,,,\n'
+        ))
+        out, err = self._import(path, batch_size=2)
+
+        self.assertIn('导入 2 个用户，跳过 3 行', out)
+        for line_no in (3, 4, 5):
+            self.assertIn(f'第 {line_no} 行已跳过', err)
+        alice = User.objects.get(username='alice')
+        self.assertTrue(alice.check_password('secret'))
+        self.assertEqual((alice.userprofile.bio, str(alice.userprofile.birth_date)), ('hello', '1990-01-02'))
+        self.assertFalse(User.objects.get(username='carol').has_usable_password())
+
+    def test_dry_run_writes_nothing(self):
+        path = self._write('users.ndjson', '{"username": "alice"}\nnot json\n')
+        out, err = self._import(path, dry_run=True)
+        self.assertIn('校验通过 1 个用户，跳过 1 行', out)
+        self.assertIn('无法解析', err)
+        self.assertFalse(User.objects.exists())
+
+    def test_export_round_trips_through_import(self):
+        for fmt in ('csv', 'ndjson'):
+            with self.subTest(fmt=fmt):
+                user = User.objects.create_user(username='alice', email='alice@example.com', password='secret')
+                UserProfile.objects.filter(user=user).update(bio='你好', location='上海')
+                path = self._write(f'users.{fmt}', '')
+                call_command('export_users', output=path, batch_size=1, stdout=StringIO())
+
+                User.objects.all().delete()
+                self._import(path)
+                alice = User.objects.get(username='alice')
+                # 密码以哈希形式迁移
+                self.assertTrue(alice.check_password('secret'))
+                self.assertEqual((alice.email, alice.userprofile.bio, alice.userprofile.location),
+                                 ('alice@example.com', '你好', '上海'))
+                User.objects.all().delete()
+
+
+class UserBatchTests(TestCase):
+    """
+    批量接口按条目顺序检查，在一个事务中执行
+    """
+
+    def setUp(self):
+        self.alice, self.bob = _create_users(2, prefix='batch')
+
+    def _post(self, operations):
+        response = self.client.post('/api/users/batch/', json.dumps(operations), content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()['results']
+
+    def test_mixed_operations_are_applied(self):
+        results = self._post([
+            {'op': 'create', 'data': {'username': 'carol', 'password': 'secret'}},
+            {'op': 'update', 'id': self.alice.pk, 'data': {'first_name': 'Alice'}},
+            {'op': 'delete', 'id': self.bob.pk},
+            {'op': 'update', 'id': 999999, 'data': {}},
+            {'op': 'create', 'data': {'username': 'batch0', 'password': 'secret'}},
+        ])
+        self.assertEqual([result['status'] for result in results], ['ok', 'ok', 'ok', 'error', 'error'])
+        self.assertEqual(User.objects.get(pk=self.alice.pk).first_name, 'Alice')
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['batch0', 'carol'])
+
+    def test_deleted_username_can_be_reused_later_in_the_batch(self):
+        results = self._post([
+            {'op': 'delete', 'id': self.alice.pk},
+            {'op': 'create', 'data': {'username': 'batch0', 'password': 'secret'}},
+            {'op': 'update', 'id': self.bob.pk, 'data': {'email': 'batch0@example.com'}},
+        ])
+        self.assertEqual([result['status'] for result in results], ['ok', 'ok', 'ok'])
+        self.assertNotEqual(User.objects.get(username='batch0').pk, self.alice.pk)
+
+    def test_username_is_still_taken_before_the_delete(self):
+        results = self._post([
+            {'op': 'create', 'data': {'username': 'batch0', 'password': 'secret'}},
+            {'op': 'delete', 'id': self.alice.pk},
+        ])
+        self.assertEqual([result['status'] for result in results], ['error', 'ok'])
+        self.assertEqual(results[0]['error']['error_code'], 'USER_002')
+        self.assertFalse(User.objects.filter(username='batch0').exists())
+
+    def test_created_user_is_not_hidden_by_cached_not_found(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        next_id = self.bob.pk + 1
+        self.assertEqual(self.client.get(f'/api/users/{next_id}/').status_code, 404)
+        with mock.patch('django.db.transaction.on_commit', side_effect=lambda func: func()):
+            results = self._post([{'op': 'create', 'data': {'username': 'carol', 'password': 'secret'}}])
+        self.assertEqual(results[0]['id'], next_id)
+        response = self.client.get(f'/api/users/{next_id}/')
+        self.assertEqual(response.status_code, 200)
+
+    def test_failed_operation_does_not_reserve_the_user(self):
+        results = self._post([
+            {'op': 'update', 'id': self.alice.pk, 'data': {'username': 'batch1'}},
+            {'op': 'update', 'id': self.alice.pk, 'data': {'first_name': 'Alice'}},
+            {'op': 'delete', 'id': self.alice.pk},
+        ])
+        self.assertEqual([result['status'] for result in results], ['error', 'ok', 'error'])
+        self.assertIn('重复出现', results[2]['error']['detail'])
+        self.assertEqual(User.objects.get(pk=self.alice.pk).first_name, 'Alice')
@@ -3,6 +3,10 @@ from . import views
 
 urlpatterns = [
     path('users/', views.UserListView.as_view(), name='user-list'),
+    path('users/batch/', views.UserBatchView.as_view(), name='user-batch'),
     path('users/<int:pk>/', views.UserDetailView.as_view(), name='user-detail'),
     path('users/<int:user_id>/profile/', views.UserProfileView.as_view(), name='user-profile-detail'),
+    path('users/<int:user_id>/avatar/uploads/', views.UserAvatarUploadView.as_view(), name='user-avatar-upload'),
+    path('users/<int:user_id>/avatar/uploads/complete/', views.UserAvatarUploadCompleteView.as_view(), name='user-avatar-upload-complete'),
+    path('users/<int:user_id>/avatar/uploads/abort/', views.UserAvatarUploadAbortView.as_view(), name='user-avatar-upload-abort'),
 ]
\ No newline at end of file
@@ -43,8 +43,10 @@ class UserSchema(BaseModel):
         from_attributes = True
 
 
+from django.conf import settings
 from django.contrib.auth.models import User
-from django.http import JsonResponse
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.utils.decorators import method_decorator
 from django.views.decorators.http import require_http_methods
@@ -52,29 +54,123 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from myproject.aio import AsyncView, run_sync
 from .models import UserProfile
-from .pydantic_schemas import UserSchema, UserCreate, UserUpdate, UserProfileSchema
+from .pydantic_schemas import (
+    UserSchema, UserCreate, UserUpdate, UserProfileSchema, AvatarUploadRequest, AvatarUploadComplete, AvatarUploadAbort,
+    construct_profile, dump_user_json, dump_users_json, dump_user_page_json
+)
+from .exceptions import ValidationErrorException
 from . import services
 from pydantic import ValidationError
 import json
 
 
+def _json_bytes_response(content, status=200):
+    """
+    直接返回已经序列化好的JSON字节串
+    """
+    return HttpResponse(content, content_type='application/json', status=status)
+
+
+def _parse_int_param(params, name, default=None, minimum=0, maximum=None):
+    """
+    解析查询参数中的整数值，超出上限时截断为上限
+    """
+    raw_value = params.get(name)
+    if raw_value in (None, ''):
+        return default
+    try:
+        value = int(raw_value)
+    except (TypeError, ValueError):
+        raise ValidationErrorException(f"参数 '{name}' 必须是整数")
+    if value < minimum:
+        raise ValidationErrorException(f"参数 '{name}' 不能小于 {minimum}")
+    if maximum is not None:
+        value = min(value, maximum)
+    return value
+
+
 class UserListView(APIView):
     """
     获取用户列表或创建新用户
+    
+    支持以下查询参数：
+    - limit/after: 基于用户ID的游标分页，响应中的next为下一页的after值
+    - stream=ndjson|json: 流式输出全部用户，chunk_size控制每次查询的行数
     """
     permission_classes = []
 
     def get(self, request):
+        params = request.query_params
+        
+        if params.get('stream'):
+            return self._stream_users(params)
+        
+        if 'limit' in params or 'after' in params:
+            return self._get_users_page(params)
+        
         users_data = services.get_all_users_with_profiles()
         
-        # 使用Pydantic验证数据
-        validated_users = []
-        for user_dict in users_data:
-            validated_user = UserSchema(**user_dict)
-            validated_users.append(validated_user.model_dump())
+        # 数据来自数据库，无需再次校验，直接序列化
+        return _json_bytes_response(dump_users_json(users_data))
+    
+    def _get_users_page(self, params):
+        """
+        游标分页模式
+        """
+        limit = _parse_int_param(
+            params, 'limit',
+            default=settings.USER_LIST_PAGE_SIZE,
+            minimum=1,
+            maximum=settings.USER_LIST_MAX_PAGE_SIZE
+        )
+        after = _parse_int_param(params, 'after')
+        
+        users_data, next_cursor = services.get_users_page(limit=limit, after=after)
+        return _json_bytes_response(dump_user_page_json(users_data, next_cursor))
+    
+    def _stream_users(self, params):
+        """
+        流式输出模式，内存占用与用户总数无关
+        """
+        stream_format = params.get('stream')
+        if stream_format not in ('ndjson', 'json'):
+            raise ValidationErrorException("参数 'stream' 只能是 'ndjson' 或 'json'")
+        
+        chunk_size = _parse_int_param(
+            params, 'chunk_size',
+            default=settings.USER_LIST_STREAM_CHUNK_SIZE,
+            minimum=1,
+            maximum=settings.USER_LIST_STREAM_CHUNK_SIZE
+        )
+        
+        rows = (
+            dump_user_json(user_dict)
+            for user_dict in services.iter_users_with_profiles(chunk_size=chunk_size)
+        )
         
-        return JsonResponse(validated_users, safe=False)
+        if stream_format == 'ndjson':
+            content = (row + b'\n' for row in rows)
+            content_type = 'application/x-ndjson'
+        else:
+            content = self._json_array_chunks(rows)
+            content_type = 'application/json'
+        
+        response = StreamingHttpResponse(content, content_type=content_type)
+        # 关闭nginx的响应缓冲，让数据块尽快到达客户端
+        response['X-Accel-Buffering'] = 'no'
+        return response
+    
+    @staticmethod
+    def _json_array_chunks(rows):
+        """
+        将逐行JSON拼接为JSON数组的数据块
+        """
+        yield b'['
+        for index, row in enumerate(rows):
+            yield row if index == 0 else b',' + row
+        yield b']'
     
     def post(self, request):
         data = json.loads(request.body)
@@ -101,8 +197,82 @@ class UserListView(APIView):
             'userprofile': None
         }
         
-        validated_user = UserSchema(**user_dict)
-        return JsonResponse(validated_user.model_dump(), status=201)
+        return _json_bytes_response(dump_user_json(user_dict), status=201)
+
+
+def _validation_detail(error):
+    """
+    将Pydantic校验错误压缩为一行说明
+    """
+    return '; '.join(f"{'.'.join(map(str, item['loc']))}: {item['msg']}" for item in error.errors())
+
+
+def _parse_batch_operation(operation):
+    """
+    校验批量接口中的单个操作，返回交给服务层的操作字典
+    """
+    if not isinstance(operation, dict):
+        raise ValidationErrorException("每个操作必须是JSON对象")
+    
+    op = operation.get('op')
+    try:
+        if op == 'create':
+            # 与单个创建接口一致，不允许通过接口设置is_staff
+            data = UserCreate.model_validate(operation.get('data') or {}).model_dump(exclude={'is_staff'})
+            return {'op': op, 'data': data}
+        
+        if op not in ('update', 'delete'):
+            raise ValidationErrorException("op 只能是 'create'、'update' 或 'delete'")
+        user_id = operation.get('id')
+        if not isinstance(user_id, int) or isinstance(user_id, bool):
+            raise ValidationErrorException(f"{op} 操作需要整数类型的 id")
+        data = UserUpdate.model_validate(operation.get('data') or {}).model_dump() if op == 'update' else {}
+        return {'op': op, 'id': user_id, 'data': data}
+    except ValidationError as e:
+        raise ValidationErrorException(_validation_detail(e))
+
+
+class UserBatchView(APIView):
+    """
+    批量创建、更新和删除用户
+    
+    请求体为操作数组，例如：
+    [{"op": "create", "data": {...}}, {"op": "update", "id": 1, "data": {...}}, {"op": "delete", "id": 2}]
+    合法的操作在一个事务中批量执行，响应的results与请求的操作一一对应，
+    失败的条目带有与其他接口相同格式的错误信息，不影响其他条目
+    """
+    permission_classes = []
+
+    def post(self, request):
+        operations = json.loads(request.body)
+        if not isinstance(operations, list):
+            raise ValidationErrorException("请求体必须是操作数组")
+        max_operations = settings.USER_BATCH_MAX_OPERATIONS
+        if len(operations) > max_operations:
+            raise ValidationErrorException(f"单次最多 {max_operations} 个操作")
+        
+        results = [None] * len(operations)
+        valid_indexes, valid_operations = [], []
+        for index, operation in enumerate(operations):
+            try:
+                valid_operations.append(_parse_batch_operation(operation))
+                valid_indexes.append(index)
+            except ValidationErrorException as e:
+                results[index] = {'error': e}
+        
+        for index, result in zip(valid_indexes, services.apply_user_batch(valid_operations)):
+            results[index] = result
+        
+        response_data = []
+        for index, (operation, result) in enumerate(zip(operations, results)):
+            item = {'index': index, 'op': operation.get('op') if isinstance(operation, dict) else None}
+            if 'error' in result:
+                item.update(status='error', error=result['error'].to_dict())
+            else:
+                item.update(status='ok', id=result['id'])
+            response_data.append(item)
+        
+        return JsonResponse({'results': response_data})
 
 
 class UserDetailView(APIView):
@@ -113,8 +283,7 @@ class UserDetailView(APIView):
 
     def get(self, request, pk):
         user_data = services.get_user_with_profile(user_id=pk)
-        validated_user = UserSchema(**user_data)
-        return JsonResponse(validated_user.model_dump())
+        return _json_bytes_response(dump_user_json(user_data))
 
     def put(self, request, pk):
         data = json.loads(request.body)
@@ -132,9 +301,7 @@ class UserDetailView(APIView):
         
         # 获取更新后的用户数据
         user_data = services.get_user_with_profile(user_id=pk)
-        
-        validated_user = UserSchema(**user_data)
-        return JsonResponse(validated_user.model_dump())
+        return _json_bytes_response(dump_user_json(user_data))
             
     def delete(self, request, pk):
         success = services.delete_user(user_id=pk)
@@ -151,24 +318,17 @@ class UserProfileView(APIView):
     permission_classes = []  # 移除认证要求
 
     def get(self, request, user_id):
-        user, profile, created = services.get_or_create_user_profile(user_id=user_id)
-        
-        profile_dict = {
-            'id': profile.id,
-            'bio': profile.bio,
-            'phone_number': profile.phone_number,
-            'location': profile.location,
-            'birth_date': profile.birth_date,
-            'avatar': profile.avatar.url if profile.avatar else None,
-            'thumbnail': profile.thumbnail.url if profile.thumbnail else None,
-            'user_id': profile.user_id
-        }
+        user_data = services.get_user_with_profile(user_id=user_id)
+        if user_data['userprofile'] is None:
+            # 用户还没有简介时先创建
+            services.get_or_create_user_profile(user_id=user_id)
+            user_data = services.get_user_with_profile(user_id=user_id)
         
-        validated_profile = UserProfileSchema(**profile_dict)
+        profile = construct_profile(user_data['userprofile'])
         response_data = {
-            'user_id': user.id,
-            'username': user.username,
-            **validated_profile.model_dump()
+            'user_id': user_data['id'],
+            'username': user_data['username'],
+            **profile.model_dump()
         }
         return Response(response_data, status=status.HTTP_200_OK)
     
@@ -180,11 +340,129 @@ class UserProfileView(APIView):
                 profile_data[field] = request.data[field]
         
         # 调用服务层更新用户资料
-        profile = services.update_user_profile(
+        services.update_user_profile(
             user_id=user_id,
             profile_data=profile_data,
             files=request.FILES if hasattr(request, 'FILES') and request.FILES else None
         )
         
-        validated_profile = UserProfileSchema.from_orm(profile)
-        return Response(validated_profile.model_dump(), status=status.HTTP_200_OK)
\ No newline at end of file
+        # 返回与GET一致的资料数据（包含头像的访问URL）
+        user_data = services.get_user_with_profile(user_id=user_id)
+        return Response(construct_profile(user_data['userprofile']).model_dump(), status=status.HTTP_200_OK)
+
+
+class UserAvatarUploadAbortView(APIView):
+    """
+    浏览器放弃分片直传（如某个分片上传失败）时调用，释放已上传的分片
+    """
+    permission_classes = []
+
+    def post(self, request, user_id):
+        data = json.loads(request.body)
+        abort_request = AvatarUploadAbort(**data)
+        
+        services.abort_avatar_upload(
+            user_id=user_id,
+            key=abort_request.key,
+            upload_id=abort_request.upload_id
+        )
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class UserAvatarUploadView(APIView):
+    """
+    为浏览器直传头像到RustFS生成上传地址，文件内容不经过Django
+    """
+    permission_classes = []
+
+    def post(self, request, user_id):
+        data = json.loads(request.body)
+        upload_request = AvatarUploadRequest(**data)
+        
+        upload = services.create_avatar_upload(
+            user_id=user_id,
+            content_type=upload_request.content_type,
+            size=upload_request.size
+        )
+        return JsonResponse(upload, status=201)
+
+
+class UserAvatarUploadCompleteView(APIView):
+    """
+    浏览器直传完成后的回调，将上传的头像关联到用户简介
+    """
+    permission_classes = []
+
+    def post(self, request, user_id):
+        data = json.loads(request.body)
+        complete_request = AvatarUploadComplete(**data)
+        
+        services.complete_avatar_upload(
+            user_id=user_id,
+            key=complete_request.key,
+            upload_id=complete_request.upload_id,
+            parts=[(part.part_number, part.etag) for part in complete_request.parts or []]
+        )
+        
+        user_data = services.get_user_with_profile(user_id=user_id)
+        return Response(construct_profile(user_data['userprofile']).model_dump(), status=status.HTTP_200_OK)
+
+
+# 以下为在ASGI服务器中使用的异步版本（路由见 users/async_urls.py），
+# 阻塞的ORM、缓存和存储调用在线程池中执行；未实现的方法由上面的同步视图处理
+
+class AsyncUserListView(AsyncView):
+    """
+    UserListView的异步版本，流式输出仍由同步视图处理
+    """
+
+    def handles(self, request):
+        return request.method == 'GET' and not request.GET.get('stream')
+
+    async def get(self, request):
+        params = request.GET
+        
+        if 'limit' in params or 'after' in params:
+            limit = _parse_int_param(
+                params, 'limit',
+                default=settings.USER_LIST_PAGE_SIZE,
+                minimum=1,
+                maximum=settings.USER_LIST_MAX_PAGE_SIZE
+            )
+            after = _parse_int_param(params, 'after')
+            users_data, next_cursor = await services.async_get_users_page(limit=limit, after=after)
+            return _json_bytes_response(dump_user_page_json(users_data, next_cursor))
+        
+        users_data = await services.async_get_all_users_with_profiles()
+        return _json_bytes_response(dump_users_json(users_data))
+
+
+class AsyncUserDetailView(AsyncView):
+    """
+    UserDetailView的异步版本（GET）
+    """
+
+    async def get(self, request, pk):
+        user_data = await run_sync(services.get_user_with_profile, user_id=pk)
+        return _json_bytes_response(dump_user_json(user_data))
+
+
+class AsyncUserProfileView(AsyncView):
+    """
+    UserProfileView的异步版本（GET）
+    """
+
+    async def get(self, request, user_id):
+        user_data = await run_sync(services.get_user_with_profile, user_id=user_id)
+        if user_data['userprofile'] is None:
+            # 用户还没有简介时先创建
+            await run_sync(services.get_or_create_user_profile, user_id=user_id)
+            user_data = await run_sync(services.get_user_with_profile, user_id=user_id)
+        
+        profile = construct_profile(user_data['userprofile'])
+        response_data = {
+            'user_id': user_data['id'],
+            'username': user_data['username'],
+            **profile.model_dump()
+        }
+        return JsonResponse(response_data, encoder=DjangoJSONEncoder)